@@ -19,6 +19,7 @@ import logging
 import keystone.utils as utils
 from keystone.backends import models as models
 from keystone.backends import api as api
+from keystone.backends import cache
 
 DEFAULT_BACKENDS = 'keystone.backends.sqlalchemy'
 
@@ -36,3 +37,4 @@ def configure_backends(options):
         #Initialize common configs general to all backends.
         global KeyStoneAdminRole
         KeyStoneAdminRole = options["keystone-admin-role"]
+    cache.configure(options)
@@ -18,20 +18,32 @@
 import ast
 import logging
 
-from sqlalchemy import create_engine
 from sqlalchemy.orm import joinedload, aliased, sessionmaker
 
 from keystone.common import config
+from keystone.common import migration
+from keystone.common import sessions
+from keystone.common import shards
+from keystone.common import sqlengine
 from keystone.backends.alterdb import models
+from keystone.backends.alterdb import versions
 import keystone.utils as utils
 import keystone.backends.api as top_api
 import keystone.backends.models as top_models
 
 _ENGINE = None
 _MAKER = None
+# Engines of the listeners that have a pool of their own, by listener, and
+# their sessionmakers
+_LISTENER_ENGINES = {}
+_LISTENER_MAKERS = {}
+# ShardMap of the token shards as (session key, engine, sessionmaker); the
+# first shard is sql_connection itself, with the maker of get_session()
+_SHARDS = None
 BASE = models.Base
 MODEL_PREFIX = 'keystone.backends.alterdb.models.'
 API_PREFIX = 'keystone.backends.alterdb.api.'
+REPOSITORY = 'keystone.backends.alterdb'
 
 
 def configure_backend(options):
@@ -47,27 +59,90 @@ def configure_backend(options):
             options, 'debug', type='bool', default=False)
         verbose = config.get_option(
             options, 'verbose', type='bool', default=False)
-        timeout = config.get_option(
-            options, 'sql_idle_timeout', type='int', default=3600)
-        _ENGINE = create_engine(options['sql_connection'],
-                                pool_recycle=timeout)
+        _ENGINE = sqlengine.create_engine(REPOSITORY, options)
+        _LISTENER_ENGINES.update(
+            sqlengine.create_listener_engines(REPOSITORY, options))
         logger = logging.getLogger('sqlalchemy.engine')
         if debug:
             logger.setLevel(logging.DEBUG)
         elif verbose:
             logger.setLevel(logging.INFO)
+        configure_shards(options)
         register_models(options)
 
 
+def configure_shards(options):
+    """Set up the token shards listed in sql_shard_connections.
+
+    Tokens are spread over sql_connection and these databases by a hash of
+    their id. Without sql_shard_connections there is a single shard,
+    sql_connection.
+
+    :param options: Mapping of configuration options
+    """
+    global _SHARDS
+    assert _ENGINE
+    connections = ast.literal_eval(
+        options.get('sql_shard_connections') or '[]')
+    members = [(REPOSITORY, _ENGINE, None)]
+    for index, connection in enumerate(connections):
+        name = '%s.shard%s' % (REPOSITORY, index + 1)
+        shard_options = dict(options, sql_connection=connection)
+        engine = sqlengine.create_engine(name, shard_options)
+        members.append((name, engine,
+                        sessionmaker(bind=engine, autocommit=True,
+                                     expire_on_commit=False)))
+    _SHARDS = shards.ShardMap(members)
+
+
 def get_session(autocommit=True, expire_on_commit=False):
-    """Helper method to grab session"""
+    """Helper method to grab session
+
+    Inside a request scope this is the request's session, see
+    keystone.common.sessions. Requests of a listener that has a pool of its
+    own get their connections from that pool.
+    """
     global _MAKER, _ENGINE
+    listener = sessions.listener()
+    if listener in _LISTENER_ENGINES:
+        maker = _LISTENER_MAKERS.get(listener)
+        if maker is None:
+            maker = _LISTENER_MAKERS[listener] = sessionmaker(
+                bind=_LISTENER_ENGINES[listener], autocommit=autocommit,
+                expire_on_commit=expire_on_commit)
+        return sessions.get_session(REPOSITORY, maker)
     if not _MAKER:
         assert _ENGINE
         _MAKER = sessionmaker(bind=_ENGINE,
                               autocommit=autocommit,
                               expire_on_commit=expire_on_commit)
-    return _MAKER()
+    return sessions.get_session(REPOSITORY, _MAKER)
+
+
+def shard_count():
+    """Return the number of token shards"""
+    return _SHARDS and len(_SHARDS) or 1
+
+
+def shard_of(key):
+    """Return the index of the shard that holds key"""
+    if not _SHARDS or len(_SHARDS) == 1:
+        return 0
+    return _SHARDS.index(key)
+
+
+def get_shard_session(index):
+    """Return a session on the given shard, see get_session()"""
+    if index == 0:
+        return get_session()
+    name, _engine, maker = _SHARDS.shards[index]
+    return sessions.get_session(name, maker)
+
+
+def _shard_engines():
+    if not _SHARDS:
+        return [_ENGINE]
+    return [engine for _name, engine, _maker in _SHARDS]
 
 
 def register_models(options):
@@ -88,11 +163,35 @@ def register_models(options):
     for table in reversed(BASE.metadata.sorted_tables):
         if table in supported_alchemy_tables:
             creation_tables.append(table)
-    BASE.metadata.create_all(_ENGINE, tables=creation_tables, checkfirst=True)
+    for engine in _shard_engines():
+        fresh = not [table for table in creation_tables
+                     if table.exists(engine)]
+        BASE.metadata.create_all(engine, tables=creation_tables,
+                                 checkfirst=True)
+        migration.check_version(engine, REPOSITORY, versions.VERSIONS, fresh)
+
+
+def db_sync(version=None):
+    """Upgrade the schema of every shard to the given version, the latest
+    by default"""
+    global _ENGINE
+    assert _ENGINE
+    for engine in _shard_engines():
+        result = migration.db_sync(engine, REPOSITORY, versions.VERSIONS,
+                                   version)
+    return result
+
+
+def db_version():
+    """Return the schema version of the database"""
+    global _ENGINE
+    assert _ENGINE
+    return migration.db_version(_ENGINE, REPOSITORY)
 
 
 def unregister_models():
     """Unregister Models, useful clearing out data before testing"""
     global _ENGINE
     assert _ENGINE
-    BASE.metadata.drop_all(_ENGINE)
+    for engine in _shard_engines():
+        BASE.metadata.drop_all(engine)
@@ -15,49 +15,150 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.alterdb import get_session, models
+"""
+Token API of the alterdb backend
+
+Tokens live on the shard picked by a hash of their id (see
+keystone.backends.alterdb.configure_shards). Lookups by id go to that
+shard, and only try the others when the token is not there, e.g. before
+rebalance() has moved it after shards were added. Lookups by user ask every
+shard.
+"""
+
+import logging
+
+from keystone.backends import alterdb
+from keystone.backends.alterdb import models
 from keystone.backends.api import BaseTokenAPI
+from keystone.common import metrics
+from keystone.common import sqlengine
+
+logger = logging.getLogger('keystone.backends.alterdb.api.token')
+
+
+def _sessions(session):
+    """Sessions to search: the one given, or one per shard"""
+    if session:
+        return [session]
+    return [alterdb.get_shard_session(index)
+            for index in range(alterdb.shard_count())]
+
+
+def _query_many(session, ids):
+    """Tokens of a session among ids"""
+    token_refs = []
+    for chunk in sqlengine.in_chunks(ids):
+        token_refs.extend(session.query(models.Token).filter(
+            models.Token.id.in_(chunk)).all())
+    return token_refs
 
 
 class TokenAPI(BaseTokenAPI):
     def create(self, values):
         token_ref = models.Token()
         token_ref.update(values)
-        token_ref.save()
+        token_ref.save(alterdb.get_shard_session(
+            alterdb.shard_of(token_ref.id)))
         return token_ref
 
+    def _find(self, id, session=None):
+        """Return the token and the session it was found in"""
+        if session:
+            # query.get() answers repeated lookups from the identity map
+            return session.query(models.Token).get(id), session
+        home = alterdb.shard_of(id)
+        session = alterdb.get_shard_session(home)
+        token_ref = session.query(models.Token).get(id)
+        if token_ref is None and alterdb.shard_count() > 1:
+            metrics.increment('keystone.backends.alterdb.shard.misses')
+            for index in range(alterdb.shard_count()):
+                if index != home:
+                    session = alterdb.get_shard_session(index)
+                    token_ref = session.query(models.Token).get(id)
+                    if token_ref is not None:
+                        break
+        return token_ref, session
+
     def get(self, id, session=None):
-        if not session:
-            session = get_session()
-        result = session.query(models.Token).filter_by(id=id).first()
-        return result
-    
+        if id is None:
+            return None
+        return self._find(id, session)[0]
+
+    def get_many(self, ids, session=None):
+        if not ids:
+            return []
+        if session:
+            return _query_many(session, ids)
+        by_shard = {}
+        for id in ids:
+            by_shard.setdefault(alterdb.shard_of(id), []).append(id)
+        token_refs = []
+        for index, shard_ids in by_shard.items():
+            token_refs.extend(_query_many(
+                alterdb.get_shard_session(index), shard_ids))
+        missing = set(ids) - set(token_ref.id for token_ref in token_refs)
+        if missing and alterdb.shard_count() > 1:
+            metrics.increment('keystone.backends.alterdb.shard.misses')
+            for index in range(alterdb.shard_count()):
+                others = [id for id in missing
+                          if alterdb.shard_of(id) != index]
+                if others:
+                    token_refs.extend(_query_many(
+                        alterdb.get_shard_session(index), others))
+        return token_refs
+
     def delete(self, id, session=None):
-        if not session:
-            session = get_session()
-        with session.begin():
-            token_ref = self.get(id, session)
+        token_ref, session = self._find(id, session)
+        with session.begin(subtransactions=True):
             session.delete(token_ref)
-    
+
     def get_for_user(self, user_id, session=None):
-        if not session:
-            session = get_session()
-        result = session.query(models.Token).filter_by(
-            user_id=user_id, tenant_id=None).order_by("expires desc").first()
-        return result
-    
+        return self.get_for_user_by_tenant(user_id, None, session)
+
     def get_for_user_by_tenant(self, user_id, tenant_id, session=None):
-        if not session:
-            session = get_session()
-        result = session.query(models.Token).filter_by(
-            user_id=user_id, tenant_id=tenant_id).\
-                order_by("expires desc").first()
-        return result
-    
+        latest = None
+        for shard_session in _sessions(session):
+            result = shard_session.query(models.Token).filter_by(
+                user_id=user_id, tenant_id=tenant_id).\
+                    order_by("expires desc").first()
+            if result is not None and (latest is None or
+                                       result.expires > latest.expires):
+                latest = result
+        return latest
+
     def get_all(self, session=None):
-        if not session:
-            session = get_session()
-        return session.query(models.Token).all()
+        token_refs = []
+        for shard_session in _sessions(session):
+            token_refs.extend(shard_session.query(models.Token).all())
+        return token_refs
+
+    def rebalance(self):
+        """Move every token to the shard its id maps to.
+
+        Run after changing sql_shard_connections. Each token is copied to
+        its new shard before it is removed from the old one, so it can be
+        found throughout.
+
+        :returns: the number of tokens moved
+        """
+        moved = 0
+        for index in range(alterdb.shard_count()):
+            source = alterdb.get_shard_session(index)
+            for token_ref in source.query(models.Token).all():
+                target_index = alterdb.shard_of(token_ref.id)
+                if target_index == index:
+                    continue
+                target = alterdb.get_shard_session(target_index)
+                with target.begin(subtransactions=True):
+                    copy = models.Token()
+                    copy.update(dict(token_ref))
+                    target.merge(copy)
+                with source.begin(subtransactions=True):
+                    source.delete(token_ref)
+                moved += 1
+        logger.info("Moved %s tokens between %s shards" %
+                    (moved, alterdb.shard_count()))
+        return moved
 
 
 def get():
@@ -14,7 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # Not Yet PEP8 standardized
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, String, DateTime, Index
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import object_mapper
@@ -81,4 +81,6 @@ class Token(Base, KeystoneBase):
     user_id = Column(String(255))
     tenant_id = Column(String(255))
     expires = Column(DateTime)
+    __table_args__ = (Index('ix_token_user_id_tenant_id',
+                            'user_id', 'tenant_id'), {})
 
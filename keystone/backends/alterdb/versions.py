@@ -0,0 +1,29 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Schema versions of the alterdb backend, oldest first"""
+
+from keystone.common import migration
+
+
+def _add_token_index(connection):
+    """Index tokens by the user and tenant they are looked up by"""
+    migration.create_index(connection, 'token', 'ix_token_user_id_tenant_id',
+                           'user_id', 'tenant_id')
+
+
+VERSIONS = [(1, _add_token_index)]
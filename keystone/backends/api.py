@@ -32,6 +32,9 @@ class BaseUserAPI(object):
     def get(self, id):
         raise NotImplementedError
 
+    def get_many(self, ids):
+        raise NotImplementedError
+
     def get_page(self, marker, limit):
         raise NotImplementedError
 
@@ -100,6 +103,9 @@ class BaseTokenAPI(object):
     def get(self, id):
         raise NotImplementedError
 
+    def get_many(self, ids):
+        raise NotImplementedError
+
     def delete(self, id):
         raise NotImplementedError
 
@@ -143,6 +149,9 @@ class BaseTenantAPI(object):
     def get(self, id):
         raise NotImplementedError
 
+    def get_many(self, ids):
+        raise NotImplementedError
+
     def get_all(self):
         raise NotImplementedError
 
@@ -196,6 +205,9 @@ class BaseRoleAPI(object):
     def ref_get_all_tenant_roles(self, user_id, tenant_id):
         raise NotImplementedError
 
+    def ref_get_all_for_users(self, user_ids, tenant_ids):
+        raise NotImplementedError
+
     def ref_get(self, id):
         raise NotImplementedError
 
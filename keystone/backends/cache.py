@@ -0,0 +1,163 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Read-through cache in front of the backend APIs
+
+When enabled, every API registered in keystone.backends.api except the
+token API is wrapped in a CachingAPI. For the entities listed in the
+entity_cache option, results of get() and get_by_*() are kept in an LRU
+cache for entity_cache_ttl seconds.
+
+Results of one entity depend on the rows of others (users are found by
+tenant through their role grants, for instance), so a write through any
+wrapped API empties the caches of all entities. Writes are rare next to
+reads. Reads made after a write in the same request bypass the caches, and
+the caches are emptied again once the request's transaction is over, so that
+reads racing the commit cannot leave stale entries behind.
+
+Changes made by other processes are seen once entries time out.
+
+SQLAlchemy results are cached as detached copies of their columns, as the
+instances themselves expire when the session they were loaded in rolls back.
+"""
+
+import ast
+import logging
+import re
+
+from keystone.backends import api as top_api
+from keystone.common import lru
+from keystone.common import sessions
+
+logger = logging.getLogger('keystone.backends.cache')
+
+# APIs that are wrapped, by their name in keystone.backends.api. Tokens are
+# written on every authentication and would keep emptying the caches.
+ENTITIES = ('endpoint_template', 'group', 'role', 'tenant', 'tenant_group',
+            'user')
+
+CACHED_METHOD = re.compile(r'^get(_by_\w+)?$')
+WRITE_METHOD = re.compile(r'(^|_)(create|update|delete|add|remove)(_|$)|'
+                          r'^tenant_group$')
+
+# Lookup caches by entity
+_CACHES = {}
+
+
+def invalidate_all():
+    """Empty the caches of every entity"""
+    for cache in _CACHES.values():
+        cache.clear()
+
+
+def _snapshot(value):
+    """Return a copy of a lookup result that outlives its session"""
+    if isinstance(value, list):
+        return [_snapshot(item) for item in value]
+    # Declarative SQLAlchemy models; this module can not import sqlalchemy
+    # as the name resolves to keystone.backends.sqlalchemy here
+    mapper = getattr(value, '__mapper__', None)
+    if mapper is None:
+        return value
+    copy = value.__class__()
+    for column in mapper.columns:
+        setattr(copy, column.key, getattr(value, column.key))
+    return copy
+
+
+class CachingAPI(object):
+    """Wraps a backend API, caching its lookups"""
+
+    def __init__(self, name, api, cache=None):
+        """
+        :param name: name of the API in keystone.backends.api
+        :param api: the backend's API object
+        :param cache: LRUCache for the lookups, None to only watch writes
+        """
+        self.name = name
+        self.api = api
+        self.cache = cache
+
+    def __getattr__(self, attr):
+        method = getattr(self.api, attr)
+        if not callable(method):
+            return method
+        if WRITE_METHOD.search(attr):
+            return self._write(method)
+        if self.cache is not None and CACHED_METHOD.match(attr):
+            return self._cached(attr, method)
+        return method
+
+    def _write(self, method):
+        def write(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                invalidate_all()
+                sessions.mark_written()
+                sessions.on_end(invalidate_all)
+        return write
+
+    def _cached(self, attr, method):
+        def cached(*args, **kwargs):
+            if sessions.written():
+                return method(*args, **kwargs)
+            key = (attr, args, tuple(sorted(kwargs.items())))
+            try:
+                value = self.cache.get(key)
+            except TypeError:
+                # Unhashable arguments
+                return method(*args, **kwargs)
+            if value is lru.MISSING:
+                value = _snapshot(method(*args, **kwargs))
+                self.cache.put(key, value)
+            return value
+        return cached
+
+
+def configure(options):
+    """Wrap the backend APIs according to the entity_cache options.
+
+    Backends register fresh API objects each time they are configured, and
+    those are wrapped anew; APIs that are already wrapped are kept as is.
+
+    :param options: Mapping of configuration options
+    """
+    entities = ast.literal_eval(options.get('entity_cache') or '[]')
+    unknown = set(entities) - set(ENTITIES)
+    if unknown:
+        raise ValueError("entity_cache can not cache %s" %
+                         ', '.join(sorted(unknown)))
+    if not entities:
+        return
+    size = int(options.get('entity_cache_size', 1000))
+    ttl = float(options.get('entity_cache_ttl', 60))
+    for name in ENTITIES:
+        api = getattr(top_api, name)
+        if isinstance(api, CachingAPI):
+            continue
+        cache = None
+        if name in entities:
+            cache = _CACHES.get(name)
+            if cache is None:
+                cache = _CACHES[name] = lru.LRUCache('entity_cache.%s' % name)
+            cache.size, cache.ttl = size, ttl
+            # Entries of the API this one replaces
+            cache.clear()
+        top_api.set_value(name, CachingAPI(name, api, cache))
+    logger.debug("Caching lookups of %s" % ', '.join(entities))
@@ -0,0 +1,74 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Key-value backend
+
+Stores tokens in memcache, where they expire by themselves, so that token
+writes never reach the relational database. Enable it with
+
+    backends = keystone.backends.sqlalchemy,keystone.backends.kvs
+
+    [keystone.backends.kvs]
+    memcache_servers = 10.0.0.1:11211,10.0.0.2:11211
+    backend_entities = ['Token']
+
+memcache_servers = fake://tokens uses an in-process fake server instead.
+"""
+
+import ast
+
+from keystone.backends.kvs import client
+from keystone.common import config
+import keystone.utils as utils
+import keystone.backends.api as top_api
+import keystone.backends.models as top_models
+
+_CLIENT = None
+MODEL_PREFIX = 'keystone.backends.kvs.models.'
+API_PREFIX = 'keystone.backends.kvs.api.'
+
+
+def configure_backend(options):
+    """Create the memcache client if needed, and register the models.
+
+    :param options: Mapping of configuration options
+    """
+    global _CLIENT
+    if not _CLIENT:
+        servers = [server.strip() for server in
+                   options['memcache_servers'].split(',') if server.strip()]
+        _CLIENT = client.Client(
+            servers,
+            pool_size=config.get_option(options, 'memcache_pool_size',
+                                        type='int', default=10),
+            timeout=config.get_option(options, 'memcache_socket_timeout',
+                                      type='float', default=3))
+    entities = ast.literal_eval(options.get("backend_entities", "['Token']"))
+    for entity in entities:
+        model = utils.import_module(MODEL_PREFIX + entity)
+        top_models.set_value(entity, model)
+        if model.__api__ != None:
+            model_api = utils.import_module(API_PREFIX + model.__api__)
+            model_api.configure(options)
+            top_api.set_value(model.__api__, model_api.get())
+
+
+def get_client():
+    """Return the backend's memcache client"""
+    assert _CLIENT
+    return _CLIENT
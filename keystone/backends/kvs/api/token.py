@@ -0,0 +1,183 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Token API of the kvs backend
+
+Each token is stored under its id, with a memcache expiry at the token's
+expiry plus expired_token_retention seconds (300 by default), so that an
+expired token is still reported as expired for a while rather than as
+unknown.
+
+For get_for_user and get_for_user_by_tenant every (user, tenant) pair has
+an index entry listing the ids and expiry of its tokens. It is updated with
+gets/cas, so concurrent logins do not lose each other's tokens.
+
+memcache cannot enumerate its keys, so get_all is not supported.
+"""
+
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+
+from keystone.backends import kvs
+from keystone.backends.api import BaseTokenAPI
+from keystone.backends.kvs import models
+from keystone.common import config
+
+logger = logging.getLogger('keystone.backends.kvs.api.token')
+
+TOKEN_PREFIX = 'keystone-token:'
+INDEX_PREFIX = 'keystone-user-tokens:'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# Attempts at updating an index entry that other requests keep changing
+CAS_RETRIES = 10
+# Longest key memcache accepts
+MAX_KEY_LENGTH = 250
+
+_RETENTION = [300]
+
+
+def _key(prefix, value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    key = prefix + value
+    if len(key) > MAX_KEY_LENGTH or len(key.split()) != 1:
+        # Not a valid memcache key as is
+        key = prefix + 'sha1:' + hashlib.sha1(value).hexdigest()
+    return key
+
+
+def _index_key(user_id, tenant_id):
+    return _key(INDEX_PREFIX, json.dumps([user_id, tenant_id]))
+
+
+def _format_time(value):
+    return value and value.strftime(TIME_FORMAT)
+
+
+def _parse_time(value):
+    return value and datetime.strptime(value, TIME_FORMAT)
+
+
+class TokenAPI(BaseTokenAPI):
+    def __init__(self, client, retention=300):
+        self.client = client
+        self.retention = timedelta(seconds=retention)
+
+    def _seconds(self, expires):
+        """memcache expiry for something that expires at expires"""
+        if expires is None:
+            return 0
+        remaining = expires + self.retention - datetime.now()
+        if remaining <= timedelta(0):
+            # Negative expiry times make memcache drop the value at once
+            return -1
+        return remaining.days * 86400 + remaining.seconds + 1
+
+    def _load(self, value):
+        values = json.loads(value)
+        values['expires'] = _parse_time(values['expires'])
+        return models.Token(**dict((str(k), v) for k, v in values.items()))
+
+    def _update_index(self, user_id, tenant_id, change):
+        """Apply change to the ids -> expiry dict of a user's tokens"""
+        key = _index_key(user_id, tenant_id)
+        for _attempt in range(CAS_RETRIES):
+            value, cas = self.client.gets(key)
+            entries = value and json.loads(value) or {}
+            change(entries)
+            cutoff = datetime.now() - self.retention
+            entries = dict((id, expires) for id, expires in entries.items()
+                           if expires is None or
+                           _parse_time(expires) > cutoff)
+            expiries = [_parse_time(expires) for expires in entries.values()]
+            if None in expiries or not expiries:
+                seconds = 0
+            else:
+                seconds = self._seconds(max(expiries))
+            new_value = json.dumps(entries)
+            if value is None:
+                if self.client.add(key, new_value, seconds):
+                    return
+            elif self.client.cas(key, new_value, cas, seconds):
+                return
+        logger.warning("Gave up updating the token index of %s/%s" %
+                       (user_id, tenant_id))
+
+    def create(self, values):
+        token_ref = models.Token()
+        token_ref.update(values)
+        self.client.set(_key(TOKEN_PREFIX, token_ref.id),
+                        json.dumps(dict(token_ref.iteritems(),
+                                        expires=_format_time(
+                                            token_ref.expires))),
+                        self._seconds(token_ref.expires))
+
+        def add(entries):
+            entries[token_ref.id] = _format_time(token_ref.expires)
+        self._update_index(token_ref.user_id, token_ref.tenant_id, add)
+        return token_ref
+
+    def get(self, id):
+        if id is None:
+            return None
+        value = self.client.get(_key(TOKEN_PREFIX, id))
+        return value and self._load(value) or None
+
+    def get_many(self, ids):
+        if not ids:
+            return []
+        values = self.client.get_multi([_key(TOKEN_PREFIX, id)
+                                        for id in ids])
+        return [self._load(value) for value in values.values()]
+
+    def delete(self, id):
+        token_ref = self.get(id)
+        if token_ref is None:
+            return
+        self.client.delete(_key(TOKEN_PREFIX, id))
+
+        def remove(entries):
+            entries.pop(token_ref.id, None)
+        self._update_index(token_ref.user_id, token_ref.tenant_id, remove)
+
+    def get_for_user(self, user_id):
+        return self.get_for_user_by_tenant(user_id, None)
+
+    def get_for_user_by_tenant(self, user_id, tenant_id):
+        value = self.client.get(_index_key(user_id, tenant_id))
+        if not value:
+            return None
+        token_refs = self.get_many(json.loads(value).keys())
+        if not token_refs:
+            return None
+        return max(token_refs, key=lambda token_ref: token_ref.expires)
+
+    def get_all(self):
+        raise NotImplementedError("Tokens stored in memcache can not be "
+                                  "listed")
+
+
+def configure(options):
+    _RETENTION[0] = config.get_option(options, 'expired_token_retention',
+                                      type='int', default=300)
+
+
+def get():
+    return TokenAPI(kvs.get_client(), _RETENTION[0])
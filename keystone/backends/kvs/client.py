@@ -0,0 +1,212 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Pooled client for the memcache text protocol
+
+Keys are spread over the servers by a stable hash (see
+keystone.common.shards). Each server has a pool of connections that green
+threads borrow for one command at a time. A connection that fails is closed
+and replaced on its next use.
+
+Servers are given as 'host:port', or as 'fake://name' for an in-process
+fakememcache server.
+"""
+
+import contextlib
+import logging
+import time
+
+from eventlet import pools
+from eventlet.green import socket
+
+from keystone.backends.kvs import fakememcache
+from keystone.common import shards
+
+logger = logging.getLogger('keystone.backends.kvs.client')
+
+# Expiry times longer than this are taken by memcache as a unix timestamp
+MAX_RELATIVE_EXPIRY = 60 * 60 * 24 * 30
+
+
+class MemcacheError(Exception):
+    """The server failed or could not be reached"""
+    pass
+
+
+class Connection(object):
+    """A socket with buffered reads of lines and data blocks"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = ''
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def _fill(self):
+        chunk = self.sock.recv(4096)
+        if not chunk:
+            raise MemcacheError("Connection closed by server")
+        self.buffer += chunk
+
+    def readline(self):
+        while '\r\n' not in self.buffer:
+            self._fill()
+        line, self.buffer = self.buffer.split('\r\n', 1)
+        return line
+
+    def read(self, length):
+        """Read a data block of length bytes and its terminator"""
+        while len(self.buffer) < length + 2:
+            self._fill()
+        data = self.buffer[:length]
+        self.buffer = self.buffer[length + 2:]
+        return data
+
+    def close(self):
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+
+class Server(object):
+    """A memcache server and its pool of connections"""
+
+    def __init__(self, address, pool_size=10, timeout=3):
+        self.address = address
+        self.timeout = timeout
+        # Slots start empty and are connected on first use
+        self.pool = pools.Pool(max_size=pool_size, create=lambda: None)
+
+    def _connect(self):
+        if self.address.startswith('fake://'):
+            return Connection(fakememcache.connect(self.address))
+        host, port = self.address.rsplit(':', 1)
+        sock = socket.create_connection((host, int(port)), self.timeout)
+        return Connection(sock)
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.pool.get()
+        try:
+            if conn is None:
+                conn = self._connect()
+            yield conn
+        except (socket.error, MemcacheError), e:
+            logger.warning("Memcache server %s failed: %s" %
+                           (self.address, e))
+            if conn is not None:
+                conn.close()
+            conn = None
+            if isinstance(e, MemcacheError):
+                raise
+            raise MemcacheError(str(e))
+        finally:
+            self.pool.put(conn)
+
+
+class Client(object):
+    """Client of one or more memcache servers"""
+
+    def __init__(self, servers, pool_size=10, timeout=3):
+        """
+        :param servers: list of 'host:port' or 'fake://name' addresses
+        :param pool_size: connections kept per server
+        :param timeout: socket timeout in seconds
+        """
+        self.servers = shards.ShardMap([Server(address, pool_size, timeout)
+                                        for address in servers])
+
+    @staticmethod
+    def _exptime(seconds):
+        seconds = int(seconds or 0)
+        if seconds > MAX_RELATIVE_EXPIRY:
+            return int(time.time()) + seconds
+        return seconds
+
+    @staticmethod
+    def _check(line):
+        if line == 'ERROR' or line.startswith(('CLIENT_ERROR',
+                                               'SERVER_ERROR')):
+            raise MemcacheError(line)
+        return line
+
+    def _retrieve(self, server, command, keys):
+        """Run get or gets, returning {key: (value, cas)}"""
+        found = {}
+        with server.connection() as conn:
+            conn.send('%s %s\r\n' % (command, ' '.join(keys)))
+            while True:
+                line = self._check(conn.readline())
+                if line == 'END':
+                    return found
+                parts = line.split()
+                value = conn.read(int(parts[3]))
+                cas = len(parts) > 4 and int(parts[4]) or None
+                found[parts[1]] = (value, cas)
+
+    def _store(self, command, key, value, seconds, cas=None):
+        line = '%s %s 0 %s %s' % (command, key, self._exptime(seconds),
+                                  len(value))
+        if cas is not None:
+            line += ' %s' % cas
+        with self.servers.for_key(key).connection() as conn:
+            conn.send('%s\r\n%s\r\n' % (line, value))
+            return self._check(conn.readline()) == 'STORED'
+
+    def get(self, key):
+        """Return the value stored under key, or None"""
+        return self.get_multi([key]).get(key)
+
+    def get_multi(self, keys):
+        """Return a dict of the values stored under any of keys"""
+        by_server = {}
+        for key in keys:
+            by_server.setdefault(self.servers.index(key), []).append(key)
+        values = {}
+        for index, server_keys in by_server.items():
+            found = self._retrieve(self.servers.shards[index], 'get',
+                                   server_keys)
+            values.update((key, value) for key, (value, _cas)
+                          in found.items())
+        return values
+
+    def gets(self, key):
+        """Return the value under key and its cas id, or (None, None)"""
+        found = self._retrieve(self.servers.for_key(key), 'gets', [key])
+        return found.get(key, (None, None))
+
+    def set(self, key, value, seconds=0):
+        """Store value under key for seconds, 0 meaning no expiry"""
+        return self._store('set', key, value, seconds)
+
+    def add(self, key, value, seconds=0):
+        """Store value under key unless the key exists"""
+        return self._store('add', key, value, seconds)
+
+    def cas(self, key, value, cas, seconds=0):
+        """Store value under key unless it changed since gets() returned
+        cas"""
+        return self._store('cas', key, value, seconds, cas)
+
+    def delete(self, key):
+        """Remove key, returning False if it did not exist"""
+        with self.servers.for_key(key).connection() as conn:
+            conn.send('delete %s\r\n' % key)
+            return self._check(conn.readline()) == 'DELETED'
@@ -0,0 +1,166 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Fake memcache server for test harness.
+
+FakeMemcache speaks enough of the memcache text protocol for the kvs
+backend: get, gets, set, add, cas, delete and flush_all, with expiry. It
+runs in-process behind a socket-like object, so the client is exercised
+down to the protocol without a memcached to talk to.
+"""
+
+import logging
+import time
+
+LOG = logging.getLogger('keystone.backends.kvs.fakememcache')
+
+# Expiry times longer than this are a unix timestamp, as in memcached
+MAX_RELATIVE_EXPIRY = 60 * 60 * 24 * 30
+
+STORAGE_COMMANDS = ('set', 'add', 'cas')
+
+# Servers by address, so that all connections to an address share data
+_servers = {}
+
+
+def connect(address):
+    """Open a fake connection to the server at address."""
+    server = _servers.get(address)
+    if server is None:
+        server = _servers[address] = FakeMemcache()
+    return FakeSocket(server)
+
+
+def reset():
+    """Forget every fake server and its data."""
+    _servers.clear()
+
+
+class FakeMemcache(object):
+    """Keeps the data of one fake server."""
+
+    def __init__(self):
+        # key -> (value, flags, expires at or None, cas id)
+        self.data = {}
+        self.next_cas = 1
+
+    def _exptime(self, exptime):
+        exptime = int(exptime)
+        if exptime == 0:
+            return None
+        if exptime > MAX_RELATIVE_EXPIRY:
+            return exptime
+        return time.time() + exptime
+
+    def _lookup(self, key):
+        item = self.data.get(key)
+        if item is not None and item[2] is not None and item[2] <= time.time():
+            del self.data[key]
+            item = None
+        return item
+
+    def retrieve(self, command, keys):
+        lines = []
+        for key in keys:
+            item = self._lookup(key)
+            if item is None:
+                continue
+            value, flags, _expires, cas = item
+            if command == 'gets':
+                lines.append('VALUE %s %s %s %s' % (key, flags, len(value),
+                                                    cas))
+            else:
+                lines.append('VALUE %s %s %s' % (key, flags, len(value)))
+            lines.append(value)
+        lines.append('END')
+        return lines
+
+    def store(self, command, key, flags, exptime, value, cas=None):
+        item = self._lookup(key)
+        if command == 'add' and item is not None:
+            return 'NOT_STORED'
+        if command == 'cas':
+            if item is None:
+                return 'NOT_FOUND'
+            if item[3] != int(cas):
+                return 'EXISTS'
+        self.data[key] = (value, flags, self._exptime(exptime),
+                          self.next_cas)
+        self.next_cas += 1
+        return 'STORED'
+
+    def delete(self, key):
+        if self._lookup(key) is None:
+            return 'NOT_FOUND'
+        del self.data[key]
+        return 'DELETED'
+
+    def flush_all(self):
+        self.data.clear()
+        return 'OK'
+
+
+class FakeSocket(object):
+    """Socket-like connection that feeds commands to a FakeMemcache."""
+
+    def __init__(self, server):
+        self.server = server
+        self.received = ''
+        self.pending = ''
+        self.closed = False
+
+    def sendall(self, data):
+        self.received += data
+        while self._handle_one():
+            pass
+
+    def recv(self, size):
+        response, self.pending = self.pending[:size], self.pending[size:]
+        return response
+
+    def close(self):
+        self.closed = True
+
+    def _respond(self, lines):
+        self.pending += ''.join('%s\r\n' % line for line in lines)
+
+    def _handle_one(self):
+        """Handle the first complete command received, if any."""
+        if '\r\n' not in self.received:
+            return False
+        line, rest = self.received.split('\r\n', 1)
+        parts = line.split()
+        command = parts and parts[0] or ''
+        LOG.debug("fake memcache: %s" % line)
+        if command in STORAGE_COMMANDS:
+            length = int(parts[4])
+            if len(rest) < length + 2:
+                return False
+            value, rest = rest[:length], rest[length + 2:]
+            self._respond([self.server.store(command, parts[1], parts[2],
+                                             parts[3], value,
+                                             *parts[5:6])])
+        elif command in ('get', 'gets'):
+            self._respond(self.server.retrieve(command, parts[1:]))
+        elif command == 'delete':
+            self._respond([self.server.delete(parts[1])])
+        elif command == 'flush_all':
+            self._respond([self.server.flush_all()])
+        else:
+            self._respond(['ERROR'])
+        self.received = rest
+        return True
@@ -83,6 +83,10 @@ class BaseLdapAPI(object):
         else:
             return self._ldap_res_to_model(res)
 
+    def get_many(self, ids):
+        # LDAP has no IN, so this costs one base search per id
+        return [obj for obj in map(self.get, ids) if obj is not None]
+
     def get_all(self, filter=None):
         return map(self._ldap_res_to_model, self._ldap_get_all(filter))
     
@@ -117,6 +117,14 @@ class RoleAPI(BaseLdapAPI, BaseTenantAPI):
                    tenant_id=tenant_id))
         return res
     
+    def ref_get_all_for_users(self, user_ids, tenant_ids):
+        res = []
+        for user_id in user_ids:
+            res.extend(self.ref_get_all_global_roles(user_id))
+            for tenant_id in tenant_ids:
+                res.extend(self.ref_get_all_tenant_roles(user_id, tenant_id))
+        return res
+
     def ref_get(self, id):
         role_id, tenant_id, user_id = self._explode_ref(id)
         user_dn = self.api.user._id_to_dn(user_id)
@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-memory backend
+
+Keeps entities in the memory of the keystone process, which makes lookups
+cheap but loses them on restart and does not share them between processes.
+Only tokens are supported; enable it for them with
+
+    backends = keystone.backends.sqlalchemy,keystone.backends.memory
+
+    [keystone.backends.memory]
+    backend_entities = ['Token']
+
+Backends later in the list override the entities of earlier ones.
+"""
+
+import ast
+
+from keystone.common import config
+import keystone.utils as utils
+import keystone.backends.api as top_api
+import keystone.backends.models as top_models
+
+MODEL_PREFIX = 'keystone.backends.memory.models.'
+API_PREFIX = 'keystone.backends.memory.api.'
+
+
+def configure_backend(options):
+    """Register the configured models and their APIs
+
+    :param options: Mapping of configuration options
+    """
+    entities = ast.literal_eval(options.get("backend_entities", "['Token']"))
+    for entity in entities:
+        model = utils.import_module(MODEL_PREFIX + entity)
+        top_models.set_value(entity, model)
+        if model.__api__ != None:
+            model_api = utils.import_module(API_PREFIX + model.__api__)
+            model_api.configure(options)
+            top_api.set_value(model.__api__, model_api.get())
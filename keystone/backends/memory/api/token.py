@@ -0,0 +1,126 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Token store held in process memory
+
+Tokens are indexed by id and by (user_id, tenant_id). A heap ordered by
+expiry lets expired tokens be dropped in O(log n) each as they come due,
+without scanning the store; this happens on every create and lookup.
+
+Expired tokens are kept for expired_token_retention seconds (300 by default)
+so that a client presenting one is told it expired rather than that it does
+not exist.
+"""
+
+from datetime import datetime, timedelta
+import heapq
+
+from keystone.backends.api import BaseTokenAPI
+from keystone.backends.memory import models
+from keystone.common import config
+
+
+class TokenAPI(BaseTokenAPI):
+    def __init__(self, retention=300):
+        self.retention = timedelta(seconds=retention)
+        self.clear()
+
+    def clear(self):
+        """Forget all tokens"""
+        self._tokens = {}
+        # (user_id, tenant_id) -> set of token ids
+        self._by_owner = {}
+        # (expires, id) of every token that expires. Entries of deleted or
+        # replaced tokens stay until they come due and are then skipped.
+        self._expiry = []
+
+    def _purge(self):
+        cutoff = datetime.now() - self.retention
+        while self._expiry and self._expiry[0][0] < cutoff:
+            expires, id = heapq.heappop(self._expiry)
+            token_ref = self._tokens.get(id)
+            if token_ref is not None and token_ref.expires == expires:
+                self._remove(token_ref)
+
+    def _remove(self, token_ref):
+        del self._tokens[token_ref.id]
+        owner = (token_ref.user_id, token_ref.tenant_id)
+        ids = self._by_owner.get(owner)
+        if ids is not None:
+            ids.discard(token_ref.id)
+            if not ids:
+                del self._by_owner[owner]
+
+    def _latest(self, owner):
+        ids = self._by_owner.get(owner)
+        if not ids:
+            return None
+        return max((self._tokens[id] for id in ids),
+                   key=lambda token_ref: token_ref.expires)
+
+    def create(self, values):
+        self._purge()
+        token_ref = models.Token()
+        token_ref.update(values)
+        previous = self._tokens.get(token_ref.id)
+        if previous is not None:
+            self._remove(previous)
+        self._tokens[token_ref.id] = token_ref
+        self._by_owner.setdefault((token_ref.user_id, token_ref.tenant_id),
+                                  set()).add(token_ref.id)
+        if token_ref.expires is not None:
+            heapq.heappush(self._expiry, (token_ref.expires, token_ref.id))
+        return token_ref
+
+    def get(self, id):
+        self._purge()
+        return self._tokens.get(id)
+
+    def get_many(self, ids):
+        self._purge()
+        return [self._tokens[id] for id in ids if id in self._tokens]
+
+    def delete(self, id):
+        token_ref = self._tokens.get(id)
+        if token_ref is not None:
+            self._remove(token_ref)
+
+    def get_for_user(self, user_id):
+        self._purge()
+        return self._latest((user_id, None))
+
+    def get_for_user_by_tenant(self, user_id, tenant_id):
+        self._purge()
+        return self._latest((user_id, tenant_id))
+
+    def get_all(self):
+        self._purge()
+        return self._tokens.values()
+
+
+# Both routers configure the backends; they must share one store
+_TOKEN_API = TokenAPI()
+
+
+def configure(options):
+    _TOKEN_API.retention = timedelta(seconds=config.get_option(
+        options, 'expired_token_retention', type='int', default=300))
+
+
+def get():
+    return _TOKEN_API
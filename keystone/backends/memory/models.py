@@ -0,0 +1,64 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Models of the memory backend
+
+They are plain objects with the same attributes as the SQL models, and can
+be read and updated like dicts.
+"""
+
+__all__ = ['Token']
+
+
+class MemoryBase(object):
+    """Base class for the memory backend's models"""
+    __api__ = None
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for key in self.__slots__:
+            setattr(self, key, values.get(key))
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __iter__(self):
+        return self.iteritems()
+
+    def iteritems(self):
+        return iter([(key, getattr(self, key)) for key in self.__slots__])
+
+    def update(self, values):
+        """Copy the known attributes of values, a dict or model"""
+        for key, value in values.iteritems():
+            if key in self.__slots__:
+                setattr(self, key, value)
+
+    def copy(self):
+        return self.__class__(**dict(self.iteritems()))
+
+
+class Token(MemoryBase):
+    __api__ = 'token'
+    __slots__ = ('id', 'user_id', 'tenant_id', 'expires')
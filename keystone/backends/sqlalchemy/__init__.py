@@ -16,22 +16,43 @@
 #    under the License.
 
 import ast
+import functools
 import logging
+import time
 
-from sqlalchemy import create_engine
+from eventlet import corolocal
+from sqlalchemy import event, exc, exists, or_, select
 from sqlalchemy.orm import joinedload, aliased, sessionmaker
 
 from keystone.common import config
+from keystone.common import migration
+from keystone.common import replicas
+from keystone.common import sessions
+from keystone.common import sqlengine
 from keystone.backends.sqlalchemy import models
+from keystone.backends.sqlalchemy import versions
 import keystone.utils as utils
 import keystone.backends.api as top_api
 import keystone.backends.models as top_models
 _ENGINE = None
 _MAKER = None
+# Engines of the listeners that have a pool of their own, by listener, and
+# their sessionmakers
+_LISTENER_ENGINES = {}
+_LISTENER_MAKERS = {}
+# Read replicas of _ENGINE (a replicas.ReplicaSet) and their sessionmakers
+_REPLICAS = None
+_REPLICA_MAKERS = {}
+# Seconds after a write during which reads stay on the primary
+_PIN_SECONDS = 2
+_LAST_WRITE = [0]
+# Replica engine the current green thread's reads are routed to
+_ROUTE = corolocal.local()
 BASE = models.Base
 
 MODEL_PREFIX = 'keystone.backends.sqlalchemy.models.'
 API_PREFIX = 'keystone.backends.sqlalchemy.api.'
+REPOSITORY = 'keystone.backends.sqlalchemy'
 
 
 def configure_backend(options):
@@ -47,10 +68,10 @@ def configure_backend(options):
             options, 'debug', type='bool', default=False)
         verbose = config.get_option(
             options, 'verbose', type='bool', default=False)
-        timeout = config.get_option(
-            options, 'sql_idle_timeout', type='int', default=3600)
-        _ENGINE = create_engine(options['sql_connection'],
-                                pool_recycle=timeout)
+        _ENGINE = sqlengine.create_engine(REPOSITORY, options)
+        _LISTENER_ENGINES.update(
+            sqlengine.create_listener_engines(REPOSITORY, options))
+        configure_replicas(options)
         logger = logging.getLogger('sqlalchemy.engine')
         if debug:
             logger.setLevel(logging.DEBUG)
@@ -59,15 +80,118 @@ def configure_backend(options):
         register_models(options)
 
 
+def configure_replicas(options):
+    """Create engines for the read replicas listed in the options.
+
+    sql_replica_connections is a list of connection strings of databases
+    replicated from sql_connection. They take the same pool options.
+
+    :param options: Mapping of configuration options
+    """
+    global _REPLICAS, _PIN_SECONDS
+    connections = ast.literal_eval(options.get('sql_replica_connections',
+                                               '[]') or '[]')
+    _PIN_SECONDS = config.get_option(options, 'sql_replica_pin_seconds',
+                                     type='float', default=2)
+    retry_interval = config.get_option(options, 'sql_replica_retry_interval',
+                                       type='int', default=30)
+    engines = []
+    _REPLICA_MAKERS.clear()
+    for index, connection in enumerate(connections):
+        replica_options = dict(options)
+        replica_options['sql_connection'] = connection
+        engine = sqlengine.create_engine('%s.replica%d' % (REPOSITORY, index),
+                                         replica_options)
+        # Replica sessions never write, so they must not flush either
+        _REPLICA_MAKERS[engine] = sessionmaker(bind=engine, autocommit=True,
+                                               autoflush=False,
+                                               expire_on_commit=False)
+        engines.append(engine)
+    _REPLICAS = engines and replicas.ReplicaSet(REPOSITORY, engines,
+                                                retry_interval) or None
+
+
+def _record_write(session, *args):
+    _LAST_WRITE[0] = time.time()
+    sessions.mark_written()
+
+
+def _pick_replica():
+    """Return the replica engine to read from, or None for the primary"""
+    if not _REPLICAS or sessions.written():
+        return None
+    if time.time() - _LAST_WRITE[0] < _PIN_SECONDS:
+        # Give our recent writes time to reach the replicas
+        return None
+    return _REPLICAS.pick()
+
+
+def _replica_key(engine):
+    return '%s.replica%d' % (REPOSITORY, _REPLICAS.replicas.index(engine))
+
+
+def read_only(func):
+    """Route the sessions opened by a read-only API method to a replica.
+
+    The replica is picked round robin among the healthy ones. If it fails,
+    it is taken out of rotation and the method is run again on the primary.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_ROUTE, 'engine', None) is not None:
+            # Called from another read-only method, keep its replica
+            return func(*args, **kwargs)
+        engine = _pick_replica()
+        if engine is None:
+            return func(*args, **kwargs)
+        _ROUTE.engine = engine
+        try:
+            return func(*args, **kwargs)
+        except exc.DBAPIError, e:
+            _REPLICAS.mark_down(engine, e)
+            sessions.discard(_replica_key(engine))
+            _ROUTE.engine = None
+            return func(*args, **kwargs)
+        finally:
+            _ROUTE.engine = None
+    return wrapper
+
+
+def _primary_maker(engine, autocommit, expire_on_commit):
+    maker = sessionmaker(bind=engine,
+                         autocommit=autocommit,
+                         expire_on_commit=expire_on_commit)
+    event.listen(maker, 'after_flush', _record_write)
+    # Query.delete() and Query.update() do not flush
+    event.listen(maker, 'after_bulk_delete', _record_write)
+    event.listen(maker, 'after_bulk_update', _record_write)
+    return maker
+
+
 def get_session(autocommit=True, expire_on_commit=False):
-    """Helper method to grab session"""
+    """Helper method to grab session
+
+    Inside a request scope this is the request's session, see
+    keystone.common.sessions. Within a method decorated with read_only it
+    may be a session on a read replica. Requests of a listener that has a
+    pool of its own get their connections from that pool.
+    """
     global _MAKER, _ENGINE
+    engine = getattr(_ROUTE, 'engine', None)
+    if engine is not None:
+        return sessions.get_session(_replica_key(engine),
+                                    _REPLICA_MAKERS[engine], read_only=True)
+    listener = sessions.listener()
+    if listener in _LISTENER_ENGINES:
+        maker = _LISTENER_MAKERS.get(listener)
+        if maker is None:
+            maker = _LISTENER_MAKERS[listener] = _primary_maker(
+                _LISTENER_ENGINES[listener], autocommit, expire_on_commit)
+        return sessions.get_session(REPOSITORY, maker)
     if not _MAKER:
         assert _ENGINE
-        _MAKER = sessionmaker(bind=_ENGINE,
-                              autocommit=autocommit,
-                              expire_on_commit=expire_on_commit)
-    return _MAKER()
+        _MAKER = _primary_maker(_ENGINE, autocommit, expire_on_commit)
+    return sessions.get_session(REPOSITORY, _MAKER)
 
 
 def register_models(options):
@@ -88,7 +212,23 @@ def register_models(options):
     for table in reversed(BASE.metadata.sorted_tables):
         if table in supported_alchemy_tables:
             creation_tables.append(table)
+    fresh = not [table for table in creation_tables if table.exists(_ENGINE)]
     BASE.metadata.create_all(_ENGINE, tables=creation_tables, checkfirst=True)
+    migration.check_version(_ENGINE, REPOSITORY, versions.VERSIONS, fresh)
+
+
+def db_sync(version=None):
+    """Upgrade the schema to the given version, the latest by default"""
+    global _ENGINE
+    assert _ENGINE
+    return migration.db_sync(_ENGINE, REPOSITORY, versions.VERSIONS, version)
+
+
+def db_version():
+    """Return the schema version of the database"""
+    global _ENGINE
+    assert _ENGINE
+    return migration.db_version(_ENGINE, REPOSITORY)
 
 
 def unregister_models():
@@ -15,7 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models, aliased
+from keystone.backends.sqlalchemy import get_session, models, aliased, \
+    read_only
 from keystone.backends.api import BaseEndpointTemplateAPI
 
 
@@ -26,6 +27,7 @@ class EndpointTemplateAPI(BaseEndpointTemplateAPI):
         endpoint_template.save()
         return endpoint_template
     
+    @read_only
     def get(self, id, session=None):
         if not session:
             session = get_session()
@@ -33,11 +35,13 @@ class EndpointTemplateAPI(BaseEndpointTemplateAPI):
             filter_by(id=id).first()
         return result
     
+    @read_only
     def get_all(self, session=None):
         if not session:
             session = get_session()
         return session.query(models.EndpointTemplates).all()
     
+    @read_only
     def get_page(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -52,6 +56,7 @@ class EndpointTemplateAPI(BaseEndpointTemplateAPI):
                                 models.EndpointTemplates.id.desc()).\
                                 limit(limit).all()
     
+    @read_only
     def get_page_markers(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -89,6 +94,7 @@ class EndpointTemplateAPI(BaseEndpointTemplateAPI):
             next = next.id
         return (prev, next)
     
+    @read_only
     def endpoint_get_by_tenant_get_page(self, tenant_id, marker, limit,
                                             session=None):
         if not session:
@@ -104,6 +110,7 @@ class EndpointTemplateAPI(BaseEndpointTemplateAPI):
                 filter(models.Endpoints.tenant_id == tenant_id).\
                 order_by(models.Endpoints.id).limit(limit).all()
     
+    @read_only
     def endpoint_get_by_tenant_get_page_markers(self, tenant_id, marker, limit,
                                                     session=None):
         if not session:
@@ -176,7 +183,7 @@ class EndpointTemplateAPI(BaseEndpointTemplateAPI):
     def endpoint_delete(self, id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             endpoints = self.endpoint_get(id, session)
             session.delete(endpoints)
 
@@ -15,11 +15,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models, aliased
+from keystone.backends.sqlalchemy import get_session, models, aliased, \
+    read_only
 from keystone.backends.api import BaseGroupAPI
 
 class GroupAPI(BaseGroupAPI):
 
+    @read_only
     def get(self, id, session=None):
         if not session:
             session = get_session()
@@ -35,6 +37,7 @@ class GroupAPI(BaseGroupAPI):
         return result
     
     
+    @read_only
     def get_all(self, session=None):
         if not session:
             session = get_session()
@@ -42,6 +45,7 @@ class GroupAPI(BaseGroupAPI):
         return result
     
     
+    @read_only
     def get_page(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -55,6 +59,7 @@ class GroupAPI(BaseGroupAPI):
                                 models.Group.id.desc()).limit(limit).all()
     
     
+    @read_only
     def get_page_markers(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -96,10 +101,11 @@ class GroupAPI(BaseGroupAPI):
     def delete(self, id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             group_ref = self.get(id, session)
             session.delete(group_ref)
     
+    @read_only
     def get_by_user_get_page(self, user_id, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -119,6 +125,7 @@ class GroupAPI(BaseGroupAPI):
                                 group.id).limit(limit).all()
     
     
+    @read_only
     def get_by_user_get_page_markers(self, user_id, marker, limit, session=None):
         if not session:
             session = get_session()
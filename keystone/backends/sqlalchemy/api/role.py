@@ -15,8 +15,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy import get_session, models, read_only
 from keystone.backends.api import BaseRoleAPI
+from keystone.common import sqlengine
 
 class RoleAPI(BaseRoleAPI):
     def create(self, values):
@@ -26,19 +27,24 @@ class RoleAPI(BaseRoleAPI):
         return role_ref
     
     
+    @read_only
     def get(self, id, session=None):
         if not session:
             session = get_session()
-        result = session.query(models.Role).filter_by(id=id).first()
-        return result
+        if id is None:
+            return None
+        # query.get() answers repeated lookups from the identity map
+        return session.query(models.Role).get(id)
     
     
+    @read_only
     def get_all(self, session=None):
         if not session:
             session = get_session()
         return session.query(models.Role).all()
     
     
+    @read_only
     def get_page(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -52,6 +58,7 @@ class RoleAPI(BaseRoleAPI):
                                 models.Role.id.desc()).limit(limit).all()
     
     
+    @read_only
     def ref_get_page(self, marker, limit, user_id, session=None):
         if not session:
             session = get_session()
@@ -67,6 +74,7 @@ class RoleAPI(BaseRoleAPI):
                     models.UserRoleAssociation.id.desc()).limit(limit).all()
     
     
+    @read_only
     def ref_get_all_global_roles(self, user_id, session=None):
         if not session:
             session = get_session()
@@ -74,6 +82,7 @@ class RoleAPI(BaseRoleAPI):
                     filter_by(user_id=user_id).filter("tenant_id is null").all()
     
     
+    @read_only
     def ref_get_all_tenant_roles(self, user_id, tenant_id, session=None):
         if not session:
             session = get_session()
@@ -81,6 +90,25 @@ class RoleAPI(BaseRoleAPI):
                 filter_by(user_id=user_id).filter_by(tenant_id=tenant_id).all()
     
     
+    @read_only
+    def ref_get_all_for_users(self, user_ids, tenant_ids, session=None):
+        """Global roles of the users plus their roles on the tenants"""
+        if not user_ids:
+            return []
+        if not session:
+            session = get_session()
+        ref = models.UserRoleAssociation
+        tenant_chunks = sqlengine.in_chunks(tenant_ids)
+        refs = []
+        for user_chunk in sqlengine.in_chunks(user_ids):
+            query = session.query(ref).filter(ref.user_id.in_(user_chunk))
+            refs.extend(query.filter(ref.tenant_id == None).all())
+            for tenant_chunk in tenant_chunks:
+                refs.extend(query.filter(
+                    ref.tenant_id.in_(tenant_chunk)).all())
+        return refs
+    
+    
     def ref_get(self, id, session=None):
         if not session:
             session = get_session()
@@ -91,10 +119,11 @@ class RoleAPI(BaseRoleAPI):
     def ref_delete(self, id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             role_ref = self.ref_get(id, session)
             session.delete(role_ref)
     
+    @read_only
     def get_page_markers(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -133,6 +162,7 @@ class RoleAPI(BaseRoleAPI):
         return (prev, next)
     
     
+    @read_only
     def ref_get_page_markers(self, user_id, marker, limit, session=None):
         if not session:
             session = get_session()
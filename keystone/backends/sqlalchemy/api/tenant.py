@@ -15,8 +15,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models, aliased
+from keystone.backends.sqlalchemy import get_session, models, aliased, \
+    exists, or_, read_only, select
 from keystone.backends.api import BaseTenantAPI
+from keystone.common import sqlengine
 
 class TenantAPI(BaseTenantAPI):
     def create(self, values):
@@ -26,19 +28,37 @@ class TenantAPI(BaseTenantAPI):
         return tenant_ref
     
     
+    @read_only
     def get(self, id, session=None):
         if not session:
             session = get_session()
-        result = session.query(models.Tenant).filter_by(id=id).first()
-        return result
+        if id is None:
+            return None
+        # query.get() answers repeated lookups from the identity map
+        return session.query(models.Tenant).get(id)
     
     
+    @read_only
+    def get_many(self, ids, session=None):
+        if not ids:
+            return []
+        if not session:
+            session = get_session()
+        refs = []
+        for chunk in sqlengine.in_chunks(ids):
+            refs.extend(session.query(models.Tenant).filter(
+                models.Tenant.id.in_(chunk)).all())
+        return refs
+    
+    
+    @read_only
     def get_all(self, session=None):
         if not session:
             session = get_session()
         return session.query(models.Tenant).all()
     
     
+    @read_only
     def tenants_for_user_get_page(self, user, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -56,6 +76,7 @@ class TenantAPI(BaseTenantAPI):
             return q3.order_by(tenant.id.desc()).limit(limit).all()
     
     
+    @read_only
     def tenants_for_user_get_page_markers(self, user, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -99,6 +120,7 @@ class TenantAPI(BaseTenantAPI):
         return (prev, next)
     
     
+    @read_only
     def get_page(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -112,6 +134,7 @@ class TenantAPI(BaseTenantAPI):
                                 models.Tenant.id.desc()).limit(limit).all()
     
     
+    @read_only
     def get_page_markers(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -153,23 +176,18 @@ class TenantAPI(BaseTenantAPI):
     def is_empty(self, id, session=None):
         if not session:
             session = get_session()
-        a_user = session.query(models.UserRoleAssociation).filter_by(\
-            tenant_id=id).first()
-        if a_user != None:
-            return False
-        a_group = session.query(models.Group).filter_by(tenant_id=id).first()
-        if a_group != None:
-            return False
-        a_user = session.query(models.User).filter_by(tenant_id=id).first()
-        if a_user != None:
-            return False
-        return True
+        # One statement asking whether anything refers to the tenant
+        in_use = select([or_(
+            exists().where(models.UserRoleAssociation.tenant_id == id),
+            exists().where(models.Group.tenant_id == id),
+            exists().where(models.User.tenant_id == id))])
+        return not session.execute(in_use).scalar()
     
     
     def update(self, id, values, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             tenant_ref = self.get(id, session)
             tenant_ref.update(values)
             tenant_ref.save(session=session)
@@ -178,11 +196,17 @@ class TenantAPI(BaseTenantAPI):
     def delete(self, id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
-            tenant_ref = self.get(id, session)
-            session.delete(tenant_ref)
+        with session.begin(subtransactions=True):
+            # The endpoints go with the tenant, its groups are left without
+            session.query(models.Endpoints).filter_by(tenant_id=id).\
+                delete(synchronize_session=False)
+            session.query(models.Group).filter_by(tenant_id=id).\
+                update({'tenant_id': None}, synchronize_session=False)
+            session.query(models.Tenant).filter_by(id=id).\
+                delete(synchronize_session='evaluate')
     
     
+    @read_only
     def get_all_endpoints(self, tenant_id, session=None):
         if not session:
             session = get_session()
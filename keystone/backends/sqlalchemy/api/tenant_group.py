@@ -15,7 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy import get_session, models, read_only
 from keystone.backends.api import BaseTenantGroupAPI
 
 class TenantGroupAPI(BaseTenantGroupAPI):
@@ -36,6 +36,7 @@ class TenantGroupAPI(BaseTenantGroupAPI):
         return True
     
     
+    @read_only
     def get(self, id, tenant, session=None):
         if not session:
             session = get_session()
@@ -45,6 +46,7 @@ class TenantGroupAPI(BaseTenantGroupAPI):
         return result
     
     
+    @read_only
     def get_page(self, tenantId, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -60,6 +62,7 @@ class TenantGroupAPI(BaseTenantGroupAPI):
         #return session.query(models.Tenant).all()
     
     
+    @read_only
     def get_page_markers(self, tenantId, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -106,7 +109,7 @@ class TenantGroupAPI(BaseTenantGroupAPI):
     def update(self, id, tenant_id, values, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             tenant_ref = self.get(id, tenant_id, session)
             tenant_ref.update(values)
             tenant_ref.save(session=session)
@@ -115,7 +118,7 @@ class TenantGroupAPI(BaseTenantGroupAPI):
     def delete(self, id, tenant_id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             tenantgroup_ref = self.get(id, tenant_id, session)
             session.delete(tenantgroup_ref)
 
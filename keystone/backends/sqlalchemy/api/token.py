@@ -17,6 +17,7 @@
 
 from keystone.backends.sqlalchemy import get_session, models
 from keystone.backends.api import BaseTokenAPI
+from keystone.common import sqlengine
 
 
 class TokenAPI(BaseTokenAPI):
@@ -30,14 +31,28 @@ class TokenAPI(BaseTokenAPI):
     def get(self, id, session=None):
         if not session:
             session = get_session()
-        result = session.query(models.Token).filter_by(id=id).first()
-        return result
+        if id is None:
+            return None
+        # query.get() answers repeated lookups from the identity map
+        return session.query(models.Token).get(id)
+    
+    
+    def get_many(self, ids, session=None):
+        if not ids:
+            return []
+        if not session:
+            session = get_session()
+        refs = []
+        for chunk in sqlengine.in_chunks(ids):
+            refs.extend(session.query(models.Token).filter(
+                models.Token.id.in_(chunk)).all())
+        return refs
     
     
     def delete(self, id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             token_ref = self.get(id, session)
             session.delete(token_ref)
     
@@ -16,10 +16,13 @@
 #    under the License.
 
 import keystone.utils as utils
-from keystone.backends.sqlalchemy import get_session, models, aliased, joinedload
+from keystone.backends.sqlalchemy import get_session, models, aliased, \
+    joinedload, or_, read_only, select
 from keystone.backends.api import BaseUserAPI
+from keystone.common import sqlengine
 
 class UserAPI(BaseUserAPI):
+    @read_only
     def get_all(self, session=None):
         if not session:
             session = get_session()
@@ -45,7 +48,7 @@ class UserAPI(BaseUserAPI):
     def tenant_group_delete(self, id, group_id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             usertenantgroup_ref = self.get_by_group(id, group_id, session)
             if usertenantgroup_ref is not None:
                 session.delete(usertenantgroup_ref)
@@ -64,16 +67,33 @@ class UserAPI(BaseUserAPI):
         elif type(values) is models.User:
             values.password = utils.get_hashed_password(values.password)
     
+    @read_only
     def get(self, id, session=None):
         if not session:
             session = get_session()
         #TODO(Ziad): finish cleaning up model
         #    result = session.query(models.User).options(joinedload('groups')).\
         #              options(joinedload('tenants')).filter_by(id=id).first()
-        result = session.query(models.User).filter_by(id=id).first()
-        return result
+        if id is None:
+            return None
+        # query.get() answers repeated lookups from the identity map
+        return session.query(models.User).get(id)
     
     
+    @read_only
+    def get_many(self, ids, session=None):
+        if not ids:
+            return []
+        if not session:
+            session = get_session()
+        refs = []
+        for chunk in sqlengine.in_chunks(ids):
+            refs.extend(session.query(models.User).filter(
+                models.User.id.in_(chunk)).all())
+        return refs
+    
+    
+    @read_only
     def get_page(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -87,6 +107,7 @@ class UserAPI(BaseUserAPI):
                                 models.User.id.desc()).limit(limit).all()
     
     
+    @read_only
     def get_page_markers(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -151,13 +172,14 @@ class UserAPI(BaseUserAPI):
     def update(self, id, values, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             user_ref = self.get(id, session)
             self.__check_and_use_hashed_password(values)
             user_ref.update(values)
             user_ref.save(session=session)
     
     
+    @read_only
     def users_tenant_group_get_page(self, group_id, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -177,6 +199,7 @@ class UserAPI(BaseUserAPI):
                                 user.id).limit(limit).all()
     
     
+    @read_only
     def users_tenant_group_get_page_markers(self, group_id, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -226,7 +249,7 @@ class UserAPI(BaseUserAPI):
     def delete(self, id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
+        with session.begin(subtransactions=True):
             user_ref = self.get(id, session)
             session.delete(user_ref)
     
@@ -259,21 +282,24 @@ class UserAPI(BaseUserAPI):
     def delete_tenant_user(self, id, tenant_id, session=None):
         if not session:
             session = get_session()
-        with session.begin():
-            users_tenant_ref = self.users_get_by_tenant(id, tenant_id, session)
-            if users_tenant_ref is not None:
-                for user_tenant_ref in users_tenant_ref:
-                    session.delete(user_tenant_ref)
-    
-            user_group_ref = self.get_group_by_tenant(tenant_id, session)
-    
-            if user_group_ref is not None:
-                for user_group in user_group_ref:
-                    get_users = session.query(models.UserGroupAssociation)\
-                                    .filter_by(user_id=id,
-                                            group_id=user_group.id).all()
-                    for group_user in get_users:
-                        session.delete(group_user)
+        # Set based deletes: the user's memberships of the tenant's groups,
+        # then, if the user belongs to the tenant, everything referring to
+        # the user and the user itself
+        tenant_user = select([models.User.id]).where(
+            (models.User.id == id) & (models.User.tenant_id == tenant_id))
+        tenant_groups = select([models.Group.id]).where(
+            models.Group.tenant_id == tenant_id)
+        with session.begin(subtransactions=True):
+            session.query(models.UserGroupAssociation).filter(
+                (models.UserGroupAssociation.user_id == id) &
+                or_(models.UserGroupAssociation.group_id.in_(tenant_groups),
+                    models.UserGroupAssociation.user_id.in_(tenant_user))).\
+                delete(synchronize_session=False)
+            session.query(models.UserRoleAssociation).filter(
+                models.UserRoleAssociation.user_id.in_(tenant_user)).\
+                delete(synchronize_session=False)
+            session.query(models.User).filter_by(id=id,
+                tenant_id=tenant_id).delete(synchronize_session='evaluate')
     
     
     def users_get_by_tenant(self, user_id, tenant_id, session=None):
@@ -297,6 +323,7 @@ class UserAPI(BaseUserAPI):
         return result
     
     
+    @read_only
     def users_get_page(self, marker, limit, session=None):
         if not session:
             session = get_session()
@@ -310,6 +337,7 @@ class UserAPI(BaseUserAPI):
             return session.query(user).\
                                 order_by("id").limit(limit).all()
     
+    @read_only
     def users_get_page_markers(self, marker, limit, \
             session=None):
         if not session:
@@ -355,6 +383,7 @@ class UserAPI(BaseUserAPI):
         return (prev, next)
     
     
+    @read_only
     def users_get_by_tenant_get_page(self, tenant_id, marker, limit, session=None):
         # This is broken.  If a user has more than one role per project
         # shit hits the fan because we're limiting the wrong model.
@@ -385,6 +414,7 @@ class UserAPI(BaseUserAPI):
         return users
     
     
+    @read_only
     def users_get_by_tenant_get_page_markers(self, tenant_id, marker, limit, \
             session=None):
         if not session:
@@ -16,7 +16,7 @@
 # Not Yet PEP8 standardized
 
 from sqlalchemy import Column, String, Integer, ForeignKey, \
-    UniqueConstraint, Boolean, DateTime
+    UniqueConstraint, Boolean, DateTime, Index
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, object_mapper
@@ -84,6 +84,8 @@ class UserGroupAssociation(Base, KeystoneBase):
     __api__ = 'tenant_group'
     user_id = Column(String(255), ForeignKey('users.id'), primary_key=True)
     group_id = Column(String(255), ForeignKey('groups.id'), primary_key=True)
+    __table_args__ = (
+        Index('ix_user_group_association_group_id', 'group_id'), {})
 
 
 class UserRoleAssociation(Base, KeystoneBase):
@@ -92,7 +94,10 @@ class UserRoleAssociation(Base, KeystoneBase):
     user_id = Column(String(255), ForeignKey('users.id'))
     role_id = Column(String(255), ForeignKey('roles.id'))
     tenant_id = Column(String(255), ForeignKey('tenants.id'))
-    __table_args__ = (UniqueConstraint("user_id", "role_id", "tenant_id"), {})
+    __table_args__ = (UniqueConstraint("user_id", "role_id", "tenant_id"),
+                      # role_id makes it a covering index for role lookups
+                      Index('ix_user_roles_user_id_tenant_id',
+                            'user_id', 'tenant_id', 'role_id'), {})
 
     user = relationship('User')
 
@@ -102,7 +107,8 @@ class Endpoints(Base, KeystoneBase):
     tenant_id = Column(String(255), ForeignKey('tenants.id'))
     endpoint_template_id = Column(Integer, ForeignKey('endpoint_templates.id'))
     __table_args__ = (
-        UniqueConstraint("endpoint_template_id", "tenant_id"), {})
+        UniqueConstraint("endpoint_template_id", "tenant_id"),
+        Index('ix_endpoints_tenant_id', 'tenant_id'), {})
 
 
 # Define objects
@@ -131,6 +137,8 @@ class User(Base, KeystoneBase):
     email = Column(String(255))
     enabled = Column(Integer)
     tenant_id = Column(String(255), ForeignKey('tenants.id'))
+    __table_args__ = (Index('ix_users_email', 'email'),
+                      Index('ix_users_tenant_id', 'tenant_id'), {})
 
     groups = relationship(UserGroupAssociation, backref='users')
     roles = relationship(UserRoleAssociation, cascade="all")
@@ -151,6 +159,7 @@ class Group(Base, KeystoneBase):
     id = Column(String(255), primary_key=True, unique=True)
     desc = Column(String(255))
     tenant_id = Column(String(255), ForeignKey('tenants.id'))
+    __table_args__ = (Index('ix_groups_tenant_id', 'tenant_id'), {})
 
 class Token(Base, KeystoneBase):
     __tablename__ = 'token'
@@ -159,6 +168,8 @@ class Token(Base, KeystoneBase):
     user_id = Column(String(255))
     tenant_id = Column(String(255))
     expires = Column(DateTime)
+    __table_args__ = (Index('ix_token_user_id_tenant_id',
+                            'user_id', 'tenant_id'), {})
 
 class EndpointTemplates(Base, KeystoneBase):
     __tablename__ = 'endpoint_templates'
@@ -0,0 +1,39 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Schema versions of the sqlalchemy backend, oldest first"""
+
+from keystone.common import migration
+
+
+def _add_identity_indexes(connection):
+    """Index the columns the identity queries filter on"""
+    indexes = [('users', 'ix_users_email', ('email',)),
+               ('users', 'ix_users_tenant_id', ('tenant_id',)),
+               ('user_roles', 'ix_user_roles_user_id_tenant_id',
+                ('user_id', 'tenant_id', 'role_id')),
+               ('groups', 'ix_groups_tenant_id', ('tenant_id',)),
+               ('endpoints', 'ix_endpoints_tenant_id', ('tenant_id',)),
+               ('user_group_association',
+                'ix_user_group_association_group_id', ('group_id',)),
+               ('token', 'ix_token_user_id_tenant_id',
+                ('user_id', 'tenant_id'))]
+    for table, name, columns in indexes:
+        migration.create_index(connection, table, name, *columns)
+
+
+VERSIONS = [(1, _add_identity_indexes)]
@@ -0,0 +1,113 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Pool of kept alive HTTP connections to one service
+
+Slots are connected on first use and handed back once their response has
+been read in full. request() makes a whole request and reads the whole
+response; a request on a pooled connection the service has meanwhile closed
+is retried once on a new connection.
+
+Pools report '<name>.connections.created' and '<name>.connections.reused'
+counters to keystone.common.metrics.
+"""
+
+from eventlet import pools
+from eventlet.green import httplib, socket
+
+from keystone.common.bufferedhttp import BufferedHTTPConnection
+from keystone.common import metrics
+
+# Errors that mean a connection is unusable
+ERRORS = (socket.error, httplib.HTTPException)
+
+
+class HTTPPool(object):
+    """At most size connections to host:port"""
+
+    def __init__(self, name, host, port, ssl=False, size=10, timeout=None):
+        """
+        :param name: name the pool's metrics are reported under
+        :param host: host of the service
+        :param port: port of the service
+        :param ssl: whether to talk HTTPS to the service
+        :param size: connections kept open to the service
+        :param timeout: socket timeout in seconds
+
+        """
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.address = '%s:%s' % (host, port)
+        self.ssl = ssl
+        self.timeout = timeout
+        # Slots start empty and are connected on first use
+        self.slots = pools.Pool(max_size=size, create=lambda: None)
+
+    def get(self):
+        """Take a slot, waiting for one if all are in use.
+
+        :returns: a kept alive connection, or None for an empty slot
+
+        """
+        conn = self.slots.get()
+        if conn is not None:
+            metrics.increment('%s.connections.reused' % self.name)
+        return conn
+
+    def put(self, conn):
+        """Give a slot back, with a connection whose last response has been
+        read in full, or None"""
+        self.slots.put(conn)
+
+    def connect(self):
+        """Return a new connection to the service"""
+        metrics.increment('%s.connections.created' % self.name)
+        if self.ssl:
+            return httplib.HTTPSConnection(self.host, self.port,
+                                           timeout=self.timeout)
+        return BufferedHTTPConnection(self.host, self.port,
+                                      timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """Make a request and read the whole response.
+
+        :returns: (status, body) of the response
+        :raises: socket.error or httplib.HTTPException if the service cannot
+                 be reached
+
+        """
+        conn = self.get()
+        reused = conn is not None
+        try:
+            while True:
+                if conn is None:
+                    conn = self.connect()
+                try:
+                    conn.request(method, path, body, headers or {})
+                    resp = conn.getresponse()
+                    return resp.status, resp.read()
+                except ERRORS:
+                    conn.close()
+                    conn = None
+                    if not reused:
+                        raise
+                    # The service closed the idle connection, try a new one
+                    reused = False
+        finally:
+            self.put(conn)
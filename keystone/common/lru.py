@@ -0,0 +1,86 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bounded least-recently-used cache with a time to live
+
+Hits, misses and evictions are reported to keystone.common.metrics as
+'<name>.hits', '<name>.misses' and '<name>.evictions'.
+"""
+
+import collections
+import threading
+import time
+
+from keystone.common import metrics
+
+# Returned by get() for keys that are not cached, as None may be cached
+MISSING = object()
+
+
+class LRUCache(object):
+    """Keeps at most size values, each for at most ttl seconds"""
+
+    def __init__(self, name, size=1000, ttl=60):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        # key -> (value, expiry); most recently used last
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        """Whether an unexpired value is cached under key, without using it"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[1] > time.time()
+
+    def get(self, key):
+        """Return the value cached under key, or MISSING"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[1] <= time.time():
+                metrics.increment('%s.misses' % self.name)
+                return MISSING
+            self.entries[key] = entry
+            metrics.increment('%s.hits' % self.name)
+            return entry[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, time.time() + self.ttl)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                metrics.increment('%s.evictions' % self.name)
+
+    def items(self):
+        """Snapshot of the cached (key, value) pairs, least recent first"""
+        with self.lock:
+            return [(key, entry[0]) for key, entry in self.entries.items()]
+
+    def discard(self, key):
+        """Forget the value cached under key, if any"""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
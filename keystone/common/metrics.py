@@ -0,0 +1,104 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process metrics
+
+Components record counters, gauges and timings by dotted name. snapshot()
+returns all of them, and the admin API publishes it at /v2.0/metrics.
+
+Timings keep a count, total and maximum, plus a window of the most recent
+samples from which the median and 99th percentile are computed.
+"""
+
+import collections
+
+# Number of recent samples kept per timing for the percentiles
+WINDOW = 1024
+
+_counters = {}
+_gauges = {}
+_timings = {}
+
+
+class Timing(object):
+    """Summary of the durations recorded under one name"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=WINDOW)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total': self.total,
+                'max': self.max,
+                'p50': self.percentile(0.5),
+                'p99': self.percentile(0.99)}
+
+
+def increment(name, value=1):
+    """Add value to the counter name"""
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def gauge(name, value):
+    """Set the gauge name to value"""
+    _gauges[name] = value
+
+
+def timing(name, seconds):
+    """Record a duration, in seconds, under name"""
+    summary = _timings.get(name)
+    if summary is None:
+        summary = _timings[name] = Timing()
+    summary.add(seconds)
+
+
+def snapshot():
+    """Return the current value of every metric.
+
+    :returns: dict with 'counters', 'gauges' and 'timings' dicts keyed by
+              metric name; each timing is a dict of count, total, max, p50
+              and p99
+
+    """
+    return {'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': dict((name, summary.to_dict())
+                            for name, summary in _timings.items())}
+
+
+def reset():
+    """Forget all metrics"""
+    _counters.clear()
+    _gauges.clear()
+    _timings.clear()
@@ -0,0 +1,163 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Versioned schema migrations for the SQL backends
+
+Each SQL backend keeps an ordered list of (version, upgrade) steps, where
+upgrade is a callable taking a connection. The version each backend's
+database has reached is recorded in the migrate_version table, keyed by a
+repository name, and db_sync() runs the steps that have not been applied yet.
+
+Databases created from scratch are built from the models, which already carry
+the full schema, so they are stamped with the latest version instead.
+"""
+
+import logging
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, \
+    select
+from sqlalchemy.engine import reflection
+
+logger = logging.getLogger('keystone.common.migration')
+
+META = MetaData()
+VERSION_TABLE = Table('migrate_version', META,
+                      Column('repository_id', String(255), primary_key=True),
+                      Column('version', Integer))
+
+
+class MigrationError(Exception):
+    """Raised when a database cannot be moved to the requested version"""
+    pass
+
+
+def latest_version(versions):
+    """Return the highest version in a list of (version, upgrade) steps"""
+    if not versions:
+        return 0
+    return versions[-1][0]
+
+
+def db_version(engine, repository):
+    """Return the schema version recorded for repository (0 if none)"""
+    VERSION_TABLE.create(engine, checkfirst=True)
+    row = engine.execute(select([VERSION_TABLE.c.version],
+                                VERSION_TABLE.c.repository_id ==
+                                repository)).first()
+    if row is None:
+        return 0
+    return row[0]
+
+
+def _set_version(connection, repository, version):
+    table = VERSION_TABLE
+    updated = connection.execute(table.update().
+                                 where(table.c.repository_id == repository).
+                                 values(version=version))
+    if not updated.rowcount:
+        connection.execute(table.insert().values(repository_id=repository,
+                                                 version=version))
+
+
+def stamp(engine, repository, version):
+    """Record version for repository without running any upgrade"""
+    VERSION_TABLE.create(engine, checkfirst=True)
+    connection = engine.connect()
+    try:
+        _set_version(connection, repository, version)
+    finally:
+        connection.close()
+
+
+def db_sync(engine, repository, versions, version=None):
+    """Upgrade the database to version (default: the latest).
+
+    Each step runs in its own transaction together with the version update,
+    so an interrupted sync can simply be run again.
+
+    :param engine: engine bound to the backend's database
+    :param repository: name the backend's version is recorded under
+    :param versions: ordered list of (version, upgrade) steps
+    :param version: (optional) version to stop at
+    :returns: the version the database is at
+    :raises: MigrationError if version is unknown or older than the database
+
+    """
+    latest = latest_version(versions)
+    if version is None:
+        version = latest
+    version = int(version)
+    if version < 0 or version > latest:
+        raise MigrationError("Unknown version %s (latest is %s)" %
+                             (version, latest))
+
+    current = db_version(engine, repository)
+    if version < current:
+        raise MigrationError("Database is at version %s, downgrades are not "
+                             "supported" % current)
+
+    for number, upgrade in versions:
+        if not current < number <= version:
+            continue
+        logger.info("Upgrading %s to version %s" % (repository, number))
+        connection = engine.connect()
+        try:
+            transaction = connection.begin()
+            try:
+                upgrade(connection)
+                _set_version(connection, repository, number)
+                transaction.commit()
+            except Exception:
+                transaction.rollback()
+                raise
+        finally:
+            connection.close()
+    return version
+
+
+def check_version(engine, repository, versions, fresh=False):
+    """Stamp a freshly created database or warn about a stale one.
+
+    :param fresh: True if the backend's tables were all just created
+
+    """
+    latest = latest_version(versions)
+    if fresh:
+        stamp(engine, repository, latest)
+        return latest
+    current = db_version(engine, repository)
+    if current < latest:
+        logger.warning("The %s database is at version %s but the latest is "
+                       "%s; run 'keystone-manage db sync'" %
+                       (repository, current, latest))
+    return current
+
+
+def create_index(connection, table_name, index_name, *columns):
+    """Create an index unless its table is missing or already has it"""
+    inspector = reflection.Inspector.from_engine(connection)
+    if table_name not in inspector.get_table_names():
+        return False
+    if index_name in [index['name'] for index in
+                      inspector.get_indexes(table_name)]:
+        return False
+    table = Table(table_name, MetaData(), autoload=True,
+                  autoload_with=connection)
+    Index(index_name, *[table.c[column] for column in columns]).\
+        create(connection)
+    return True
@@ -0,0 +1,248 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Streaming reverse proxy to a remote service
+
+Used by the auth middleware when it runs without a downstream WSGI app.
+Request and response bodies are passed on chunk_size bytes at a time, so the
+memory a request takes does not depend on the size of what is transferred.
+End to end headers are passed on both ways; hop-by-hop ones are dropped.
+
+Connections to the service are kept alive and pooled, at most pool_size of
+them, see keystone.common.httppool. A request whose pooled connection turns
+out to have been closed by the service is retried once on a new connection,
+unless its body was already (partly) sent.
+"""
+
+import logging
+import urllib
+
+from webob.exc import HTTPBadGateway
+
+from keystone.common import httppool
+
+logger = logging.getLogger('keystone.common.proxy')
+
+CHUNK_SIZE = 64 * 1024
+
+# Headers that only apply to one connection (RFC 2616 section 13.5.1)
+HOP_BY_HOP = set(['connection', 'keep-alive', 'proxy-authenticate',
+                  'proxy-authorization', 'te', 'trailers',
+                  'transfer-encoding', 'upgrade', 'expect'])
+
+
+def request_headers(env):
+    """Return the headers of the request in a WSGI environ, HTTP_X_USER
+    becoming X-User, less the hop-by-hop ones"""
+    headers = {}
+    for key, value in env.iteritems():
+        if key.startswith('HTTP_'):
+            name = key[5:]
+        elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = key
+        else:
+            continue
+        name = name.replace('_', '-').title()
+        if name.lower() not in HOP_BY_HOP and value != '':
+            headers[name] = value
+    return headers
+
+
+def _response_headers(message):
+    """Return the end to end headers of an httplib response, in the case and
+    order the service sent them"""
+    headers = []
+    for line in message.headers:
+        if line[:1] in ' \t' and headers:
+            # Continuation of the previous header
+            name, value = headers[-1]
+            headers[-1] = (name, '%s %s' % (value, line.strip()))
+            continue
+        name, _sep, value = line.partition(':')
+        headers.append((name.strip(), value.strip()))
+    return [(name, value) for name, value in headers
+            if name.lower() not in HOP_BY_HOP]
+
+
+class _RequestBody(object):
+    """Iterator over the chunks of a WSGI request body"""
+
+    def __init__(self, env, chunk_size):
+        self.input = env.get('wsgi.input')
+        self.chunked = env.get('HTTP_TRANSFER_ENCODING', '').lower() == \
+            'chunked'
+        try:
+            self.length = int(env.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            self.length = 0
+        if self.chunked:
+            self.length = None
+        self.chunk_size = chunk_size
+
+    def __nonzero__(self):
+        return self.input is not None and (self.chunked or self.length > 0)
+
+    def __iter__(self):
+        left = self.length
+        while left is None or left > 0:
+            size = self.chunk_size if left is None else \
+                min(self.chunk_size, left)
+            chunk = self.input.read(size)
+            if not chunk:
+                break
+            if left is not None:
+                left -= len(chunk)
+            yield chunk
+
+
+class _ResponseBody(object):
+    """Iterator over the chunks of a service's response.
+
+    The connection goes back to the pool once the whole body has been read;
+    if the client goes away before that, it is closed instead.
+
+    """
+
+    def __init__(self, proxy, conn, resp, chunk_size):
+        self.proxy = proxy
+        self.conn = conn
+        self.resp = resp
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self.resp.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        except httppool.ERRORS, e:
+            logger.warning("Reading from %s failed: %s" %
+                           (self.proxy.address, e))
+            self.close()
+            raise
+        self._release(self.conn)
+
+    def _release(self, conn):
+        if self.proxy is not None:
+            self.proxy.pool.put(conn)
+            self.proxy = None
+
+    def close(self):
+        if self.proxy is not None:
+            self.conn.close()
+            self._release(None)
+
+
+class Proxy(object):
+    """Forwards WSGI requests to a service over pooled connections"""
+
+    def __init__(self, name, host, port, ssl=False, pool_size=10,
+                 timeout=None, chunk_size=CHUNK_SIZE):
+        """
+        :param name: name the proxy's metrics are reported under
+        :param host: host of the service
+        :param port: port of the service
+        :param ssl: whether to talk HTTPS to the service
+        :param pool_size: connections kept open to the service
+        :param timeout: socket timeout in seconds
+        :param chunk_size: bytes of a body read or written at a time
+
+        """
+        self.pool = httppool.HTTPPool(name, host, port, ssl, pool_size,
+                                      timeout)
+        self.address = self.pool.address
+        self.chunk_size = chunk_size
+
+    def _send(self, conn, method, path, headers, body):
+        conn.putrequest(method, path, skip_host=True,
+                        skip_accept_encoding=True)
+        for name, value in headers.iteritems():
+            conn.putheader(name, value)
+        if body.chunked:
+            conn.putheader('Transfer-Encoding', 'chunked')
+        elif method in ('POST', 'PUT', 'PATCH') and \
+                'Content-Length' not in headers:
+            # As httplib does, so that the service doesn't wait for a body
+            conn.putheader('Content-Length', '0')
+        conn.endheaders()
+        for chunk in body:
+            if body.chunked:
+                chunk = '%x\r\n%s\r\n' % (len(chunk), chunk)
+            conn.send(chunk)
+        if body.chunked:
+            conn.send('0\r\n\r\n')
+        return conn.getresponse()
+
+    def __call__(self, env, start_response, headers=None):
+        """Forward the request in env and stream back the response.
+
+        :param headers: headers to send, by default request_headers(env)
+
+        """
+        if headers is None:
+            headers = request_headers(env)
+        headers.setdefault('Host', self.address)
+        path = urllib.quote(env.get('SCRIPT_NAME', '') +
+                            env.get('PATH_INFO', ''))
+        if env.get('QUERY_STRING'):
+            path += '?' + env['QUERY_STRING']
+        body = _RequestBody(env, self.chunk_size)
+
+        conn = self.pool.get()
+        reused = conn is not None
+        try:
+            while True:
+                if conn is None:
+                    conn = self.pool.connect()
+                try:
+                    resp = self._send(conn, env['REQUEST_METHOD'], path,
+                                      headers, body)
+                    break
+                except httppool.ERRORS, e:
+                    conn.close()
+                    if reused and not body:
+                        # The service closed the idle connection, try a
+                        # new one
+                        conn, reused = None, False
+                        continue
+                    self.pool.put(None)
+                    logger.warning("Forwarding to %s failed: %s" %
+                                   (self.address, e))
+                    return HTTPBadGateway()(env, start_response)
+
+            start_response('%s %s' % (resp.status, resp.reason),
+                           _response_headers(resp.msg))
+        except:
+            # Anything else, e.g. a malformed chunked request body or the
+            # green thread being killed, must not keep the slot either
+            if conn is not None:
+                conn.close()
+            self.pool.put(None)
+            raise
+        return _ResponseBody(self, conn, resp, self.chunk_size)
+
+
+def from_conf(name, conf):
+    """Build the Proxy to a middleware's service_* settings"""
+    timeout = conf.get('service_timeout')
+    return Proxy(name, conf.get('service_host'), conf.get('service_port'),
+                 ssl=conf.get('service_protocol', 'https') == 'https',
+                 pool_size=int(conf.get('service_pool_size', 10)),
+                 timeout=timeout and float(timeout) or None,
+                 chunk_size=int(conf.get('proxy_chunk_size', CHUNK_SIZE)))
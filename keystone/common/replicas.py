@@ -0,0 +1,80 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Health-aware round robin over read replicas
+
+A ReplicaSet hands out its members in turn. A member that fails is marked
+down and skipped until retry_interval seconds have passed, after which it is
+tried again. When every member is down pick() returns None and callers fall
+back to the primary.
+"""
+
+import logging
+import time
+
+from keystone.common import metrics
+
+logger = logging.getLogger('keystone.common.replicas')
+
+
+class ReplicaSet(object):
+    """Round robin over replicas, skipping those that recently failed"""
+
+    def __init__(self, name, replicas, retry_interval=30):
+        """
+        :param name: name the set's metrics are reported under
+        :param replicas: list of replicas, e.g. engines
+        :param retry_interval: seconds a failed replica is left alone
+
+        """
+        self.name = name
+        self.replicas = list(replicas)
+        self.retry_interval = retry_interval
+        # Index of each replica that is down -> time it may be retried
+        self._down_until = {}
+        self._next = 0
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def pick(self):
+        """Return the next healthy replica, or None if all are down"""
+        now = time.time()
+        for _i in range(len(self.replicas)):
+            index = self._next % len(self.replicas)
+            self._next = index + 1
+            if self._down_until.get(index, 0) <= now:
+                self._down_until.pop(index, None)
+                return self.replicas[index]
+        return None
+
+    def mark_down(self, replica, reason=None):
+        """Take a replica out of rotation for retry_interval seconds"""
+        index = self.replicas.index(replica)
+        logger.warning("Replica %s of %s failed (%s); retrying it in %ss" %
+                       (index, self.name, reason, self.retry_interval))
+        self._down_until[index] = time.time() + self.retry_interval
+        metrics.increment('%s.replica.failures' % self.name)
+        metrics.gauge('%s.replica.healthy' % self.name,
+                      len(self.replicas) - len(self._down_until))
+
+    def healthy(self):
+        """Return the replicas that are currently in rotation"""
+        now = time.time()
+        return [replica for index, replica in enumerate(self.replicas)
+                if self._down_until.get(index, 0) <= now]
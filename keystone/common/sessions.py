@@ -0,0 +1,170 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Request-scoped SQL sessions
+
+Between begin() and end() every get_session() call of a SQL backend returns
+the same session, so a request uses one connection per backend, reads
+consistently and has repeated lookups answered from the session's identity
+map. The session's transaction is committed or rolled back once, by end().
+
+Scopes are local to the green thread, and sessions are only opened for the
+backends a request actually touches. Outside a scope get_session() hands out
+a new autocommit session per call, as it always has.
+
+Sessions opened on read replicas are registered as read only; they are
+always rolled back. Backends call mark_written() when they write, so that
+the rest of the scope can read its own writes from the primary.
+
+on_end() registers work to run once the scope's transactions are over,
+such as dropping cache entries that a committed change made stale.
+
+The server notes with set_listener() which of its listeners ('service' or
+'admin') the green thread is serving, so that backends can take connections
+from that listener's own pool.
+"""
+
+import logging
+import sys
+
+from eventlet import corolocal
+
+logger = logging.getLogger('keystone.common.sessions')
+
+_scope = corolocal.local()
+_listener = corolocal.local()
+
+
+def begin():
+    """Start a session scope for the current green thread"""
+    _scope.sessions = {}
+    _scope.read_only = set()
+    _scope.written = False
+    _scope.callbacks = []
+
+
+def set_listener(name):
+    """Note which listener the current green thread serves requests of"""
+    _listener.name = name
+
+
+def listener():
+    """Return the listener the current green thread serves, if any"""
+    return getattr(_listener, 'name', None)
+
+
+def in_scope():
+    """Tell whether the current green thread is inside a session scope"""
+    return getattr(_scope, 'sessions', None) is not None
+
+
+def get_session(key, maker, read_only=False):
+    """Return the scope's session for a backend.
+
+    :param key: name identifying the backend
+    :param maker: sessionmaker of the backend
+    :param read_only: roll the session back at the end of the scope
+    :returns: the scope's session for key, or a new session from maker when
+              not inside a scope
+
+    """
+    sessions = getattr(_scope, 'sessions', None)
+    if sessions is None:
+        return maker()
+    session = sessions.get(key)
+    if session is None:
+        session = maker()
+        session.begin()
+        sessions[key] = session
+        if read_only:
+            _scope.read_only.add(key)
+    return session
+
+
+def discard(key):
+    """Roll back and forget the scope's session for key, if any"""
+    sessions = getattr(_scope, 'sessions', None)
+    if not sessions or key not in sessions:
+        return
+    session = sessions.pop(key)
+    try:
+        session.rollback()
+    finally:
+        session.close()
+
+
+def mark_written():
+    """Note that the current scope has written to a primary database"""
+    if in_scope():
+        _scope.written = True
+
+
+def written():
+    """Tell whether the current scope has written to a primary database"""
+    return in_scope() and _scope.written
+
+
+def on_end(callback):
+    """Call callback() when the current scope ends, or now outside a scope"""
+    if not in_scope():
+        callback()
+    elif callback not in _scope.callbacks:
+        _scope.callbacks.append(callback)
+
+
+def _run_callbacks(callbacks):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Session scope callback %s failed" % callback)
+
+
+def end(commit=True):
+    """Close the current scope, committing or rolling back its sessions.
+
+    Each backend commits separately, so a failure to commit one backend
+    rolls back those that have not been committed yet and is re-raised.
+
+    :param commit: False to roll back instead of committing
+
+    """
+    sessions = getattr(_scope, 'sessions', None)
+    read_only = getattr(_scope, 'read_only', set())
+    callbacks = getattr(_scope, 'callbacks', [])
+    _scope.sessions = None
+    _scope.callbacks = []
+    if not sessions:
+        _run_callbacks(callbacks)
+        return
+    error = None
+    for key, session in sessions.items():
+        try:
+            if commit and error is None and key not in read_only:
+                session.commit()
+            else:
+                session.rollback()
+        except Exception:
+            logger.exception("Failed to end session of %s" % key)
+            error = error or sys.exc_info()
+            session.rollback()
+        finally:
+            session.close()
+    _run_callbacks(callbacks)
+    if error is not None:
+        raise error[0], error[1], error[2]
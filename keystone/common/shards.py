@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Stable assignment of keys to shards
+
+A key always maps to the same shard for a given number of shards: the shard
+is picked from an MD5 hash of the key, which unlike hash() does not vary
+between processes or Python builds. Changing the number of shards moves most
+keys, so data placed under the old layout has to be rebalanced.
+"""
+
+import hashlib
+
+
+class ShardMap(object):
+    """Maps keys onto a fixed list of shards"""
+
+    def __init__(self, shards):
+        """
+        :param shards: list of shards, e.g. engines
+        """
+        if not shards:
+            raise ValueError("A ShardMap needs at least one shard")
+        self.shards = list(shards)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def index(self, key):
+        """Return the index of the shard that holds key"""
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        digest = hashlib.md5(str(key)).hexdigest()
+        return int(digest[:8], 16) % len(self.shards)
+
+    def for_key(self, key):
+        """Return the shard that holds key"""
+        return self.shards[self.index(key)]
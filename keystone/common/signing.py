@@ -0,0 +1,170 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Self-contained signed tokens
+
+A signed token has the form '<payload>.<signature>'. The payload is the
+URL-safe base64 encoding of a compact JSON document, and the signature is the
+URL-safe base64 HMAC-SHA256 of the encoded payload. The payload keys are:
+
+    u: user id
+    t: tenant id (may be None)
+    r: list of role ids
+    e: expiry, in seconds since the epoch
+    i: issue time, in seconds since the epoch
+    n: random nonce so that two tokens never share an id
+
+Anybody holding the shared key can check a signed token without a round trip
+to Keystone. It still has to follow Keystone's revocation feed (GET
+/v2.0/revocations) to refuse the tokens revoked since they were issued; a
+Revocations keeps what it has seen of the feed.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+SEPARATOR = '.'
+
+# Revocations older than the longest token lifetime can be forgotten
+REVOCATION_RETENTION = 24 * 60 * 60
+
+
+class InvalidToken(Exception):
+    """Raised when a signed token is malformed, tampered with or expired"""
+    pass
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def _decode(data):
+    return base64.urlsafe_b64decode(str(data) + '=' * (-len(data) % 4))
+
+
+def _signature(payload, key):
+    return _encode(hmac.new(str(key), payload, hashlib.sha256).digest())
+
+
+def _constant_time_compare(first, second):
+    """Compare two strings without leaking where they first differ"""
+    if len(first) != len(second):
+        return False
+    result = 0
+    for x, y in zip(first, second):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def is_signed(token_id):
+    """Tell signed tokens apart from opaque (uuid) ones"""
+    return bool(token_id) and SEPARATOR in token_id
+
+
+def sign(key, user_id, tenant_id, roles, expires):
+    """Build a signed token.
+
+    :param key: the shared signing key
+    :param user_id: id of the user the token is issued to
+    :param tenant_id: id of the tenant the token is scoped to, or None
+    :param roles: list of role ids held by the user
+    :param expires: datetime (local time) at which the token expires
+    :returns: the signed token string
+
+    """
+    payload = {'u': user_id,
+               't': tenant_id,
+               'r': list(roles),
+               'e': int(time.mktime(expires.timetuple())),
+               'i': time.time(),
+               'n': uuid.uuid4().hex[:8]}
+    encoded = _encode(json.dumps(payload, separators=(',', ':')))
+    return SEPARATOR.join((encoded, _signature(encoded, key)))
+
+
+def verify(key, token_id, now=None):
+    """Check a signed token and return its payload.
+
+    :param key: the shared signing key
+    :param token_id: the signed token string
+    :param now: (optional) current time in seconds since the epoch
+    :returns: the payload dict
+    :raises: InvalidToken if the token is malformed, forged or expired
+
+    """
+    try:
+        encoded, signature = str(token_id).split(SEPARATOR)
+    except ValueError:
+        raise InvalidToken("Malformed token")
+
+    if not _constant_time_compare(signature, _signature(encoded, key)):
+        raise InvalidToken("Bad token signature")
+
+    try:
+        payload = json.loads(_decode(encoded))
+        expires = payload['e']
+    except (TypeError, ValueError, KeyError):
+        raise InvalidToken("Malformed token payload")
+
+    if expires < (now or time.time()):
+        raise InvalidToken("Token expired")
+    return payload
+
+
+class Revocations(object):
+    """The revocation events seen so far, by revoked token, user or tenant"""
+
+    def __init__(self):
+        # Keystone time of the last batch, to poll for the events since
+        self.since = 0
+        # (type, id) => time of the latest event for that subject
+        self.latest = {}
+
+    def apply(self, revocations):
+        """Record a batch of the revocation feed.
+
+        :param revocations: the 'revocations' of a feed response
+        :returns: the set of (type, id) subjects the batch revokes
+
+        """
+        revoked = set()
+        for event in revocations['values']:
+            subject = (event['type'], event['id'])
+            self.latest[subject] = max(event['timestamp'],
+                                       self.latest.get(subject, 0))
+            revoked.add(subject)
+
+        cutoff = revocations['now'] - REVOCATION_RETENTION
+        for subject, timestamp in self.latest.items():
+            if timestamp < cutoff:
+                del self.latest[subject]
+        self.since = revocations['now']
+        return revoked
+
+    def is_revoked(self, token_id, payload):
+        """Check a verified signed token against the events seen so far"""
+        if ('token', token_id) in self.latest:
+            return True
+        for subject in (('user', payload['u']), ('tenant', payload['t'])):
+            if self.latest.get(subject, 0) >= payload.get('i', 0):
+                return True
+        return False
@@ -0,0 +1,103 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Coalescing of concurrent calls for the same key
+
+While a call for a key is in flight, other green threads asking for the same
+key wait for its result instead of making the call themselves. A waiter that
+has waited timeout seconds gives up and makes its own call. So does every
+waiter of a call that was interrupted rather than failed, e.g. because its
+green thread was killed.
+
+Calls are reported to keystone.common.metrics as '<name>.calls', callers
+that got the result of another's call as '<name>.coalesced', waiters that
+gave up as '<name>.timeouts' and waiters of an interrupted call as
+'<name>.abandoned'.
+"""
+
+import sys
+
+import eventlet
+from eventlet import event
+
+from keystone.common import metrics
+
+# Sent to the waiters of an interrupted call in place of a result
+_ABANDONED = object()
+
+
+class SingleFlight(object):
+    """At most one call in flight per key"""
+
+    def __init__(self, name, timeout=None):
+        """
+        :param name: name the metrics are reported under
+        :param timeout: seconds a caller waits for another's call, None to
+                        wait as long as it takes
+
+        """
+        self.name = name
+        self.timeout = timeout
+        # key => Event sent the result of the call in flight
+        self.in_flight = {}
+
+    def do(self, key, function, *args):
+        """Return function(*args), or the result of the call for key that
+        is already in flight; exceptions (but not the BaseExceptions that
+        interrupt a call) are passed on to the waiters too"""
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            timeout = eventlet.Timeout(self.timeout)
+            try:
+                result = pending.wait()
+            except eventlet.Timeout, e:
+                if e is not timeout:
+                    raise
+                metrics.increment('%s.timeouts' % self.name)
+                return self._call(None, function, args)
+            finally:
+                timeout.cancel()
+            if result is _ABANDONED:
+                metrics.increment('%s.abandoned' % self.name)
+                return self._call(None, function, args)
+            metrics.increment('%s.coalesced' % self.name)
+            return result
+
+        done = self.in_flight[key] = event.Event()
+        try:
+            return self._call(done, function, args)
+        finally:
+            del self.in_flight[key]
+
+    def _call(self, done, function, args):
+        metrics.increment('%s.calls' % self.name)
+        try:
+            result = function(*args)
+        except Exception:
+            if done is not None:
+                done.send_exception(*sys.exc_info())
+            raise
+        except BaseException:
+            # GreenletExit, Timeout and the like concern the caller alone,
+            # the waiters must not be left hanging but not share them either
+            if done is not None:
+                done.send(_ABANDONED)
+            raise
+        if done is not None:
+            done.send(result)
+        return result
@@ -0,0 +1,259 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Engine construction shared by the SQL backends
+
+create_engine() reads the connection and pool options of a backend section:
+
+    sql_connection      SQLAlchemy connection string
+    sql_idle_timeout    seconds after which connections are recycled
+    sql_pool_size       connections kept open in the pool
+    sql_max_overflow    connections allowed on top of sql_pool_size
+    sql_pool_timeout    seconds to wait for a connection before giving up
+    sql_pool_pre_ping   test connections on checkout and replace dead ones
+
+and, for SQLite databases, the pragmas applied to every new connection:
+
+    sqlite_journal_mode   e.g. WAL, so that readers don't wait for writers
+    sqlite_synchronous    e.g. NORMAL, which is safe in WAL mode
+    sqlite_busy_timeout   milliseconds to retry on a locked database
+    sqlite_mmap_size      bytes of the database file to memory map
+
+SQLite file databases are not pooled unless sql_pool_size is set. Pool options
+are ignored for in-memory SQLite databases, which live in a single connection.
+
+Every engine reports '<name>.pool.checkout_wait' timings and
+'<name>.pool.checked_out' and '<name>.pool.utilization' gauges to
+keystone.common.metrics.
+
+create_listener_engines() gives a server listener a pool of its own when
+any of the pool options is set for it with the listener's prefix, e.g.
+admin_sql_pool_size, so that one listener's load can't exhaust the
+connections of the other.
+
+in_chunks() splits the ids of an IN query into lists of at most MAX_IN_IDS,
+so that a query made of one or two of them stays below SQLite's default
+limit of 999 bound parameters.
+"""
+
+import logging
+import time
+import weakref
+
+import sqlalchemy
+from sqlalchemy import event, exc, pool
+from sqlalchemy.engine import url as sql_url
+
+from keystone.common import config
+from keystone.common import metrics
+
+logger = logging.getLogger('keystone.common.sqlengine')
+
+SQLITE_PRAGMAS = [('sqlite_journal_mode', 'journal_mode', 'str'),
+                  ('sqlite_synchronous', 'synchronous', 'str'),
+                  ('sqlite_busy_timeout', 'busy_timeout', 'int'),
+                  ('sqlite_mmap_size', 'mmap_size', 'int')]
+
+# Server listeners, and the pool options they can override
+LISTENERS = ('service', 'admin')
+LISTENER_POOL_OPTIONS = ('sql_pool_size', 'sql_max_overflow',
+                         'sql_pool_timeout')
+
+# Ids bound by a single IN list
+MAX_IN_IDS = 400
+
+# Every engine created, to be disposed of before forking
+_engines = weakref.WeakSet()
+
+
+def _instrumented(poolclass, name):
+    """Subclass poolclass to time connection checkouts under name"""
+
+    def _timed(checkout):
+        def timed_checkout(self):
+            start = time.time()
+            try:
+                return checkout(self)
+            finally:
+                metrics.timing('%s.pool.checkout_wait' % name,
+                               time.time() - start)
+        return timed_checkout
+
+    # pool.recreate() builds the replacement pool from self.__class__, so
+    # the instrumentation survives dispose()
+    return type('Instrumented%s' % poolclass.__name__, (poolclass,),
+                {'connect': _timed(poolclass.connect),
+                 'unique_connection': _timed(poolclass.unique_connection)})
+
+
+def _pool_capacity(engine_pool):
+    if isinstance(engine_pool, pool.QueuePool):
+        overflow = max(engine_pool._max_overflow, 0)
+        return engine_pool.size() + overflow
+    if isinstance(engine_pool, (pool.SingletonThreadPool, pool.StaticPool)):
+        return 1
+    return None
+
+
+def _track_utilization(engine, name):
+    state = {'checked_out': 0}
+
+    def report():
+        metrics.gauge('%s.pool.checked_out' % name, state['checked_out'])
+        capacity = _pool_capacity(engine.pool)
+        if capacity:
+            metrics.gauge('%s.pool.utilization' % name,
+                          float(state['checked_out']) / capacity)
+
+    def on_checkout(dbapi_connection, record, proxy):
+        state['checked_out'] += 1
+        report()
+
+    def on_checkin(dbapi_connection, record):
+        state['checked_out'] = max(state['checked_out'] - 1, 0)
+        report()
+
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', on_checkin)
+
+
+def _ping(dbapi_connection, record, proxy):
+    """Make the pool replace connections the database has dropped"""
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+    except Exception:
+        # The pool retries the checkout with a new connection
+        raise exc.DisconnectionError()
+
+
+def _sqlite_pragmas(options):
+    pragmas = []
+    for option, pragma, type_ in SQLITE_PRAGMAS:
+        value = config.get_option(options, option, type=type_, default=None)
+        if value is not None and value != '':
+            pragmas.append("PRAGMA %s = %s" % (pragma, value))
+    return pragmas
+
+
+def create_engine(name, options):
+    """Create the engine of a SQL backend.
+
+    :param name: name the engine's metrics are reported under
+    :param options: the backend's configuration section
+    :returns: a SQLAlchemy engine
+
+    """
+    connection = options['sql_connection']
+    url = sql_url.make_url(connection)
+    is_sqlite = url.drivername.startswith('sqlite')
+    in_memory = is_sqlite and url.database in (None, '', ':memory:')
+
+    kwargs = {'pool_recycle': config.get_option(options, 'sql_idle_timeout',
+                                                type='int', default=3600)}
+    pool_size = config.get_option(options, 'sql_pool_size', type='int',
+                                  default=None)
+    if in_memory:
+        poolclass = pool.SingletonThreadPool
+    elif is_sqlite and pool_size is None:
+        poolclass = pool.NullPool
+    else:
+        poolclass = pool.QueuePool
+        if is_sqlite:
+            # Pooled connections move between green threads
+            kwargs['connect_args'] = {'check_same_thread': False}
+        if pool_size is not None:
+            kwargs['pool_size'] = pool_size
+        for option, arg in (('sql_max_overflow', 'max_overflow'),
+                            ('sql_pool_timeout', 'pool_timeout')):
+            value = config.get_option(options, option, type='int',
+                                      default=None)
+            if value is not None:
+                kwargs[arg] = value
+    kwargs['poolclass'] = _instrumented(poolclass, name)
+
+    engine = sqlalchemy.create_engine(connection, **kwargs)
+
+    if is_sqlite:
+        pragmas = _sqlite_pragmas(options)
+        if pragmas:
+            def on_connect(dbapi_connection, record):
+                cursor = dbapi_connection.cursor()
+                try:
+                    for pragma in pragmas:
+                        cursor.execute(pragma)
+                finally:
+                    cursor.close()
+            event.listen(engine, 'connect', on_connect)
+
+    if config.get_option(options, 'sql_pool_pre_ping', type='bool',
+                         default=False):
+        event.listen(engine, 'checkout', _ping)
+
+    _track_utilization(engine, name)
+    _engines.add(engine)
+    logger.debug("Created %s engine with pool %s" % (name, engine.pool))
+    return engine
+
+
+def _is_in_memory(options):
+    url = sql_url.make_url(options['sql_connection'])
+    return url.drivername.startswith('sqlite') and \
+        url.database in (None, '', ':memory:')
+
+
+def create_listener_engines(name, options):
+    """Create the engines of the listeners given a pool of their own.
+
+    :param name: name of the backend's engine
+    :param options: the backend's configuration section
+    :returns: dict of listener name to engine, for the listeners that have
+              one of LISTENER_POOL_OPTIONS set with their prefix
+
+    """
+    engines = {}
+    for listener in LISTENERS:
+        overrides = dict((option, options['%s_%s' % (listener, option)])
+                         for option in LISTENER_POOL_OPTIONS
+                         if '%s_%s' % (listener, option) in options)
+        if not overrides:
+            continue
+        if _is_in_memory(options):
+            logger.warning("In-memory databases can't have a pool per "
+                           "listener; ignoring the %s pool of %s" %
+                           (listener, name))
+            continue
+        listener_options = dict(options)
+        listener_options.update(overrides)
+        engines[listener] = create_engine('%s.%s' % (name, listener),
+                                          listener_options)
+    return engines
+
+
+def dispose_all():
+    """Close the pooled connections of every engine, so that processes
+    forked afterwards don't share them"""
+    for engine in list(_engines):
+        engine.dispose()
+
+
+def in_chunks(ids, size=MAX_IN_IDS):
+    """Split ids into lists of at most size, for one IN list each"""
+    ids = list(ids)
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
@@ -21,17 +21,46 @@
 Utility methods for working with WSGI servers
 """
 
+import collections
 import json
 import logging
+import os
+import re
+import signal
 import sys
 import datetime
+import time
+import traceback
+import weakref
 
+import eventlet.event
+import eventlet.hubs
 import eventlet.wsgi
 eventlet.patcher.monkey_patch(all=False, socket=True)
+import greenlet
 import routes.middleware
 import webob.dec
 import webob.exc
 
+from keystone.common import metrics
+from keystone.common import sessions
+
+logger = logging.getLogger('keystone.common.wsgi')
+
+# Token issuance and validation, and legacy logins, are served first when
+# capacity is scarce
+PRIORITY_PATH = re.compile(r'^(/v[0-9.]+)?/tokens(/|\.|$)')
+
+# Hub blocks are also counted by duration, as 'hub.blocks.over_<ms>ms'
+BLOCK_BUCKETS = (0.1, 0.5, 1, 5)
+
+# The watchdog's own thread must be a real one, whatever is monkey patched
+_threading = eventlet.patcher.original('threading')
+_time = eventlet.patcher.original('time')
+
+# This process's HubWatchdog, see watch_hub()
+_watchdog = None
+
 def find_stream_handler(logger):
     """Returns a stream handler, if any"""
     for handler in logger.handlers:
@@ -79,30 +108,448 @@ def run_server(application, port):
     eventlet.wsgi.server(sock, application)
 
 
+def is_priority(env):
+    """Whether a request authenticates or validates a token"""
+    return bool(PRIORITY_PATH.match(env.get('PATH_INFO', ''))) or \
+        'HTTP_X_AUTH_USER' in env
+
+
+class _Admitted(object):
+    """Response of an admitted request, giving its slot back once the
+    server is done with it"""
+
+    def __init__(self, result, release):
+        self.result = result
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.result)
+
+    def close(self):
+        try:
+            if hasattr(self.result, 'close'):
+                self.result.close()
+        finally:
+            if self.release is not None:
+                self.release()
+                self.release = None
+
+
+class Admission(object):
+    """Admission control in front of a listener's application.
+
+    At most max_concurrency requests are handed to the application at a
+    time, the last priority_reserve of those slots being kept for priority
+    requests (see is_priority). Up to max_queue more requests wait for a
+    slot, each for at most max_queue_time seconds; priority ones are
+    admitted first and, when the queue is full, take the place of the most
+    recent ordinary request. Requests that can't be admitted get a 503 with
+    a Retry-After of retry_after seconds.
+
+    Metrics are reported as '<name>.admission.*'.
+
+    """
+
+    def __init__(self, application, name, max_concurrency, max_queue=0,
+                 max_queue_time=5, retry_after=1, priority_reserve=0,
+                 is_priority=is_priority):
+        self.application = application
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.retry_after = retry_after
+        self.priority_reserve = min(priority_reserve, max_concurrency - 1)
+        self.is_priority = is_priority
+
+        self.in_flight = 0
+        # Events of the waiting requests, by priority, oldest first
+        self.waiting = {True: collections.deque(),
+                        False: collections.deque()}
+
+    def __call__(self, env, start_response):
+        if not self._admit(self.is_priority(env)):
+            return self._shed(env, start_response)
+        try:
+            result = self.application(env, start_response)
+        except:
+            self._release()
+            raise
+        return _Admitted(result, self._release)
+
+    def _has_room(self, priority):
+        limit = self.max_concurrency
+        if not priority:
+            limit -= self.priority_reserve
+        return self.in_flight < limit
+
+    def _queued(self):
+        return len(self.waiting[True]) + len(self.waiting[False])
+
+    def _report(self):
+        metrics.gauge('%s.admission.in_flight' % self.name, self.in_flight)
+        metrics.gauge('%s.admission.queued' % self.name, self._queued())
+
+    def _admit(self, priority):
+        """Take a slot, waiting for one if need be.
+
+        :returns: whether the request was admitted
+
+        """
+        if self._has_room(priority) and not self.waiting[True] and \
+                (priority or not self.waiting[False]):
+            self.in_flight += 1
+            self._report()
+            return True
+
+        if self._queued() >= self.max_queue:
+            if not priority or not self.waiting[False]:
+                return False
+            # Make room by shedding the most recent ordinary request
+            self.waiting[False].pop().send(False)
+
+        event = eventlet.event.Event()
+        self.waiting[priority].append(event)
+        self._report()
+        start = time.time()
+        with eventlet.Timeout(self.max_queue_time, False):
+            event.wait()
+        metrics.timing('%s.admission.queue_wait' % self.name,
+                       time.time() - start)
+        if not event.ready():
+            # Timed out
+            self.waiting[priority].remove(event)
+            self._report()
+            return False
+        # _release() took the slot on our behalf
+        return event.wait()
+
+    def _release(self):
+        self.in_flight -= 1
+        for priority in (True, False):
+            while self.waiting[priority] and self._has_room(priority):
+                self.in_flight += 1
+                self.waiting[priority].popleft().send(True)
+        self._report()
+
+    def _shed(self, env, start_response):
+        metrics.increment('%s.admission.shed' % self.name)
+        response = webob.exc.HTTPServiceUnavailable(
+            headers=[('Retry-After', str(self.retry_after))])
+        return response(env, start_response)
+
+
+# Backends keeping their data in the memory of the process, which the
+# workers of a listener would not share
+PROCESS_LOCAL_BACKENDS = ('keystone.backends.memory',)
+
+
+def listener_options(conf, name):
+    """Read the options of the listener `name` ('service' or 'admin') from
+    keystone.conf, as keyword arguments to Server.start().
+
+    :raises RuntimeError: if the listener has workers but a backend keeps
+                          its data in process memory, or if the admin
+                          listener has workers while the revocation feed,
+                          which each process logs for itself, is served
+
+    """
+    options = {'name': name}
+    for option, type_, default in (('backlog', int, 128),
+                                   ('threads', int, 0),
+                                   ('workers', int, 0),
+                                   ('max_concurrency', int, 0),
+                                   ('max_queue', int, 0),
+                                   ('max_queue_time', float, 5),
+                                   ('retry_after', int, 1),
+                                   ('priority_reserve', int, 0)):
+        options[option] = type_(conf.get('%s_%s' % (name, option), default))
+    if options['workers']:
+        backends = [backend.strip()
+                    for backend in conf.get('backends', '').split(',')]
+        for backend in PROCESS_LOCAL_BACKENDS:
+            if backend in backends:
+                raise RuntimeError("%s_workers can't be used with %s, as "
+                                   "its workers would not share its data" %
+                                   (name, backend))
+        # Revocation events are logged by the process serving the admin call
+        # that causes them
+        if name == 'admin' and \
+                str(conf.get('revocation_feed', True)).lower() == 'true':
+            raise RuntimeError("admin_workers can't be used with the "
+                               "revocation feed, as its workers would not "
+                               "share their revocation events; set "
+                               "revocation_feed = False to use them")
+    return options
+
+
+class HubWatchdog(object):
+    """Reports green threads that keep the hub from running the others.
+
+    A green thread beats every interval seconds (by default a quarter of
+    threshold) and a native thread watches the beats. When the hub hasn't
+    cycled for threshold seconds, the watcher logs the stack of the green
+    thread holding the hub and the request it is serving, once per block.
+    Once the hub is back, the block's duration is counted in 'hub.blocks'
+    and the BLOCK_BUCKETS counters and recorded as the 'hub.blocked' timing.
+
+    To know which green thread runs, every switch goes through a greenlet
+    trace function, which costs little compared to the switch itself.
+
+    """
+
+    def __init__(self, threshold, interval=None):
+        self.threshold = threshold
+        self.interval = interval or threshold / 4.0
+        self.pid = os.getpid()
+        self.last_beat = time.time()
+        # Green thread the hub switched to last
+        self.running = None
+        # Green thread -> WSGI environ of the request it serves
+        self.requests = weakref.WeakKeyDictionary()
+        self.reported = False
+        self.stopped = False
+        self.thread_id = None
+        self.heart = None
+        self.watcher = None
+        self.previous_trace = None
+
+    def start(self):
+        self.thread_id = _threading.current_thread().ident
+        self.previous_trace = greenlet.settrace(self._trace)
+        owner = getattr(self.previous_trace, 'im_self', None)
+        if isinstance(owner, HubWatchdog):
+            # Left over from the process we were forked from
+            self.previous_trace = owner.previous_trace
+        self.heart = eventlet.spawn(self._beat)
+        self.watcher = _threading.Thread(target=self._watch,
+                                         name='hub-watchdog')
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def stop(self):
+        self.stopped = True
+        if self.heart is not None:
+            self.heart.kill()
+        if self.watcher is not None:
+            self.watcher.join()
+        greenlet.settrace(self.previous_trace)
+
+    def serving(self, env):
+        """Note the request the current green thread serves"""
+        self.requests[greenlet.getcurrent()] = env
+
+    def _trace(self, event, args):
+        if event in ('switch', 'throw'):
+            self.running = args[1]
+        if self.previous_trace is not None:
+            self.previous_trace(event, args)
+
+    def _beat(self):
+        while True:
+            before = time.time()
+            eventlet.sleep(self.interval)
+            self.last_beat = time.time()
+            blocked = self.last_beat - before - self.interval
+            self.reported = False
+            if blocked >= self.threshold:
+                self._record(blocked)
+
+    def _record(self, blocked):
+        metrics.increment('hub.blocks')
+        metrics.timing('hub.blocked', blocked)
+        for bucket in BLOCK_BUCKETS:
+            if blocked >= bucket:
+                metrics.increment('hub.blocks.over_%dms' % (bucket * 1000))
+        logger.warning("Hub was blocked for %.3fs" % blocked)
+
+    def _watch(self):
+        # Module globals may be gone when the interpreter exits under us
+        sleep, now = _time.sleep, time.time
+        while not self.stopped:
+            sleep(self.interval)
+            stalled = now() - self.last_beat - self.interval
+            if stalled >= self.threshold and not self.reported and \
+                    not self.stopped:
+                self.reported = True
+                self._report(stalled)
+
+    def _route(self, running):
+        """Describe the request the green thread running serves"""
+        env = self.requests.get(running) if running is not None else None
+        if env is None:
+            return 'no request'
+        route = '%s %s' % (env.get('REQUEST_METHOD'), env.get('PATH_INFO'))
+        match = (env.get('wsgiorg.routing_args') or ((), {}))[1]
+        if match and match.get('action'):
+            route += ' (%s.%s)' % (type(match.get('controller')).__name__,
+                                   match['action'])
+        return route
+
+    def _report(self, stalled):
+        running = self.running
+        frame = sys._current_frames().get(self.thread_id)
+        stack = frame and ''.join(traceback.format_stack(frame)) or ''
+        logger.error("Hub blocked for %.3fs so far by %s serving %s:\n%s" %
+                     (stalled, running, self._route(running), stack))
+
+
+def watch_hub(threshold):
+    """Start this process's HubWatchdog, unless it is running already.
+
+    :param threshold: seconds the hub may go without cycling
+    :returns: the watchdog
+
+    """
+    global _watchdog
+    if _watchdog is None or _watchdog.pid != os.getpid():
+        _watchdog = HubWatchdog(threshold)
+        _watchdog.start()
+    return _watchdog
+
+
+def _watched(application):
+    """Wrap application to tell the watchdog about its requests"""
+    def watched_app(env, start_response):
+        if _watchdog is not None:
+            _watchdog.serving(env)
+        return application(env, start_response)
+    return watched_app
+
+
+def _serving(name, application):
+    """Wrap application to note the listener its requests arrive on"""
+    def listener_app(env, start_response):
+        sessions.set_listener(name)
+        return application(env, start_response)
+    return listener_app
+
+
 class Server(object):
-    """Server class to manage multiple WSGI sockets and applications."""
+    """Server class to manage multiple WSGI sockets and applications.
 
-    def __init__(self, threads=1000):
+    A listener started with threads serves its connections from a green pool
+    of that size, otherwise from the server's. A listener started with
+    workers is served by that many forked processes instead of this one,
+    each with a hub of its own; those that die are restarted.
+
+    With watchdog_threshold set, every process serving requests runs a
+    HubWatchdog.
+
+    """
+
+    def __init__(self, threads=1000, watchdog_threshold=0):
         self.pool = eventlet.GreenPool(threads)
+        self.watchdog_threshold = watchdog_threshold
+        self.sockets = []
+        # pid of each worker process -> (application, socket, threads)
+        self.workers = {}
+        self.supervisor = None
 
-    def start(self, application, port, host='0.0.0.0', backlog=128):
-        """Run a WSGI server with the given application."""
+    def start(self, application, port, host='0.0.0.0', backlog=128,
+              name=None, threads=0, workers=0, max_concurrency=0,
+              **admission):
+        """Run a WSGI server with the given application.
+
+        With max_concurrency set, requests go through Admission, which
+        takes the other keyword arguments. Requests are marked as coming
+        from listener name, see keystone.common.sessions.
+
+        """
+        if max_concurrency:
+            application = Admission(application, name or str(port),
+                                    max_concurrency, **admission)
+        if name:
+            application = _serving(name, application)
+        if self.watchdog_threshold:
+            application = _watched(application)
         socket = eventlet.listen((host, port), backlog=backlog)
-        self.pool.spawn_n(self._run, application, socket)
+        self.sockets.append(socket)
+        if not workers:
+            if self.watchdog_threshold:
+                watch_hub(self.watchdog_threshold)
+            pool = threads and eventlet.GreenPool(threads) or self.pool
+            self.pool.spawn_n(self._run, application, socket, pool)
+            return
+
+        # Imported here as sqlengine depends on this module through config
+        from keystone.common import sqlengine
+        # The workers must not share the connections pooled so far
+        sqlengine.dispose_all()
+        for _i in range(workers):
+            self._fork(application, socket, threads)
+        if self.supervisor is None:
+            self.supervisor = self.pool.spawn(self._supervise)
+
+    def stop(self):
+        """Terminate the worker processes and close their sockets"""
+        if self.supervisor is not None:
+            self.supervisor.kill()
+            self.supervisor = None
+        sockets = set()
+        for pid, (_application, socket, _threads) in self.workers.items():
+            sockets.add(socket)
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.workers.clear()
+        for socket in sockets:
+            socket.close()
 
     def wait(self):
         """Wait until all servers have completed running."""
         try:
             self.pool.waitall()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _fork(self, application, socket, threads):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = (application, socket, threads)
+            return
+        try:
+            # Drop the parent's hub and whatever it had scheduled
+            eventlet.hubs.use_hub()
+            if self.watchdog_threshold:
+                watch_hub(self.watchdog_threshold)
+            pool = eventlet.GreenPool(threads or self.pool.size)
+            self._run(application, socket, pool)
         except KeyboardInterrupt:
             pass
+        except Exception:
+            logger.exception("Worker %s failed" % os.getpid())
+        finally:
+            os._exit(0)
 
-    def _run(self, application, socket):
+    def _supervise(self):
+        """Restart the worker processes that exit, checking every second.
+
+        Only this server's workers are waited for, as waiting for any child
+        would reap those of the other servers of the process.
+
+        """
+        while self.workers:
+            for pid in self.workers.keys():
+                try:
+                    exited, status = os.waitpid(pid, os.WNOHANG)
+                except OSError, e:
+                    # Reaped by someone else, its status is lost
+                    exited, status = pid, e
+                if exited:
+                    logger.warning("Worker %s exited with status %s; "
+                                   "restarting it" % (pid, status))
+                    self._fork(*self.workers.pop(pid))
+            eventlet.sleep(1)
+
+    def _run(self, application, socket, pool):
         """Start a WSGI server in a new green thread."""
         logger = logging.getLogger('eventlet.wsgi.server')
         # TODO(Ziad): figure out why root logger is not set to same level as
         # caller. Maybe something to do with paste?
-        eventlet.wsgi.server(socket, application, custom_pool=self.pool,
+        eventlet.wsgi.server(socket, application, custom_pool=pool,
                              log=WritableLogger(logger, logging.root.level))
 
 
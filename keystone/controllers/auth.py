@@ -1,6 +1,8 @@
 from keystone import utils
 from keystone.common import wsgi
-from keystone.logic.types.auth import PasswordCredentials
+from keystone.logic.types import fault
+from keystone.logic.types.auth import PasswordCredentials, \
+    TokenValidationRequests
 import keystone.config as config
 
 class AuthController(wsgi.Controller):
@@ -22,12 +24,49 @@ class AuthController(wsgi.Controller):
     def validate_token(self, req, token_id):
         belongs_to = req.GET["belongsTo"] if "belongsTo" in req.GET else None
         
-        rval = config.SERVICE.validate_token(
-            utils.get_auth_token(req), token_id, belongs_to)
+        if utils.is_xml_response(req):
+            content_type = "application/xml"
+        else:
+            content_type = "application/json"
+        content = config.SERVICE.get_validation(
+            utils.get_auth_token(req), token_id, belongs_to, content_type)
 
-        return utils.send_result(200, req, rval)
+        return utils.send_content(200, content_type, content)
+
+    @utils.wrap_error
+    def check_token(self, req, token_id):
+        belongs_to = req.GET["belongsTo"] if "belongsTo" in req.GET else None
+
+        try:
+            rval = config.SERVICE.check_token(
+                utils.get_auth_token(req), token_id, belongs_to)
+        except fault.IdentityFault as e:
+            # A HEAD response has no body, so don't serialize the fault
+            return utils.send_result(e.code, req, None)
+
+        headers = {"X-Subject-Token": rval.token.id,
+                   "X-Subject-User": rval.user.username,
+                   "X-Subject-Expires": rval.token.expires.isoformat()}
+        # The tenant the token is scoped to, as GET reports it
+        if rval.token.tenant_id:
+            headers["X-Subject-Tenant"] = rval.token.tenant_id
+        return utils.send_legacy_result(200, headers)
 
     @utils.wrap_error
     def delete_token(self, req, token_id):
         return utils.send_result(204, req,
             config.SERVICE.revoke_token(utils.get_auth_token(req), token_id))
+
+    @utils.wrap_error
+    def get_revocations(self, req):
+        rval = config.SERVICE.get_revocations(utils.get_auth_token(req),
+                                              req.GET.get("since"))
+        return utils.send_result(200, req, rval)
+
+    @utils.wrap_error
+    def validate_tokens(self, req):
+        token_requests = utils.get_normalized_request_content(
+            TokenValidationRequests, req)
+        rval = config.SERVICE.validate_tokens(utils.get_auth_token(req),
+                                              token_requests)
+        return utils.send_result(200, req, rval)
@@ -0,0 +1,15 @@
+from keystone import utils
+from keystone.common import wsgi
+import keystone.config as config
+
+
+class MetricsController(wsgi.Controller):
+    """Controller for the in-process metrics"""
+
+    def __init__(self, options):
+        self.options = options
+
+    @utils.wrap_error
+    def get_metrics(self, req):
+        return utils.send_result(200, req,
+            config.SERVICE.get_metrics(utils.get_auth_token(req)))
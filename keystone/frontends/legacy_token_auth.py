@@ -21,14 +21,17 @@ RACKSPACE LEGACY AUTH - STUB
 
 This WSGI component
 - transforms rackspace auth header credentials to keystone credentials
-and makes an authentication call on keystone.- transforms response it
-receives into custom headers defined in properties and returns
+and authenticates them with the identity service.- transforms the
+authentication data into custom headers defined in properties and returns
 the response.
+
+The service catalog is mapped to headers with 'service-header-mappings', a
+dict of service name to header name read once at startup. Services that are
+not mapped get an X-<SERVICE NAME> header.
 """
 
 import os
 import sys
-import json
 import ast
 
 from webob.exc import Request
@@ -40,6 +43,8 @@ POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
 if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'keystone', '__init__.py')):
     sys.path.insert(0, POSSIBLE_TOPDIR)
 
+import keystone.config as config
+from keystone.logic.types.auth import PasswordCredentials
 import keystone.utils as utils
 
 PROTOCOL_NAME = "Legacy Authentication"
@@ -53,67 +58,51 @@ class AuthProtocol(object):
         print "Starting the %s component" % PROTOCOL_NAME
         self.conf = conf
         self.app = app
-        self.start_response = None
-        self.env = None
-        self.request = None
+        # service name => header carrying its endpoints
+        self.service_mappings = ast.literal_eval(
+            conf.get("service-header-mappings", "{}"))
 
     # Handle 1.0 and 1.1 calls via middleware.
     # Right now I am treating every call of 1.0 and 1.1 as call
     # to authenticate
     def __call__(self, env, start_response):
         """ Handle incoming request. Transform. And send downstream. """
-        self.start_response = start_response
-        self.env = env
-        self.request = Request(env)
-        if self.request.path.startswith('/v1.0'
-                ) or self.request.path.startswith('/v1.1'):
-            params = {"passwordCredentials":
-                {"username": utils.get_auth_user(self.request),
-                    "password": utils.get_auth_key(self.request)}}
-            #Make request to keystone
-            new_request = Request.blank('/v2.0/tokens')
-            new_request.method = 'POST'
-            new_request.headers['Content-type'] = 'application/json'
-            new_request.accept = 'text/json'
-            new_request.body = json.dumps(params)
-            response = new_request.get_response(self.app)
-            #Handle failures.
-            if not str(response.status).startswith('20'):
-                return response(env, start_response)
-            headers = self.__transform_headers(
-                json.loads(response.body))
-            resp = utils.send_legacy_result(204, headers)
-            return resp(env, start_response)
+        path = env.get('PATH_INFO', '')
+        if path.startswith('/v1.0') or path.startswith('/v1.1'):
+            request = Request(env)
+            return self._authenticate(req=request)(env, start_response)
         else:
             # Other calls pass to downstream WSGI component
-            return self.app(self.env, self.start_response)
-
-    def __transform_headers(self, content):
-        """Transform Keystone auth to legacy headers"""
-        headers = {}
-        if "auth" in content:
-            auth = content["auth"]
-            if "token" in auth:
-                headers["X-Auth-Token"] = auth["token"]["id"]
-            if "serviceCatalog" in auth:
-                services = auth["serviceCatalog"]
-                service_mappings = ast.literal_eval(
-                    self.conf["service-header-mappings"])
-                for service in services:
-                    service_name = service
-                    service_urls = ''
-                    for endpoint in services[service_name]:
-                        if len(service_urls) > 0:
-                            service_urls += ','
-                        service_urls += endpoint["publicURL"]
-                    if len(service_urls) > 0:
-                        if service_mappings.get(service_name):
-                            headers[service_mappings.get(
-                                service_name)] = service_urls
-                        else:
-                            #For Services that are not mapped,
-                            #use X- prefix followed by service name.
-                            headers['X-' + service_name.upper()] = service_urls
+            return self.app(env, start_response)
+
+    @utils.wrap_error
+    def _authenticate(self, req):
+        """Authenticate the legacy credentials with the identity service"""
+        credentials = PasswordCredentials(utils.get_auth_user(req),
+                                          utils.get_auth_key(req), None)
+        auth_data = config.SERVICE.authenticate(credentials)
+        return utils.send_legacy_result(204,
+                                        self._transform_headers(auth_data))
+
+    def _header_name(self, service_name):
+        header = self.service_mappings.get(service_name)
+        if not header:
+            #For Services that are not mapped,
+            #use X- prefix followed by service name.
+            header = self.service_mappings[service_name] = \
+                'X-' + service_name.upper()
+        return header
+
+    def _transform_headers(self, auth_data):
+        """Transform Keystone auth data to legacy headers"""
+        headers = {"X-Auth-Token": auth_data.token.id}
+        tenant_id = auth_data.token.tenant_id
+        for service_name, base_urls in auth_data.d.iteritems():
+            service_urls = ','.join(
+                base_url.public_url.replace('%tenant_id%', tenant_id)
+                for base_url in base_urls if base_url.public_url)
+            if service_urls:
+                headers[self._header_name(service_name)] = service_urls
         return headers
 
 
@@ -0,0 +1,92 @@
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Time indexed log of revocation events
+
+Every change that invalidates tokens which may already be cached elsewhere
+(a revoked token, a disabled or deleted user, a disabled or deleted tenant,
+a removed role grant) is appended here as a (timestamp, type, id) event.
+Remote middleware polls for the events since its last poll and purges the
+matching cache entries.
+
+The log lives in memory and only keeps 'retention' seconds of events. A
+reader asking for events older than that gets a truncated result and must
+drop its whole cache.
+"""
+
+import bisect
+import threading
+import time
+
+TOKEN = 'token'
+USER = 'user'
+TENANT = 'tenant'
+EVENT_TYPES = (TOKEN, USER, TENANT)
+
+# Tokens live for a day, so older events can no longer matter
+DEFAULT_RETENTION = 24 * 60 * 60
+
+
+class RevocationLog(object):
+    """Bounded, time ordered list of revocation events"""
+
+    def __init__(self, retention=DEFAULT_RETENTION):
+        self.retention = retention
+        # Parallel lists so the timestamps can be bisected directly
+        self.timestamps = []
+        self.events = []
+        # Anything before this time may have been dropped
+        self.start = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, event_type, entity_id):
+        """Append an event for a token, user or tenant"""
+        if event_type not in EVENT_TYPES:
+            raise ValueError("Unknown revocation event type '%s'" %
+                             event_type)
+        with self.lock:
+            now = time.time()
+            if self.timestamps and now < self.timestamps[-1]:
+                # Keep the log ordered should the clock step back
+                now = self.timestamps[-1]
+            self.timestamps.append(now)
+            self.events.append((now, event_type, entity_id))
+            self._expire(now)
+
+    def since(self, timestamp):
+        """Return the events recorded at or after a point in time.
+
+        :param timestamp: seconds since the epoch, as returned in 'now' by a
+                          previous call
+        :returns: tuple of (events, now, truncated). 'now' is the timestamp
+                  to pass on the next call and 'truncated' is True if events
+                  from before the retention window may be missing.
+
+        """
+        with self.lock:
+            now = time.time()
+            self._expire(now)
+            index = bisect.bisect_left(self.timestamps, timestamp)
+            return (self.events[index:], now, timestamp < self.start)
+
+    def _expire(self, now):
+        """Drop events that fell out of the retention window"""
+        cutoff = now - self.retention
+        index = bisect.bisect_left(self.timestamps, cutoff)
+        if index:
+            del self.timestamps[:index]
+            del self.events[:index]
+            self.start = cutoff
@@ -14,8 +14,14 @@
 # limitations under the License.
 
 from datetime import datetime, timedelta
+import logging
+import time
 import uuid
 
+from keystone.common import metrics
+from keystone.common import signing
+from keystone.logic import revocation
+from keystone.logic import validation_cache
 from keystone.logic.types import auth, atom
 import keystone.backends as backends
 import keystone.backends.api as api
@@ -27,12 +33,51 @@ from keystone.logic.types.role import Role, RoleRef, RoleRefs, Roles
 from keystone.logic.types.user import User, User_Update, Users
 from keystone.logic.types.endpoint import Endpoint, Endpoints, \
     EndpointTemplate, EndpointTemplates
+from keystone.logic.types.metrics import Metrics
 import keystone.utils as utils
 
+logger = logging.getLogger('keystone.logic.service')
+
+# Token ids are stored in String(255) columns
+MAX_TOKEN_LENGTH = 255
+
+# Largest batch accepted by validate_tokens. The backends split the ids of
+# its queries (up to twice as many tenants as tokens) into IN lists short
+# enough for SQLite's default limit of 999 bound parameters.
+MAX_BULK_VALIDATIONS = 500
+
 
 class IdentityService(object):
     """Implements Identity service"""
 
+    def __init__(self):
+        # Key used to sign self-contained tokens, None issues uuid tokens
+        self.token_signing_key = None
+        # Changes that invalidate tokens cached outside of Keystone, and
+        # whether GET /v2.0/revocations serves them
+        self.revocations = revocation.RevocationLog()
+        self.revocation_feed = True
+        # Serialized validate_token answers
+        self.validations = validation_cache.ValidationCache()
+
+    def configure(self, options):
+        """Apply the service wide options from the [DEFAULT] section"""
+        self.validations.ttl = int(options.get('validation_cache_ttl', 0))
+        self.validations.size = int(options.get('validation_cache_size',
+                                                validation_cache.DEFAULT_SIZE))
+        self.revocation_feed = str(options.get('revocation_feed',
+                                               True)).lower() == 'true'
+        token_format = options.get('token_format', 'uuid')
+        if token_format == 'signed':
+            if not options.get('token_signing_key'):
+                raise ValueError("token_format 'signed' requires "
+                                 "token_signing_key to be set")
+            self.token_signing_key = options['token_signing_key']
+        elif token_format == 'uuid':
+            self.token_signing_key = None
+        else:
+            raise ValueError("Unknown token_format '%s'" % token_format)
+
     #
     #  Token Operations
     #
@@ -68,14 +113,17 @@ class IdentityService(object):
         
         tenant_id = credentials.tenant_id or duser.tenant_id
         
-        if not dtoken or dtoken.expires < datetime.now():
+        # A signed token carries the roles it was issued with, so hand out
+        # a freshly signed one rather than reusing an earlier token
+        if not dtoken or dtoken.expires < datetime.now() or \
+                self.token_signing_key:
             # Create new token
             dtoken = models.Token()
-            dtoken.id = str(uuid.uuid4())
             dtoken.user_id = duser.id
             if credentials.tenant_id:
                 dtoken.tenant_id = credentials.tenant_id
             dtoken.expires = datetime.now() + timedelta(days=1)
+            dtoken.id = self.__new_token_id(duser, dtoken)
             api.token.create(dtoken)
         #if tenant_id is passed in the call that tenant_id is passed else
         #user's default tenant_id is used.
@@ -91,6 +139,99 @@ class IdentityService(object):
         
         return self.__get_validate_data(token, user)
 
+    def get_validation(self, admin_token, token_id, belongs_to, content_type):
+        """Return the answer of validate_token serialized as content_type,
+        'application/json' or 'application/xml', from the validation cache
+        when it holds it"""
+        self.__validate_admin_token(admin_token)
+
+        content = self.validations.get(token_id, belongs_to, content_type)
+        if content is not None:
+            return content
+
+        if not api.token.get(token_id):
+            raise fault.UnauthorizedFault("Bad token, please reauthenticate")
+        (dtoken, duser) = self.__validate_token(token_id, belongs_to)
+        data = self.__get_validate_data(dtoken, duser)
+        if content_type == 'application/xml':
+            content = data.to_xml()
+        else:
+            content = data.to_json()
+
+        tenant_ids = [tenant_id for tenant_id in (dtoken.tenant_id,
+                                                  duser.tenant_id)
+                      if tenant_id]
+        self.validations.put(token_id, belongs_to, content_type, content,
+                             time.mktime(dtoken.expires.timetuple()),
+                             duser.id, tenant_ids)
+        return content
+
+    def check_token(self, admin_token, token_id, belongs_to=None):
+        """Check a token is valid without loading its roles"""
+        self.__validate_admin_token(admin_token)
+
+        (dtoken, duser) = self.__get_dauth_data(token_id)
+        if not dtoken:
+            raise fault.UnauthorizedFault("Bad token, please reauthenticate")
+        self.__check_token(dtoken, duser, belongs_to)
+
+        token = auth.Token(dtoken.expires, dtoken.id, dtoken.tenant_id)
+        return auth.ValidateData(token, auth.User(duser.id, duser.tenant_id,
+                                                  None))
+
+    def validate_tokens(self, admin_token, token_requests):
+        """Validate a batch of tokens.
+
+        Tokens, users, tenants and role refs are each fetched with a single
+        query, so the cost does not grow with the number of round trips.
+
+        """
+        self.__validate_admin_token(admin_token)
+
+        if not isinstance(token_requests, auth.TokenValidationRequests):
+            raise fault.BadRequestFault("Expecting tokens")
+        if len(token_requests.tokens) > MAX_BULK_VALIDATIONS:
+            raise fault.BadRequestFault("At most %s tokens may be validated "
+                                        "at once" % MAX_BULK_VALIDATIONS)
+
+        token_ids = set(token_id for token_id, _belongs_to
+                        in token_requests.tokens if token_id)
+        dtokens = dict((dtoken.id, dtoken) for dtoken in
+                       api.token.get_many(list(token_ids)))
+        user_ids = set(dtoken.user_id for dtoken in dtokens.values())
+        dusers = dict((duser.id, duser) for duser in
+                      api.user.get_many(list(user_ids)))
+        tenant_ids = set(duser.tenant_id for duser in dusers.values())
+        tenant_ids.update(dtoken.tenant_id for dtoken in dtokens.values())
+        tenant_ids.discard(None)
+        dtenants = dict((dtenant.id, dtenant) for dtenant in
+                        api.tenant.get_many(list(tenant_ids)))
+        drole_refs = {}
+        for drole_ref in api.role.ref_get_all_for_users(list(user_ids),
+                                                        list(tenant_ids)):
+            drole_refs.setdefault(drole_ref.user_id, []).append(drole_ref)
+
+        results = []
+        for token_id, belongs_to in token_requests.tokens:
+            try:
+                dtoken = dtokens.get(token_id)
+                if not dtoken:
+                    raise fault.UnauthorizedFault(
+                        "Bad token, please reauthenticate")
+                duser = dusers.get(dtoken.user_id)
+                self.__check_token(dtoken, duser, belongs_to, dtenants.get)
+                # Tenant roles first, then global ones, as validate_token
+                user_refs = drole_refs.get(duser.id, [])
+                token_refs = [ref for ref in user_refs if dtoken.tenant_id
+                              and ref.tenant_id == dtoken.tenant_id]
+                token_refs.extend(ref for ref in user_refs
+                                  if ref.tenant_id is None)
+                results.append((token_id, self.__get_validate_data(
+                    dtoken, duser, token_refs)))
+            except fault.IdentityFault as e:
+                results.append((token_id, e))
+        return auth.TokenValidations(results)
+
     def revoke_token(self, admin_token, token_id):
         self.__validate_admin_token(admin_token)
 
@@ -99,6 +240,24 @@ class IdentityService(object):
             raise fault.ItemNotFoundFault("Token not found")
 
         api.token.delete(token_id)
+        self.revocations.record(revocation.TOKEN, token_id)
+        self.validations.invalidate_token(token_id)
+
+    def get_revocations(self, admin_token, since):
+        self.__validate_admin_token(admin_token)
+        if not self.revocation_feed:
+            raise fault.ItemNotFoundFault("The revocation feed is disabled")
+
+        try:
+            since = float(since or 0)
+        except ValueError:
+            raise fault.BadRequestFault("Expecting a timestamp for 'since'")
+
+        return auth.Revocations(*self.revocations.since(since))
+
+    def get_metrics(self, admin_token):
+        self.__validate_admin_token(admin_token)
+        return Metrics(metrics.snapshot())
 
     #
     #   Tenant Operations
@@ -185,6 +344,9 @@ class IdentityService(object):
             raise fault.ItemNotFoundFault("The tenant could not be found")
         values = {'desc': tenant.description, 'enabled': tenant.enabled}
         api.tenant.update(tenant_id, values)
+        if not tenant.enabled:
+            self.revocations.record(revocation.TENANT, tenant_id)
+        self.validations.invalidate_tenant(tenant_id)
         return Tenant(dtenant.id, tenant.description, tenant.enabled)
 
     def delete_tenant(self, admin_token, tenant_id):
@@ -199,6 +361,8 @@ class IdentityService(object):
                                        "contains get_users or groups")
         
         api.tenant.delete(dtenant.id)
+        self.revocations.record(revocation.TENANT, dtenant.id)
+        self.validations.invalidate_tenant(dtenant.id)
         return None
 
     #
@@ -595,6 +759,9 @@ class IdentityService(object):
         values = {'enabled': user.enabled}
 
         api.user.update(user_id, values)
+        if not user.enabled:
+            self.revocations.record(revocation.USER, user_id)
+        self.validations.invalidate_user(user_id)
 
         return User_Update(None,
             None, None, None, user.enabled, None)
@@ -614,6 +781,8 @@ class IdentityService(object):
         dtenant = self.validate_and_fetch_user_tenant(user.tenant_id)
         values = {'tenant_id': user.tenant_id}
         api.user.update(user_id, values)
+        self.revocations.record(revocation.USER, user_id)
+        self.validations.invalidate_user(user_id)
         return User_Update(None,
             None, user.tenant_id, None, None, None)
 
@@ -628,6 +797,8 @@ class IdentityService(object):
             api.user.delete_tenant_user(user_id, dtenant.id)
         else:
             api.user.delete(user_id)
+        self.revocations.record(revocation.USER, user_id)
+        self.validations.invalidate_user(user_id)
         return None
 
     def get_user_groups(self, admin_token, user_id, marker, limit,
@@ -855,6 +1026,30 @@ class IdentityService(object):
         api.user.tenant_group_delete(user, group)
         return None
 
+    def __new_token_id(self, duser, dtoken):
+        """Pick the id of a new token according to the token format"""
+        if self.token_signing_key:
+            # Same tenant and roles validate_token reports for this token:
+            # the user's own tenant, and the roles the token is scoped to
+            roles = [ref.role_id for ref in self.__get_role_refs(duser.id,
+                                                         dtoken.tenant_id)]
+            token_id = signing.sign(self.token_signing_key, duser.id,
+                                    duser.tenant_id, roles, dtoken.expires)
+            if len(token_id) <= MAX_TOKEN_LENGTH:
+                return token_id
+            logger.warn("Signed token for user %s is too long to be stored, "
+                        "issuing a uuid token instead" % duser.id)
+        return str(uuid.uuid4())
+
+    def __get_role_refs(self, user_id, tenant_id):
+        """Return the tenant and global role refs of a user"""
+        drole_refs = []
+        if tenant_id:
+            drole_refs.extend(api.role.ref_get_all_tenant_roles(user_id,
+                                                                tenant_id))
+        drole_refs.extend(api.role.ref_get_all_global_roles(user_id))
+        return drole_refs
+
     def __get_auth_data(self, dtoken, tenant_id):
         """return AuthData object for a token"""
         endpoints = None
@@ -863,29 +1058,26 @@ class IdentityService(object):
         token = auth.Token(dtoken.expires, dtoken.id, tenant_id)
         return auth.AuthData(token, endpoints)
 
-    def __get_validate_data(self, dtoken, duser):
+    def __get_validate_data(self, dtoken, duser, drole_refs=None):
         """return ValidateData object for a token/user pair"""
 
         token = auth.Token(dtoken.expires, dtoken.id, dtoken.tenant_id)
+        if drole_refs is None:
+            drole_refs = self.__get_role_refs(duser.id, dtoken.tenant_id)
         ts = []
-        if dtoken.tenant_id:
-            droleRefs = api.role.ref_get_all_tenant_roles(duser.id,
-                                                             dtoken.tenant_id)
-            for droleRef in droleRefs:
-                ts.append(RoleRef(droleRef.id, droleRef.role_id,
-                                         droleRef.tenant_id))
-        droleRefs = api.role.ref_get_all_global_roles(duser.id)
-        for droleRef in droleRefs:
+        for droleRef in drole_refs:
             ts.append(RoleRef(droleRef.id, droleRef.role_id,
                                      droleRef.tenant_id))
         user = auth.User(duser.id, duser.tenant_id, None, RoleRefs(ts, []))
         return auth.ValidateData(token, user)
 
-    def __validate_tenant(self, tenant_id):
+    def __validate_tenant(self, tenant_id, get_tenant=None):
         if not tenant_id:
             raise fault.UnauthorizedFault("Missing tenant")
         
-        tenant = api.tenant.get(tenant_id)
+        tenant = (get_tenant or api.tenant.get)(tenant_id)
+        if not tenant:
+            raise fault.UnauthorizedFault("Tenant %s not found" % tenant_id)
         
         if not tenant.enabled:
             raise fault.TenantDisabledFault("Tenant %s has been disabled!"
@@ -896,27 +1088,32 @@ class IdentityService(object):
             raise fault.UnauthorizedFault("Missing token")
         
         (token, user) = self.__get_dauth_data(token_id)
+        self.__check_token(token, user, belongs_to)
+        return (token, user)
 
+    def __check_token(self, token, user, belongs_to=None, get_tenant=None):
+        """Raise the fault for the first problem found with a token"""
         if not token:
             raise fault.ItemNotFoundFault("Bad token, please reauthenticate")
         
         if token.expires < datetime.now():
             raise fault.ForbiddenFault("Token expired, please renew")
         
+        if not user:
+            raise fault.UnauthorizedFault("Bad token, please reauthenticate")
+        
         if not user.enabled:
             raise fault.UserDisabledFault("User %s has been disabled!"
                                           % user.id)
         
         if user.tenant_id:
-            self.__validate_tenant(user.tenant_id)
+            self.__validate_tenant(user.tenant_id, get_tenant)
         
         if token.tenant_id:
-            self.__validate_tenant(token.tenant_id)
+            self.__validate_tenant(token.tenant_id, get_tenant)
         
         if belongs_to and token.tenant_id != belongs_to:
             raise fault.UnauthorizedFault("Unauthorized on this tenant")
-        
-        return (token, user)
     
     def __validate_admin_token(self, token_id):
         (token, user) = self.__validate_token(token_id)
@@ -1001,12 +1198,17 @@ class IdentityService(object):
         if roleRef.tenant_id != None:
             drole_ref.tenant_id = dtenant.id
         user_role_ref = api.user.user_role_add(drole_ref)
+        self.validations.invalidate_user(duser.id)
         roleRef.role_ref_id = user_role_ref.id
         return roleRef
 
     def delete_role_ref(self, admin_token, role_ref_id):
         self.__validate_admin_token(admin_token)
+        drole_ref = api.role.ref_get(role_ref_id)
         api.role.ref_delete(role_ref_id)
+        if drole_ref:
+            self.revocations.record(revocation.USER, drole_ref.user_id)
+            self.validations.invalidate_user(drole_ref.user_id)
         return None
 
     def get_user_roles(self, admin_token, marker, limit, url, user_id):
@@ -200,7 +200,7 @@ class ValidateData(object):
         self.token = token
         self.user = user
 
-    def to_xml(self):
+    def to_dom(self):
         dom = etree.Element("auth",
                         xmlns="http://docs.openstack.org/identity/api/v2.0")
         token = etree.Element("token",
@@ -223,9 +223,12 @@ class ValidateData(object):
             user.append(self.user.role_refs.to_dom())
         dom.append(token)
         dom.append(user)
-        return etree.tostring(dom)
+        return dom
 
-    def to_json(self):
+    def to_xml(self):
+        return etree.tostring(self.to_dom())
+
+    def to_dict(self):
         token = {}
         token["id"] = self.token.id
         token["expires"] = self.token.expires.isoformat()
@@ -252,4 +255,105 @@ class ValidateData(object):
         auth["user"] = user
         ret = {}
         ret["auth"] = auth
-        return json.dumps(ret)
+        return ret
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+
+class TokenValidationRequests(object):
+    """A batch of tokens to validate in one call."""
+
+    def __init__(self, tokens):
+        # list of (token_id, belongs_to) tuples
+        self.tokens = tokens
+
+    @staticmethod
+    def from_xml(xml_str):
+        try:
+            dom = etree.Element("root")
+            dom.append(etree.fromstring(xml_str))
+            root = dom.find("{http://docs.openstack.org/identity/api/v2.0}"
+                            "tokens")
+            if root == None:
+                raise fault.BadRequestFault("Expecting tokens")
+            tokens = []
+            for token in root.findall(
+                    "{http://docs.openstack.org/identity/api/v2.0}token"):
+                if token.get("id") == None:
+                    raise fault.BadRequestFault("Expecting a token id")
+                tokens.append((token.get("id"), token.get("belongsTo")))
+            return TokenValidationRequests(tokens)
+        except etree.LxmlError as e:
+            raise fault.BadRequestFault("Cannot parse tokens", str(e))
+
+    @staticmethod
+    def from_json(json_str):
+        try:
+            obj = json.loads(json_str)
+            if not "tokens" in obj:
+                raise fault.BadRequestFault("Expecting tokens")
+            tokens = []
+            for token in obj["tokens"]:
+                if not "id" in token:
+                    raise fault.BadRequestFault("Expecting a token id")
+                tokens.append((token["id"], token.get("belongsTo")))
+            return TokenValidationRequests(tokens)
+        except (ValueError, TypeError) as e:
+            raise fault.BadRequestFault("Cannot parse tokens", str(e))
+
+
+class TokenValidations(object):
+    """Per token results of a bulk validation."""
+
+    def __init__(self, results):
+        # list of (token_id, ValidateData or IdentityFault) tuples
+        self.results = results
+
+    def to_xml(self):
+        dom = etree.Element("validations",
+                        xmlns="http://docs.openstack.org/identity/api/v2.0")
+        for token_id, result in self.results:
+            validation = etree.Element("validation")
+            validation.set("id", token_id)
+            validation.append(result.to_dom())
+            dom.append(validation)
+        return etree.tostring(dom)
+
+    def to_json(self):
+        values = []
+        for token_id, result in self.results:
+            validation = result.to_dict()
+            validation["id"] = token_id
+            values.append(validation)
+        return json.dumps({"validations": values})
+
+
+class Revocations(object):
+    """Revocation events recorded since a point in time."""
+
+    def __init__(self, events, now, truncated):
+        self.events = events
+        self.now = now
+        self.truncated = truncated
+
+    def to_xml(self):
+        dom = etree.Element("revocations",
+                        xmlns="http://docs.openstack.org/identity/api/v2.0")
+        dom.set("now", repr(self.now))
+        dom.set("truncated", str(self.truncated).lower())
+        for timestamp, event_type, entity_id in self.events:
+            event = etree.Element("revocation", type=event_type,
+                                  timestamp=repr(timestamp))
+            event.set("id", entity_id)
+            dom.append(event)
+        return etree.tostring(dom)
+
+    def to_json(self):
+        values = []
+        for timestamp, event_type, entity_id in self.events:
+            values.append({"timestamp": timestamp, "type": event_type,
+                           "id": entity_id})
+        return json.dumps({"revocations": {"values": values,
+                                           "now": self.now,
+                                           "truncated": self.truncated}})
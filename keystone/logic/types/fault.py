@@ -31,7 +31,7 @@ class IdentityFault(Exception):
     def message(self):
         return self.msg
 
-    def to_xml(self):
+    def to_dom(self):
         dom = etree.Element(self.key,
                         xmlns="http://docs.openstack.org/identity/api/v2.0")
         dom.set("code", str(self.code))
@@ -42,9 +42,12 @@ class IdentityFault(Exception):
             desc = etree.Element("details")
             desc.text = self.details
             dom.append(desc)
-        return etree.tostring(dom)
+        return dom
 
-    def to_json(self):
+    def to_xml(self):
+        return etree.tostring(self.to_dom())
+
+    def to_dict(self):
         fault = {}
         fault["message"] = self.msg
         fault["code"] = str(self.code)
@@ -52,7 +55,10 @@ class IdentityFault(Exception):
             fault["details"] = self.details
         ret = {}
         ret[self.key] = fault
-        return json.dumps(ret)
+        return ret
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
 
 
 class ServiceUnavailableFault(IdentityFault):
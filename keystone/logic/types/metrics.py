@@ -0,0 +1,44 @@
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from lxml import etree
+
+
+class Metrics(object):
+    """Snapshot of the in-process metrics, see keystone.common.metrics"""
+
+    def __init__(self, snapshot):
+        self.counters = snapshot['counters']
+        self.gauges = snapshot['gauges']
+        self.timings = snapshot['timings']
+
+    def to_xml(self):
+        dom = etree.Element("metrics",
+                        xmlns="http://docs.openstack.org/identity/api/v2.0")
+        for name, value in sorted(self.counters.items()):
+            etree.SubElement(dom, "counter", name=name, value=repr(value))
+        for name, value in sorted(self.gauges.items()):
+            etree.SubElement(dom, "gauge", name=name, value=repr(value))
+        for name, summary in sorted(self.timings.items()):
+            timing = etree.SubElement(dom, "timing", name=name)
+            for key, value in sorted(summary.items()):
+                timing.set(key, repr(value))
+        return etree.tostring(dom)
+
+    def to_json(self):
+        return json.dumps({"metrics": {"counters": self.counters,
+                                       "gauges": self.gauges,
+                                       "timings": self.timings}})
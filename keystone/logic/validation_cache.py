@@ -0,0 +1,152 @@
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cache of serialized token validations
+
+validate_token answers are kept, already serialized, under (token id,
+belongsTo, content type) until the token expires or 'ttl' seconds pass,
+whichever comes first. Each entry remembers the user and tenants it depends
+on, so changes to them can drop it.
+
+The cache is local to the process; other processes serving the same
+database only notice changes made elsewhere once their entries time out.
+'ttl' bounds that staleness. Invalidation scans the entries, as the changes
+that call for it are rare next to validations. Within a unit of work (see
+keystone.common.sessions) it is repeated once the unit ends, dropping what
+validations running before the changes were committed cached meanwhile.
+
+Lookups, evictions and expirations are reported to keystone.common.metrics
+under 'validation_cache.'.
+"""
+
+import collections
+import threading
+import time
+
+from keystone.common import metrics
+from keystone.common import sessions
+
+DEFAULT_SIZE = 10000
+
+
+class Entry(object):
+    __slots__ = ('content', 'expires', 'user_id', 'tenant_ids', 'token_id')
+
+    def __init__(self, content, expires, token_id, user_id, tenant_ids):
+        self.content = content
+        self.expires = expires
+        self.token_id = token_id
+        self.user_id = user_id
+        self.tenant_ids = tenant_ids
+
+
+class ValidationCache(object):
+    """Bounded LRU cache of serialized validations"""
+
+    def __init__(self, ttl=0, size=DEFAULT_SIZE):
+        """
+        :param ttl: longest time in seconds an entry is kept, 0 disables
+                    the cache
+        :param size: most entries kept, least recently used go first
+        """
+        self.ttl = ttl
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.size > 0
+
+    def _report(self, hit):
+        if hit:
+            self.hits += 1
+            metrics.increment('validation_cache.hits')
+        else:
+            self.misses += 1
+            metrics.increment('validation_cache.misses')
+        metrics.gauge('validation_cache.hit_ratio',
+                      float(self.hits) / (self.hits + self.misses))
+
+    def get(self, token_id, belongs_to, content_type):
+        """Return the cached content for a validation, or None"""
+        if not self.enabled:
+            return None
+        key = (token_id, belongs_to, content_type)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry.expires <= time.time():
+                metrics.increment('validation_cache.expirations')
+                entry = None
+            if entry is not None:
+                # Most recently used entries are kept at the end
+                self.entries[key] = entry
+            self._report(entry is not None)
+            return entry and entry.content
+
+    def put(self, token_id, belongs_to, content_type, content, expires,
+            user_id, tenant_ids):
+        """Cache the content of a validation.
+
+        :param expires: expiry of the token, in seconds since the epoch
+        :param user_id: user the token belongs to
+        :param tenant_ids: tenants whose state the validation depends on
+
+        """
+        if not self.enabled:
+            return
+        expires = min(expires, time.time() + self.ttl)
+        key = (token_id, belongs_to, content_type)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = Entry(content, expires, token_id, user_id,
+                                      frozenset(tenant_ids))
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                metrics.increment('validation_cache.evictions')
+            metrics.gauge('validation_cache.size', len(self.entries))
+
+    def _invalidate(self, matches):
+        self._drop(matches)
+        if sessions.in_scope():
+            sessions.on_end(lambda: self._drop(matches))
+
+    def _drop(self, matches):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items()
+                        if matches(entry)]:
+                del self.entries[key]
+                metrics.increment('validation_cache.invalidations')
+            metrics.gauge('validation_cache.size', len(self.entries))
+
+    def invalidate_token(self, token_id):
+        """Drop the validations of a token"""
+        self._invalidate(lambda entry: entry.token_id == token_id)
+
+    def invalidate_user(self, user_id):
+        """Drop the validations of a user's tokens"""
+        self._invalidate(lambda entry: entry.user_id == user_id)
+
+    def invalidate_tenant(self, tenant_id):
+        """Drop the validations that depend on a tenant"""
+        self._invalidate(lambda entry: tenant_id in entry.tenant_ids)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            metrics.gauge('validation_cache.size', 0)
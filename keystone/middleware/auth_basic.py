@@ -19,9 +19,9 @@
 
 
 """
-BASIC AUTH MIDDLEWARE - STUB
+BASIC AUTH MIDDLEWARE
 
-This WSGI component should perform multiple jobs:
+This WSGI component performs multiple jobs:
 - validate incoming basic claims
 - perform all basic auth interactions with clients
 - collect and forward identity information from the authentication process
@@ -29,22 +29,46 @@ This WSGI component should perform multiple jobs:
 
 This is an Auth component as per: http://wiki.openstack.org/openstack-authn
 
+
+CREDENTIAL CHECKS
+-----------------
+Credentials are checked by authenticating with Keystone at 'auth_host',
+over at most 'auth_pool_size' (default 10) kept alive connections.
+
+Accepted credentials are remembered for 'credentials_cache_ttl' seconds
+(default 60) and rejected ones for 'negative_cache_ttl' seconds (default 5),
+at most 'credentials_cache_size' (default 10000) of each. They are kept as
+a hash salted with a secret of this process, never in the clear.
+
+After 'lockout_threshold' (default 5, 0 disables lockout) credentials of a
+user have been rejected, with no more than 'lockout_period' seconds (default
+300) between them, the user's credentials are refused without asking
+Keystone until 'lockout_period' seconds after the last rejection.
+
 """
 
+import base64
+import hashlib
+import hmac
+import json
+import logging
 import os
-import urlparse
 import eventlet
 from eventlet import wsgi
 from paste.deploy import loadapp
-from keystone.common.bufferedhttp import http_connect_raw as http_connect
-from webob.exc import Request, Response
+from keystone.common import httppool
+from keystone.common import lru
+from keystone.common import metrics
+from keystone.common import proxy
 from webob.exc import HTTPUnauthorized
 
 PROTOCOL_NAME = "Basic Authentication"
+REALM = 'Basic realm="Keystone"'
+
+logger = logging.getLogger('keystone.middleware.auth_basic')
 
 
-def _decorate_request_headers(header, value, proxy_headers, env):
-        proxy_headers[header] = value
+def _decorate_request_headers(header, value, env):
         env["HTTP_%s" % header] = value
 
 
@@ -70,38 +94,56 @@ class AuthProtocol(object):
                                            self.service_port)
         # used to verify this component with the OpenStack service or PAPIAuth
         self.service_pass = conf.get('service_pass')
+        # streams requests to the remote service over pooled connections
+        self.proxy = None
+        if not app:
+            self.proxy = proxy.from_conf('auth_basic.proxy', conf)
 
         # delay_auth_decision means we still allow unauthenticated requests
         # through and we let the downstream service make the final decision
         self.delay_auth_decision = int(conf.get('delay_auth_decision', 0))
 
+        # where to find the auth service (we use this to check credentials)
+        self.auth_host = conf.get('auth_host')
+        self.auth_port = int(conf.get('auth_port'))
+        self.auth_protocol = conf.get('auth_protocol', 'https')
+        self.keystone = httppool.HTTPPool('auth_basic.keystone',
+            self.auth_host, self.auth_port,
+            ssl=(self.auth_protocol == 'https'),
+            size=int(conf.get('auth_pool_size', 10)))
+
+        # Salted hashes of recently accepted and rejected credentials
+        self.salt = os.urandom(16)
+        cache_size = int(conf.get('credentials_cache_size', 10000))
+        self.accepted = lru.LRUCache('auth_basic.accepted', cache_size,
+            int(conf.get('credentials_cache_ttl', 60)))
+        self.rejected = lru.LRUCache('auth_basic.rejected', cache_size,
+            int(conf.get('negative_cache_ttl', 5)))
+
+        # user name => credentials of the user rejected in a row
+        self.lockout_threshold = int(conf.get('lockout_threshold', 5))
+        self.failures = lru.LRUCache('auth_basic.failures', cache_size,
+            int(conf.get('lockout_period', 300)))
+
     def __call__(self, env, start_response):
         def custom_start_response(status, headers):
             if self.delay_auth_decision:
-                headers.append(('WWW-Authenticate',
-                                "Basic realm='Use guest/guest'"))
+                headers.append(('WWW-Authenticate', REALM))
             return start_response(status, headers)
 
-        #Prep headers to proxy request to remote service
-        proxy_headers = env.copy()
-        user = ''
-
         #Look for authentication
         if 'HTTP_AUTHORIZATION' not in env:
             #No credentials were provided
             if self.delay_auth_decision:
-                _decorate_request_headers("X_IDENTITY_STATUS", "Invalid",
-                                          proxy_headers, env)
+                _decorate_request_headers("X_IDENTITY_STATUS", "Invalid", env)
             else:
                 # If the user isn't authenticated, we reject the request and
                 # return 401 indicating we need Basic Auth credentials.
                 return HTTPUnauthorized("Authentication required",
-                                        [('WWW-Authenticate',
-                                        'Basic realm="Use guest/guest"')])\
+                                        [('WWW-Authenticate', REALM)])\
                                                 (env, start_response)
         else:
             # Claims were provided - validate them
-            import base64
             auth_header = env['HTTP_AUTHORIZATION']
             _auth_type, encoded_creds = auth_header.split(None, 1)
             user, password = base64.b64decode(encoded_creds).split(':', 1)
@@ -110,58 +152,91 @@ class AuthProtocol(object):
                 if not self.delay_auth_decision:
                     # Reject request (or ask for valid claims)
                     return HTTPUnauthorized("Authentication required",
-                                [('WWW-Authenticate',
-                                'Basic realm="Use guest/guest"')])\
+                                [('WWW-Authenticate', REALM)])\
                                         (env, start_response)
                 else:
-                    # Claims are valid, forward request
+                    # Downstream service will receive call still and decide
                     _decorate_request_headers("X_IDENTITY_STATUS", "Invalid",
-                                              proxy_headers, env)
-
-            # TODO(Ziad): add additional details we may need,
-            #             like tenant and group info
-            _decorate_request_headers('X_AUTHORIZATION', "Proxy %s" % user,
-                                      proxy_headers, env)
-            _decorate_request_headers("X_IDENTITY_STATUS", "Confirmed",
-                                      proxy_headers, env)
-            _decorate_request_headers('X_TENANT', 'blank',
-                                      proxy_headers, env)
-            _decorate_request_headers('X_GROUP', 'Blank',
-                                      proxy_headers, env)
-
-            #Auth processed, headers added now decide how to pass on the call
-            if self.app:
-                # Pass to downstream WSGI component
-                env['HTTP_AUTHORIZATION'] = "Basic %s" % self.service_pass
-                return self.app(env, custom_start_response)
-
-            proxy_headers['AUTHORIZATION'] = "Basic %s" % self.service_pass
-            # We are forwarding to a remote service (no downstream WSGI app)
-            req = Request(proxy_headers)
-            parsed = urlparse(req.url)
-            conn = http_connect(self.service_host, self.service_port, \
-                                req.method, parsed.path, \
-                                proxy_headers, \
-                                ssl=(self.service_protocol == 'https'))
-            resp = conn.getresponse()
-            data = resp.read()
-            #TODO(ziad): use a more sophisticated proxy
-            # we are rewriting the headers now
-            return Response(status=resp.status, body=data)(env, start_response)
+                                              env)
+            else:
+                # TODO(Ziad): add additional details we may need,
+                #             like tenant and group info
+                _decorate_request_headers('X_AUTHORIZATION',
+                                          "Proxy %s" % user, env)
+                _decorate_request_headers("X_IDENTITY_STATUS", "Confirmed",
+                                          env)
+                _decorate_request_headers('X_TENANT', 'blank', env)
+                _decorate_request_headers('X_GROUP', 'Blank', env)
+
+        #Auth processed, headers added now decide how to pass on the call
+        if self.app:
+            # Pass to downstream WSGI component
+            env['HTTP_AUTHORIZATION'] = "Basic %s" % self.service_pass
+            return self.app(env, custom_start_response)
+
+        # We are forwarding to a remote service (no downstream WSGI app)
+        proxy_headers = proxy.request_headers(env)
+        proxy_headers['Authorization'] = "Basic %s" % self.service_pass
+        return self.proxy(env, start_response, proxy_headers)
 
     def validateCreds(self, username, password):
-        #stub for password validation.
-        # import ConfigParser
-        # import hashlib
-        #usersConfig = ConfigParser.ConfigParser()
-        #usersConfig.readfp(open('/etc/openstack/users.ini'))
-        #password = hashlib.sha1(password).hexdigest()
-        #for un, pwd in usersConfig.items('users'):
-        #TODO(Ziad): add intelligent credential validation (instead of hard
-        # coded)
-        if username == 'guest' and password == 'guest':
+        """Check a user name and password, with Keystone unless cached"""
+        if self.lockout_threshold and \
+                self._failures(username) >= self.lockout_threshold:
+            metrics.increment('auth_basic.locked_out')
+            return False
+
+        key = hmac.new(self.salt, '%s\0%s' % (username, password),
+                       hashlib.sha256).digest()
+        if self.accepted.get(key) is not lru.MISSING:
+            return True
+        if self.rejected.get(key) is not lru.MISSING:
+            return False
+
+        valid = self._authenticate(username, password)
+        if valid is None:
+            # Keystone could not tell, so neither remember nor count it
+            return False
+        if valid:
+            self.accepted.put(key, True)
+            self.failures.discard(username)
+        else:
+            self.rejected.put(key, True)
+            self.failures.put(username, self._failures(username) + 1)
+        return valid
+
+    def _failures(self, username):
+        failures = self.failures.get(username)
+        if failures is lru.MISSING:
+            return 0
+        return failures
+
+    def _authenticate(self, username, password):
+        """Authenticate with Keystone.
+
+        :returns: whether Keystone accepted the credentials, None if it could
+                  not be asked
+
+        """
+        body = json.dumps({"passwordCredentials": {"username": username,
+                                                   "password": password}})
+        headers = {"Content-type": "application/json",
+                   "Accept": "application/json"}
+        try:
+            status, _data = self.keystone.request('POST', '/v2.0/tokens',
+                                                  body, headers)
+        except httppool.ERRORS, e:
+            logger.warning("Unable to reach Keystone at %s: %s" %
+                           (self.keystone.address, e))
+            metrics.increment('auth_basic.keystone_errors')
+            return None
+        if 200 <= status < 300:
             return True
-        return False
+        if 400 <= status < 500:
+            return False
+        logger.warning("Keystone failed to check credentials: %s" % status)
+        metrics.increment('auth_basic.keystone_errors')
+        return None
 
 
 def filter_factory(global_conf, ** local_conf):
@@ -49,22 +49,75 @@ HTTP_AUTHORIZATION  : basic auth password used to validate the connection
 > What we add to the request for use by the OpenStack service
 HTTP_X_AUTHORIZATION: the client identity being passed in
 
+
+SIGNED TOKENS
+-------------
+When Keystone issues signed tokens (token_format = signed) and 'signing_key'
+is set to the same key here, signed tokens are verified locally and their
+user, tenant and roles are taken from the token itself. Opaque tokens are
+still validated by calling Keystone.
+
+
+REMOTE SERVICE
+--------------
+Without a downstream WSGI app, requests are streamed to the service at
+'service_host' over at most 'service_pool_size' (default 10) kept alive
+connections, 'proxy_chunk_size' bytes at a time, with 'service_timeout' as
+the socket timeout. Response status, headers and body are passed back as
+they are.
+
+
+CACHING AND REVOCATION
+----------------------
+With 'cache_ttl' set, the claims of tokens validated by Keystone are cached
+for that many seconds (or until the token expires, if sooner), keeping at
+most 'cache_size' (default 10000) of the most recently used tokens. With
+'revocation_poll_interval' set, a background thread asks Keystone every that
+many seconds for the revocation events since the last poll. Cached tokens of
+revoked tokens, users and tenants are purged, and signed tokens issued before
+a matching event are refused.
+
+Requests presenting the same opaque token at the same time share a single
+validation call to Keystone, waiting for it at most 'coalesce_timeout'
+seconds (default 10) before making their own.
+
+
+ADMIN TOKEN
+-----------
+Validating tokens and fetching revocations are privileged calls. With
+'admin_user' and 'admin_password' (and optionally 'admin_tenant', a tenant
+id) set, the middleware authenticates with Keystone for its own admin token.
+A background thread, started by the first request, acquires it and renews it
+'admin_token_renew_before' seconds (default 300) before it expires, retrying
+every 'admin_token_retry_interval' seconds (default 10) while Keystone can't
+be reached; requests keep using the current token meanwhile. A call Keystone
+refuses with a 401 is retried once with a fresh token, which only such calls
+and those made before the first token arrived wait for. Without credentials
+the static 'admin_token' is used.
+
 """
 
+from datetime import datetime
 import eventlet
 from eventlet import wsgi
-import httplib
 import json
+import logging
 import os
+import time
+import urllib
 from paste.deploy import loadapp
-from urlparse import urlparse
 from webob.exc import HTTPUnauthorized, HTTPUseProxy
-from webob.exc import Request, Response
 
 from keystone.common.bufferedhttp import http_connect_raw as http_connect
+from keystone.common import lru
+from keystone.common import proxy
+from keystone.common import signing
+from keystone.common import singleflight
 
 PROTOCOL_NAME = "Token Authentication"
 
+logger = logging.getLogger('keystone.middleware.auth_token')
+
 
 class AuthProtocol(object):
     """Auth Middleware that handles authenticating client calls"""
@@ -94,6 +147,11 @@ class AuthProtocol(object):
         # through and we let the downstream service make the final decision
         self.delay_auth_decision = int(conf.get('delay_auth_decision', 0))
 
+        # streams requests to the remote service over pooled connections
+        self.proxy = None
+        if not app:
+            self.proxy = proxy.from_conf('auth_token.proxy', conf)
+
     def _init_protocol(self, app, conf):
         """ Protocol specific initialization """
 
@@ -105,9 +163,30 @@ class AuthProtocol(object):
                                              self.auth_host,
                                              self.auth_port)
 
-        # Credentials used to verify this component with the Auth service since
+        # Token used to verify this component with the Auth service since
         # validating tokens is a priviledged call
-        self.admin_token = conf.get('admin_token')
+        self.admin = _AdminToken(self, conf)
+
+        # Key shared with Keystone to verify signed tokens locally
+        self.signing_key = conf.get('signing_key')
+
+        # token id => (cached until, claims, subjects) of validated tokens
+        self.cache_ttl = int(conf.get('cache_ttl', 0))
+        self.token_cache = lru.LRUCache('auth_token.token_cache',
+                                        int(conf.get('cache_size', 10000)),
+                                        self.cache_ttl)
+
+        # Revocation feed state
+        self.revocation_poll_interval = int(conf.get(
+            'revocation_poll_interval', 0))
+        self.revocations = signing.Revocations()
+        self.revocation_poller = None
+
+        # Concurrent validations of a token with Keystone are coalesced;
+        # requests wait at most this many seconds for another's validation
+        self.validations = singleflight.SingleFlight(
+            'auth_token.validations',
+            float(conf.get('coalesce_timeout', 10)))
 
     def __init__(self, app, conf):
         """ Common initialization code """
@@ -119,161 +198,136 @@ class AuthProtocol(object):
     def __call__(self, env, start_response):
         """ Handle incoming request. Authenticate. And send downstream. """
 
-        self.start_response = start_response
-        self.env = env
+        # The middleware instance is shared by every request the server is
+        # handling concurrently, so nothing about this one is kept on self
+        request = _Request(env, start_response)
 
-        #Prep headers to forward request to local or remote downstream service
-        self.proxy_headers = env.copy()
-        for header in self.proxy_headers.iterkeys():
-            if header[0:5] == 'HTTP_':
-                self.proxy_headers[header[5:]] = self.proxy_headers[header]
-                del self.proxy_headers[header]
+        if self.revocation_poll_interval and not self.revocation_poller:
+            # Started lazily so that the green thread runs in the server's hub
+            self.revocation_poller = eventlet.spawn(self._poll_revocations)
 
         #Look for authentication claims
-        self.claims = self._get_claims(env)
-        if not self.claims:
+        request.claims = self._get_claims(env)
+        if not request.claims:
             #No claim(s) provided
             if self.delay_auth_decision:
                 #Configured to allow downstream service to make final decision.
                 #So mark status as Invalid and forward the request downstream
-                self._decorate_request("X_IDENTITY_STATUS", "Invalid")
+                request.decorate("X_IDENTITY_STATUS", "Invalid")
             else:
                 #Respond to client as appropriate for this auth protocol
-                return self._reject_request()
+                return self._reject_request(request)
         else:
             # this request is presenting claims. Let's validate them
-            valid = self._validate_claims(self.claims)
-            if not valid:
+            claims = self._validate_claims(request.claims)
+            if not claims:
                 # Keystone rejected claim
                 if self.delay_auth_decision:
                     # Downstream service will receive call still and decide
-                    self._decorate_request("X_IDENTITY_STATUS", "Invalid")
+                    request.decorate("X_IDENTITY_STATUS", "Invalid")
                 else:
                     #Respond to client as appropriate for this auth protocol
-                    return self._reject_claims()
+                    return self._reject_claims(request)
             else:
-                self._decorate_request("X_IDENTITY_STATUS", "Confirmed")
-
-            #Collect information about valid claims
-            if valid:
-                claims = self._expound_claims()
+                request.decorate("X_IDENTITY_STATUS", "Confirmed")
 
                 # Store authentication data
-                if claims:
-                    # TODO(Ziad): add additional details we may need,
-                    #             like tenant and group info
-                    self._decorate_request('X_AUTHORIZATION', "Proxy %s" % 
-                        claims['user'])
-                    self._decorate_request('X_TENANT', claims['tenant'])
-                    self._decorate_request('X_USER', claims['user'])
-                    if 'group' in claims:
-                        self._decorate_request('X_GROUP', claims['group'])
-                    if 'roles' in claims and len(claims['roles']) > 0:
-                        if claims['roles'] != None:
-                            roles = ''
-                            for role in claims['roles']:
-                                if len(roles) > 0:
-                                    roles += ','
-                                roles += role
-                            self._decorate_request('X_ROLE', roles)
-
-                    # NOTE(todd): unused
-                    self.expanded = True
-
-            #Send request downstream
-            return self._forward_request()
-
-    # NOTE(todd): unused
-    def get_admin_auth_token(self, username, password, tenant):
-        """
-        This function gets an admin auth token to be used by this service to
-        validate a user's token. Validate_token is a priviledged call so
-        it needs to be authenticated by a service that is calling it
-        """
-        headers = {"Content-type": "application/json", "Accept": "text/json"}
-        params = {"passwordCredentials": {"username": username,
-                                          "password": password,
-                                          "tenantId": "1"}}
-        conn = httplib.HTTPConnection("%s:%s" \
-            % (self.auth_host, self.auth_port))
-        conn.request("POST", "/v2.0/tokens", json.dumps(params), \
-            headers=headers)
-        response = conn.getresponse()
-        data = response.read()
-        return data
+                # TODO(Ziad): add additional details we may need,
+                #             like tenant and group info
+                request.decorate('X_AUTHORIZATION', "Proxy %s" %
+                    claims['user'])
+                request.decorate('X_TENANT', claims['tenant'])
+                request.decorate('X_USER', claims['user'])
+                if 'group' in claims:
+                    request.decorate('X_GROUP', claims['group'])
+                if claims.get('roles'):
+                    request.decorate('X_ROLE', ','.join(claims['roles']))
+
+        #Send request downstream
+        return self._forward_request(request)
 
     def _get_claims(self, env):
         """Get claims from request"""
         claims = env.get('HTTP_X_AUTH_TOKEN', env.get('HTTP_X_STORAGE_TOKEN'))
         return claims
 
-    def _reject_request(self):
+    def _reject_request(self, request):
         """Redirect client to auth server"""
-        return HTTPUseProxy(location=self.auth_location)(self.env,
-            self.start_response)
+        return HTTPUseProxy(location=self.auth_location)(request.env,
+            request.start_response)
 
-    def _reject_claims(self):
+    def _reject_claims(self, request):
         """Client sent bad claims"""
-        return HTTPUnauthorized()(self.env,
-            self.start_response)
+        return HTTPUnauthorized()(request.env, request.start_response)
 
     def _validate_claims(self, claims):
-        """Validate claims, and provide identity information isf applicable """
-
-        # Step 1: We need to auth with the keystone service, so get an
-        # admin token
-        #TODO(ziad): Need to properly implement this, where to store creds
-        # for now using token from ini
-        #auth = self.get_admin_auth_token("admin", "secrete", "1")
-        #admin_token = json.loads(auth)["auth"]["token"]["id"]
-
-        # Step 2: validate the user's token with the auth service
-        # since this is a priviledged op,m we need to auth ourselves
-        # by using an admin token
-        headers = {"Content-type": "application/json",
-                    "Accept": "text/json",
-                    "X-Auth-Token": self.admin_token}
-                    ##TODO(ziad):we need to figure out how to auth to keystone
-                    #since validate_token is a priviledged call
-                    #Khaled's version uses creds to get a token
-                    # "X-Auth-Token": admin_token}
-                    # we're using a test token from the ini file for now
-        conn = http_connect(self.auth_host, self.auth_port, 'GET',
-                            '/v2.0/tokens/%s' % claims, headers=headers)
-        resp = conn.getresponse()
-        # data = resp.read()
-        conn.close()
+        """Validate claims, and provide identity information if applicable
 
-        if not str(resp.status).startswith('20'):
-            # Keystone rejected claim
-            return False
-        else:
-            #TODO(Ziad): there is an optimization we can do here. We have just
-            #received data from Keystone that we can use instead of making
-            #another call in _expound_claims
-            return True
-
-    def _expound_claims(self):
-        # Valid token. Get user data and put it in to the call
-        # so the downstream service can use it
-        headers = {"Content-type": "application/json",
-                    "Accept": "text/json",
-                    "X-Auth-Token": self.admin_token}
-                    ##TODO(ziad):we need to figure out how to auth to keystone
-                    #since validate_token is a priviledged call
-                    #Khaled's version uses creds to get a token
-                    # "X-Auth-Token": admin_token}
-                    # we're using a test token from the ini file for now
-        conn = http_connect(self.auth_host, self.auth_port, 'GET',
-                            '/v2.0/tokens/%s' % self.claims, headers=headers)
-        resp = conn.getresponse()
-        data = resp.read()
-        conn.close()
+        :returns: dict of the token's user, tenant and roles, or None if the
+                  token is not valid
 
-        if not str(resp.status).startswith('20'):
-            raise LookupError('Unable to locate claims: %s' % resp.status)
+        """
+        if self.signing_key and signing.is_signed(claims):
+            # Self-contained token, no need to ask Keystone
+            try:
+                payload = signing.verify(self.signing_key, claims)
+            except signing.InvalidToken:
+                return None
+            if self.revocations.is_revoked(claims, payload):
+                return None
+            return {'user': payload['u'],
+                    'tenant': payload['t'],
+                    'roles': payload['r']}
+
+        cached = self.token_cache.get(claims)
+        if cached is not lru.MISSING:
+            if cached[0] > time.time():
+                return cached[1]
+            self.token_cache.discard(claims)
+
+        # Requests presenting the same token at the same time share one call
+        return self.validations.do(claims, self._fetch_claims, claims)
+
+    def _fetch_claims(self, claims):
+        """Validate claims with Keystone"""
+        # Validate the user's token with the auth service. Since this is a
+        # priviledged op, we need to auth ourselves by using an admin token
+        def validate(admin_token):
+            headers = {"Content-type": "application/json",
+                       "Accept": "text/json",
+                       "X-Auth-Token": admin_token}
+            conn = http_connect(self.auth_host, self.auth_port, 'GET',
+                                '/v2.0/tokens/%s' % claims, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            conn.close()
+            return resp.status, data
 
-        token_info = json.loads(data)
+        status, data = self._as_admin(validate)
+        if not str(status).startswith('20'):
+            # Keystone rejected claim
+            return None
+        return self._expound_claims(claims, json.loads(data))
+
+    def _as_admin(self, call):
+        """Make call(admin_token), returning (status, data), with the admin
+        token; should Keystone refuse it, once more with a fresh one"""
+        admin_token = self.admin.get()
+        # Without an admin token yet, Keystone would refuse the call anyway
+        status, data = 401, ''
+        if admin_token is not None:
+            status, data = call(admin_token)
+        if status == 401:
+            # Either the admin token or the user's token was refused, and
+            # only a fresh admin token can tell which
+            fresh_token = self.admin.renew(admin_token)
+            if fresh_token:
+                status, data = call(fresh_token)
+        return status, data
+
+    def _expound_claims(self, token_id, token_info):
+        """Get the user data a valid token carries into the call, so that
+        the downstream service can use it"""
         #TODO(Ziad): make this more robust
         #first_group = token_info['auth']['user']['groups']['group'][0]
         roles = []
@@ -286,41 +340,234 @@ class AuthProtocol(object):
                     'tenant': token_info['auth']['user']['tenantId'],
                     'roles': roles}
 
+        if self.cache_ttl:
+            self._cache_claims(token_id, token_info, verified_claims)
+
         # TODO(Ziad): removed groups for now
         #            ,'group': '%s/%s' % (first_group['id'],
         #                                first_group['tenantId'])}
         return verified_claims
 
-    def _decorate_request(self, index, value):
-        """Add headers to request"""
-        self.proxy_headers[index] = value
-        self.env["HTTP_%s" % index] = value
+    def _cache_claims(self, token_id, token_info, verified_claims):
+        """Remember the claims of a token validated by Keystone"""
+        token = token_info['auth']['token']
+        until = time.time() + self.cache_ttl
+        expires = _expires(token)
+        if expires is not None:
+            until = min(until, expires)
+        # Everything whose revocation must purge this entry
+        subjects = set([('token', token_id),
+                        ('user', verified_claims['user']),
+                        ('tenant', verified_claims['tenant'])])
+        if token.get('tenantId'):
+            subjects.add(('tenant', token['tenantId']))
+        if until > time.time():
+            self.token_cache.put(token_id, (until, verified_claims, subjects))
+
+    def _poll_revocations(self):
+        """Background loop fetching revocation events from Keystone"""
+        while True:
+            try:
+                self._fetch_revocations()
+            except Exception:
+                logger.exception("Unable to fetch revocation events")
+            eventlet.sleep(self.revocation_poll_interval)
+
+    def _fetch_revocations(self):
+        """Apply the revocation events recorded since the last poll"""
+        query = urllib.urlencode({'since': repr(self.revocations.since)})
+
+        def fetch(admin_token):
+            headers = {"Accept": "application/json",
+                       "X-Auth-Token": admin_token}
+            conn = http_connect(self.auth_host, self.auth_port, 'GET',
+                                '/v2.0/revocations', headers=headers,
+                                query_string=query,
+                                ssl=(self.auth_protocol == 'https'))
+            resp = conn.getresponse()
+            data = resp.read()
+            conn.close()
+            return resp.status, data
+
+        status, data = self._as_admin(fetch)
+        if not str(status).startswith('20'):
+            raise LookupError('Unable to fetch revocations: %s' % status)
 
-    def _forward_request(self):
+        self._apply_revocations(json.loads(data)['revocations'])
+
+    def _apply_revocations(self, revocations):
+        """Purge the cache entries matched by a batch of revocation events"""
+        if revocations['truncated']:
+            # Events may have been missed, nothing cached can be trusted
+            self.token_cache.clear()
+
+        revoked = self.revocations.apply(revocations)
+        if revoked:
+            for token_id, (_until, _claims, subjects) in \
+                    self.token_cache.items():
+                if subjects & revoked:
+                    self.token_cache.discard(token_id)
+
+    def _forward_request(self, request):
         """Token/Auth processed & claims added to headers"""
-        self._decorate_request('AUTHORIZATION',
-                                  "Basic %s" % self.service_pass)
+        request.decorate('AUTHORIZATION', "Basic %s" % self.service_pass)
         #now decide how to pass on the call
         if self.app:
             # Pass to downstream WSGI component
-            return self.app(self.env, self.start_response)
-            #.custom_start_response)
+            return self.app(request.env, request.start_response)
         else:
             # We are forwarding to a remote service (no downstream WSGI app)
-            req = Request(self.proxy_headers)
-            parsed = urlparse(req.url)
-            conn = http_connect(self.service_host,
-                                self.service_port,
-                                req.method,
-                                parsed.path,
-                                self.proxy_headers,
-                                ssl=(self.service_protocol == 'https'))
-            resp = conn.getresponse()
-            data = resp.read()
-            #TODO(ziad): use a more sophisticated proxy
-            # we are rewriting the headers now
-            return Response(status=resp.status, body=data)(self.proxy_headers,
-                                                           self.start_response)
+            return self.proxy(request.env, request.start_response,
+                              request.proxy_headers())
+
+
+class _Request(object):
+    """State of one request going through AuthProtocol"""
+
+    __slots__ = ('env', 'start_response', 'claims')
+
+    def __init__(self, env, start_response):
+        self.env = env
+        self.start_response = start_response
+        # The token the client presented
+        self.claims = None
+
+    def decorate(self, index, value):
+        """Add headers to request"""
+        self.env["HTTP_%s" % index] = value
+
+    def proxy_headers(self):
+        """Headers to forward the request to a remote service with.
+
+        Only needed when there is no downstream WSGI app, so the environ is
+        not copied until then.
+
+        """
+        return proxy.request_headers(self.env)
+
+
+class _AdminToken(object):
+    """The token the middleware authenticates to Keystone with.
+
+    Acquired with the configured admin credentials and renewed in the
+    background ahead of its expiry, or the static admin_token when no
+    credentials are configured.
+
+    """
+
+    def __init__(self, protocol, conf):
+        # Tells where Keystone is
+        self.protocol = protocol
+        self.static_token = conf.get('admin_token')
+        self.username = conf.get('admin_user')
+        self.password = conf.get('admin_password')
+        self.tenant = conf.get('admin_tenant')
+        self.renew_before = int(conf.get('admin_token_renew_before', 300))
+        self.retry_interval = int(conf.get('admin_token_retry_interval', 10))
+
+        self.token_id = None
+        self.expires = None
+        # When the current token was obtained, and of the last failure to
+        # get one
+        self.fetched = 0
+        self.failed = 0
+        # Requests needing a token while one is being fetched wait for it
+        self.fetches = singleflight.SingleFlight('auth_token.admin_token')
+        self.renewer = None
+
+    def get(self):
+        """Return the admin token, None if there is none yet; never waits
+        for one"""
+        if not self.username:
+            return self.static_token
+        if self.renewer is None:
+            # Started lazily so that the green thread runs in the server's hub
+            self.renewer = eventlet.spawn(self._renew_periodically)
+        return self.token_id
+
+    def renew(self, stale_token):
+        """Replace a token Keystone refused, or None while the first one
+        is being acquired.
+
+        :returns: the new token, or None if there is none to retry with
+
+        """
+        if not self.username:
+            return None
+        if self.token_id != stale_token:
+            # Another request already renewed it
+            return self.token_id
+        if time.time() - max(self.fetched, self.failed) < \
+                self.retry_interval:
+            # Just obtained, so it is the user's token that was refused; or
+            # Keystone just refused to give one
+            return None
+        self._acquire()
+        if self.token_id == stale_token:
+            return None
+        return self.token_id
+
+    def _acquire(self):
+        """Fetch a new token, sharing the call with concurrent requests"""
+        try:
+            self.fetches.do('admin', self._fetch)
+        except Exception:
+            logger.exception("Unable to get an admin token from Keystone")
+            self.failed = time.time()
+
+    def _fetch(self):
+        credentials = {"username": self.username, "password": self.password}
+        if self.tenant:
+            credentials["tenantId"] = self.tenant
+        body = json.dumps({"passwordCredentials": credentials})
+        headers = {"Content-type": "application/json",
+                   "Accept": "application/json",
+                   "Content-Length": str(len(body))}
+        conn = http_connect(self.protocol.auth_host, self.protocol.auth_port,
+                            'POST', '/v2.0/tokens', headers=headers,
+                            ssl=(self.protocol.auth_protocol == 'https'))
+        conn.send(body)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+
+        if not str(resp.status).startswith('20'):
+            raise LookupError('Keystone refused the admin credentials: %s' %
+                              resp.status)
+        token = json.loads(data)['auth']['token']
+        self.token_id = token['id']
+        self.expires = _expires(token)
+        self.fetched = time.time()
+
+    def _renew_delay(self):
+        """Seconds until the token should be renewed"""
+        if self.expires is None:
+            return self.renew_before
+        left = self.expires - time.time()
+        # Short lived tokens are renewed half way through their lifetime
+        return max(left - self.renew_before, left / 2, 1)
+
+    def _renew_periodically(self):
+        """Background loop acquiring the token, then renewing it before it
+        expires, so that requests never wait for it"""
+        while True:
+            if self.token_id is not None:
+                eventlet.sleep(self._renew_delay())
+            fetched = self.fetched
+            self._acquire()
+            if self.fetched == fetched:
+                eventlet.sleep(self.retry_interval)
+
+
+def _expires(token):
+    """Return when a token returned by Keystone expires, in seconds since
+    the epoch, or None if it doesn't say"""
+    try:
+        expires = datetime.strptime(token['expires'][:19],
+                                    '%Y-%m-%dT%H:%M:%S')
+    except (KeyError, TypeError, ValueError):
+        return None
+    return time.mktime(expires.timetuple())
 
 
 def filter_factory(global_conf, **local_conf):
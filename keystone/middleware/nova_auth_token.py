@@ -26,6 +26,11 @@ lazy provisioning nova projects/users as authenticated by auth_token.
 
 Use by applying after auth_token in the nova paste config.
 Example: docs/nova-api-paste.ini
+
+Users and project memberships already provisioned are remembered for
+cache_ttl seconds (default 300; 0 disables the cache), at most cache_size
+(default 1000) of them, so that nova's auth manager is only consulted the
+first time a user, project or admin-ness is seen.
 """
 
 from nova import auth
@@ -36,6 +41,8 @@ from nova import wsgi
 import webob.dec
 import webob.exc
 
+from keystone.common import lru
+
 
 FLAGS = flags.FLAGS
 
@@ -43,32 +50,55 @@ FLAGS = flags.FLAGS
 class KeystoneAuthShim(wsgi.Middleware):
     """Lazy provisioning nova project/users from keystone tenant/user"""
 
-    def __init__(self, application, db_driver=None):
+    def __init__(self, application, db_driver=None, auth_manager=None,
+                 cache_size=1000, cache_ttl=300):
         if not db_driver:
             db_driver = FLAGS.db_driver
         self.db = utils.import_object(db_driver)
-        self.auth = auth.manager.AuthManager()
+        self.auth = auth_manager or auth.manager.AuthManager()
+        # ('user', user id) => (user ref, admin-ness) and
+        # ('member', user id, project id) => project ref
+        self.provisioned = None
+        if int(cache_ttl):
+            self.provisioned = lru.LRUCache('nova_auth_token.provisioned',
+                                            int(cache_size), int(cache_ttl))
         super(KeystoneAuthShim, self).__init__(application)
 
-    @webob.dec.wsgify(RequestClass=wsgi.Request)
-    def __call__(self, req):
-        # find or create user
-        try:
-            user_id = req.headers['X_USER']
-        except:
-            return webob.exc.HTTPUnauthorized()
+    def _cached(self, key):
+        if self.provisioned is None:
+            return lru.MISSING
+        return self.provisioned.get(key)
+
+    def _remember(self, key, value):
+        if self.provisioned is not None:
+            self.provisioned.put(key, value)
+
+    def _provision_user(self, user_id, admin):
+        """Find or create the user, with the given admin-ness"""
+        cached = self._cached(('user', user_id))
+        if cached is not lru.MISSING and cached[1] == admin:
+            return cached[0]
+
         try:
             user_ref = self.auth.get_user(user_id)
         except:
             user_ref = self.auth.create_user(user_id)
 
         # set user admin-ness to keystone admin-ness
-        if user_ref.is_admin() != (req.headers.get('X_ROLE', None) == 'Admin'):
-            self.auth.modify_user(user_ref,
-                                  admin=req.headers.get('X_ROLE') == 'Admin')
+        if user_ref.is_admin() != admin:
+            self.auth.modify_user(user_ref, admin=admin)
+            user_ref = self.auth.get_user(user_id)
+
+        self._remember(('user', user_id), (user_ref, admin))
+        return user_ref
+
+    def _provision_project(self, user_id, project_id):
+        """Find or create the project, with the user as a member"""
+        cached = self._cached(('member', user_id, project_id))
+        if cached is not lru.MISSING:
+            return cached
 
         # create a project for tenant
-        project_id = req.headers['X_TENANT']
         try:
             project_ref = self.auth.get_project(project_id)
         except:
@@ -78,5 +108,21 @@ class KeystoneAuthShim(wsgi.Middleware):
         if not self.auth.is_project_member(user_id, project_id):
             self.auth.add_to_project(user_id, project_id)
 
-        req.environ['nova.context'] = context.RequestContext(user_ref, project_ref)
+        self._remember(('member', user_id, project_id), project_ref)
+        return project_ref
+
+    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        # find or create user
+        try:
+            user_id = req.headers['X_USER']
+        except:
+            return webob.exc.HTTPUnauthorized()
+        user_ref = self._provision_user(user_id,
+                                        req.headers.get('X_ROLE') == 'Admin')
+        project_ref = self._provision_project(user_id,
+                                              req.headers['X_TENANT'])
+
+        req.environ['nova.context'] = context.RequestContext(user_ref,
+                                                             project_ref)
         return self.application
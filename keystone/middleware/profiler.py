@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+PER-REQUEST PROFILING MIDDLEWARE
+
+This WSGI component runs individual requests under cProfile so that a single
+slow route can be examined without profiling the whole process.
+
+- A request carrying an X-Profile header and a valid admin X-Auth-Token is
+    profiled. If 'output_dir' is set the pstats are written there and the file
+    name is returned in the X-Profile-File response header, otherwise the
+    response body is replaced with the formatted stats.
+- If 'sample_rate' is set (0.0 - 1.0), that fraction of all requests is
+    profiled and the pstats of the 'keep_slowest' slowest ones are kept in
+    'output_dir'.
+
+When 'enabled' is false (the default) the filter factory hands back the
+wrapped application untouched, so the filter costs nothing.
+
+"""
+
+import cProfile
+import heapq
+import itertools
+import logging
+import os
+import pstats
+import random
+import StringIO
+import time
+
+from webob import Response
+
+import keystone.config as config
+import keystone.logic.types.fault as fault
+
+PROTOCOL_NAME = "Request Profiler"
+
+# WSGI environ key for the X-Profile request header
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+logger = logging.getLogger('keystone.middleware.profiler')
+
+
+class ProfilerMiddleware(object):
+    """Middleware filter that profiles selected requests"""
+
+    def __init__(self, app, conf):
+        print "Starting the %s component" % PROTOCOL_NAME
+        self.app = app
+        self.conf = conf
+        self.output_dir = conf.get('output_dir')
+        self.sort_by = conf.get('sort_by', 'cumulative')
+        self.limit = int(conf.get('limit', 40))
+        self.sample_rate = float(conf.get('sample_rate', 0))
+        self.keep_slowest = int(conf.get('keep_slowest', 10))
+
+        if self.sample_rate and not self.output_dir:
+            logger.warn("Profiler sampling needs an output_dir; disabled")
+            self.sample_rate = 0
+
+        # Min-heap of (elapsed, file name) of the slowest sampled
+        # requests, so the fastest of them is always the one evicted
+        self.slowest = []
+        self._sequence = itertools.count()
+
+    def __call__(self, env, start_response):
+        if PROFILE_HEADER in env:
+            if self._is_authorized(env):
+                return self._profile_request(env, start_response)
+        elif self.sample_rate and random.random() < self.sample_rate:
+            return self._sample_request(env, start_response)
+        return self.app(env, start_response)
+
+    def _is_authorized(self, env):
+        """Only admins may ask for a profile"""
+        token = env.get('HTTP_X_AUTH_TOKEN')
+        if not token:
+            return False
+        try:
+            # Validating the token with itself as the admin token checks
+            # both that it is valid and that it carries the admin role
+            config.SERVICE.validate_token(token, token)
+        except fault.IdentityFault:
+            return False
+        return True
+
+    def _run_profiled(self, env):
+        """Run the request under cProfile.
+
+        :returns: tuple of (profile, elapsed seconds, status, headers, body)
+
+        """
+        response = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+            return response.setdefault('body', []).append
+
+        def run_app():
+            app_iter = self.app(env, capture_start_response)
+            try:
+                body = ''.join(app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+            return ''.join(response.get('body', [])) + body
+
+        profile = cProfile.Profile()
+        start = time.time()
+        body = profile.runcall(run_app)
+        elapsed = time.time() - start
+        return (profile, elapsed, response['status'], response['headers'],
+                body)
+
+    def _profile_name(self, env):
+        path = env.get('PATH_INFO', '/').strip('/').replace('/', '_')
+        return '%s-%d-%s-%s.pstats' % (time.strftime('%Y%m%d%H%M%S'),
+                                       self._sequence.next(),
+                                       env.get('REQUEST_METHOD', 'GET'),
+                                       path or 'root')
+
+    def _format_stats(self, profile):
+        stream = StringIO.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.sort_stats(self.sort_by).print_stats(self.limit)
+        return stream.getvalue()
+
+    def _profile_request(self, env, start_response):
+        """Profile a request that explicitly asked for it"""
+        profile, elapsed, status, headers, body = self._run_profiled(env)
+        logger.info("Profiled %s %s in %.4f seconds",
+                    env.get('REQUEST_METHOD'), env.get('PATH_INFO'), elapsed)
+
+        if self.output_dir:
+            name = self._profile_name(env)
+            profile.dump_stats(os.path.join(self.output_dir, name))
+            headers = list(headers) + [('X-Profile-File', name)]
+            start_response(status, headers)
+            return [body]
+
+        resp = Response(content_type='text/plain',
+                        body=self._format_stats(profile))
+        resp.headers['X-Profile-Status'] = status
+        resp.headers['X-Profile-Elapsed'] = '%.6f' % elapsed
+        return resp(env, start_response)
+
+    def _sample_request(self, env, start_response):
+        """Profile a sampled request, keeping it if it is among the slowest"""
+        profile, elapsed, status, headers, body = self._run_profiled(env)
+
+        if len(self.slowest) < self.keep_slowest or \
+                elapsed > self.slowest[0][0]:
+            name = self._profile_name(env)
+            profile.dump_stats(os.path.join(self.output_dir, name))
+            entry = (elapsed, name)
+            if len(self.slowest) < self.keep_slowest:
+                heapq.heappush(self.slowest, entry)
+            else:
+                evicted = heapq.heapreplace(self.slowest, entry)
+                try:
+                    os.remove(os.path.join(self.output_dir, evicted[1]))
+                except OSError:
+                    pass
+
+        start_response(status, headers)
+        return [body]
+
+
+def filter_factory(global_conf, **local_conf):
+    """Returns a WSGI filter app for use with paste.deploy."""
+    conf = global_conf.copy()
+    conf.update(local_conf)
+
+    def profiler_filter(app):
+        if str(conf.get('enabled', False)).lower() not in ('true', '1'):
+            # Disabled: stay out of the pipeline entirely
+            return app
+        return ProfilerMiddleware(app, conf)
+    return profiler_filter
@@ -40,10 +40,15 @@ Authorization via callback
 """
 
 import json
+import urllib
 from urlparse import urlparse
+
+import eventlet
 from webob.exc import HTTPUnauthorized, HTTPNotFound, HTTPExpectationFailed
 
 from keystone.common.bufferedhttp import http_connect_raw as http_connect
+from keystone.common import signing
+from keystone.common import singleflight
 
 from swift.common.middleware.acl import clean_acl, parse_acl, referrer_allowed
 from swift.common.utils import cache_from_env, get_logger, split_path
@@ -65,6 +70,18 @@ class AuthProtocol(object):
         keystone_url = http://127.0.0.1:8080
         keystone_admin_token = 999888777666
 
+    If Keystone issues signed tokens, add the shared key as 'signing_key' and
+    set 'revocation_poll_interval' to verify them locally instead of asking
+    Keystone. A background thread then asks Keystone every that many seconds
+    for the revocation events since the last poll, and signed tokens revoked,
+    or whose user or tenant was disabled, after they were issued are refused.
+    Signed tokens are only verified locally once the first poll succeeded;
+    without polling they are validated by Keystone like the others.
+
+    Requests presenting the same token at the same time share a single call
+    to Keystone, waiting for it at most 'coalesce_timeout' seconds (default
+    10) before making their own.
+
     """
 
     def __init__(self, app, conf):
@@ -73,7 +90,20 @@ class AuthProtocol(object):
         self.keystone_url = urlparse(conf.get('keystone_url'))
         self.admin_token = conf.get('keystone_admin_token')
         self.reseller_prefix = conf.get('reseller_prefix', 'AUTH')
+        self.signing_key = conf.get('signing_key')
+        self.revocation_poll_interval = int(conf.get(
+            'revocation_poll_interval', 0))
+        self.revocations = signing.Revocations()
+        self.revocation_poller = None
+        # Concurrent validations of a token are coalesced; requests wait at
+        # most this many seconds for another's validation
+        self.validations = singleflight.SingleFlight(
+            'swift_auth.validations',
+            float(conf.get('coalesce_timeout', 10)))
         self.log = get_logger(conf, log_route='keystone')
+        if self.signing_key and not self.revocation_poll_interval:
+            self.log.warning('signing_key is ignored without '
+                             'revocation_poll_interval')
         self.log.info('Keystone middleware started')
 
     def __call__(self, env, start_response):
@@ -85,6 +115,9 @@ class AuthProtocol(object):
         """
 
         self.log.debug('Keystone middleware called')
+        if self.revocation_poll_interval and not self.revocation_poller:
+            # Started lazily so that the green thread runs in the server's hub
+            self.revocation_poller = eventlet.spawn(self._poll_revocations)
         token = self._get_claims(env)
         self.log.debug('token: %s', token)
         if token:
@@ -196,8 +229,28 @@ class AuthProtocol(object):
     def _validate_claims(self, claims):
         """Ask keystone (as keystone admin) for information for this user."""
 
+        if self.signing_key and self.revocations.since and \
+                signing.is_signed(claims):
+            self.log.debug('Verifying signed token locally')
+            try:
+                payload = signing.verify(self.signing_key, claims)
+            except signing.InvalidToken, e:
+                self.log.debug('signed token rejected: %s', e)
+                return False
+            if self.revocations.is_revoked(claims, payload):
+                self.log.debug('signed token revoked')
+                return False
+            return {'user': payload['u'],
+                    'tenant': payload['t'],
+                    'roles': payload['r']}
+
         # TODO(todd): cache
 
+        # Requests presenting the same token at the same time share one call
+        return self.validations.do(claims, self._fetch_identity, claims)
+
+    def _fetch_identity(self, claims):
+        """Validate claims with Keystone"""
         self.log.debug('Asking keystone to validate token')
         headers = {"Content-type": "application/json",
                     "Accept": "text/json",
@@ -228,6 +281,30 @@ class AuthProtocol(object):
 
         return identity
 
+    def _poll_revocations(self):
+        """Background loop fetching revocation events from Keystone"""
+        while True:
+            try:
+                self._fetch_revocations()
+            except Exception:
+                self.log.exception('Unable to fetch revocation events')
+            eventlet.sleep(self.revocation_poll_interval)
+
+    def _fetch_revocations(self):
+        """Record the revocation events since the last poll"""
+        query = urllib.urlencode({'since': repr(self.revocations.since)})
+        headers = {"Accept": "application/json",
+                   "X-Auth-Token": self.admin_token}
+        conn = http_connect(self.keystone_url.hostname, self.keystone_url.port,
+                            'GET', '/v2.0/revocations', headers=headers,
+                            query_string=query)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        if not str(resp.status).startswith('20'):
+            raise LookupError('Unable to fetch revocations: %s' % resp.status)
+        self.revocations.apply(json.loads(data)['revocations'])
+
 
 def filter_factory(global_conf, **local_conf):
     """Returns a WSGI filter app for use with paste.deploy."""
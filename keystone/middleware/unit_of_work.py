@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+UNIT OF WORK MIDDLEWARE
+
+This WSGI component opens a request-scoped SQL session scope (see
+keystone.common.sessions) around the rest of the pipeline. Every backend call
+made while handling the request shares one session per backend, and the
+request's changes are committed once, after the application has answered.
+
+Responses with an error status (400 and up) and requests that raise roll the
+changes back instead, so a request that fails part way leaves nothing behind.
+
+"""
+
+import logging
+
+from webob import Request
+
+from keystone.common import sessions
+
+PROTOCOL_NAME = "Unit of Work"
+
+logger = logging.getLogger('keystone.middleware.unit_of_work')
+
+
+class UnitOfWorkMiddleware(object):
+    """Middleware filter that gives each request one SQL session"""
+
+    def __init__(self, app, conf):
+        print "Starting the %s component" % PROTOCOL_NAME
+        self.app = app
+        self.conf = conf
+
+    def __call__(self, env, start_response):
+        if sessions.in_scope():
+            # Already wrapped further up the pipeline
+            return self.app(env, start_response)
+
+        sessions.begin()
+        try:
+            response = Request(env).get_response(self.app)
+        except Exception:
+            sessions.end(commit=False)
+            raise
+        sessions.end(commit=response.status_int < 400)
+        return response(env, start_response)
+
+
+def filter_factory(global_conf, **local_conf):
+    """Returns a WSGI filter app for use with paste.deploy."""
+    conf = global_conf.copy()
+    conf.update(local_conf)
+
+    def unit_of_work_filter(app):
+        return UnitOfWorkMiddleware(app, conf)
+    return unit_of_work_filter
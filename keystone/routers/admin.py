@@ -2,9 +2,11 @@ import routes
 
 from keystone.common import wsgi
 import keystone.backends as db
+import keystone.config as config
 from keystone.controllers.auth import AuthController
 from keystone.controllers.endpointtemplates import EndpointTemplatesController
 from keystone.controllers.groups import GroupsController
+from keystone.controllers.metrics import MetricsController
 from keystone.controllers.roles import RolesController
 from keystone.controllers.staticfiles import StaticFilesController
 from keystone.controllers.tenant import TenantController
@@ -20,18 +22,34 @@ class AdminApi(wsgi.Router):
         mapper = routes.Mapper()
 
         db.configure_backends(options)
+        config.SERVICE.configure(options)
         
         # Token Operations
         auth_controller = AuthController(options)
         mapper.connect("/v2.0/tokens", controller=auth_controller,
                        action="authenticate",
                        conditions=dict(method=["POST"]))
+        mapper.connect("/v2.0/tokens/validate", controller=auth_controller,
+                       action="validate_tokens",
+                       conditions=dict(method=["POST"]))
         mapper.connect("/v2.0/tokens/{token_id}", controller=auth_controller,
                         action="validate_token",
                         conditions=dict(method=["GET"]))
+        mapper.connect("/v2.0/tokens/{token_id}", controller=auth_controller,
+                        action="check_token",
+                        conditions=dict(method=["HEAD"]))
         mapper.connect("/v2.0/tokens/{token_id}", controller=auth_controller,
                         action="delete_token",
                         conditions=dict(method=["DELETE"]))
+        mapper.connect("/v2.0/revocations", controller=auth_controller,
+                        action="get_revocations",
+                        conditions=dict(method=["GET"]))
+
+        # Metrics
+        metrics_controller = MetricsController(options)
+        mapper.connect("/v2.0/metrics", controller=metrics_controller,
+                        action="get_metrics",
+                        conditions=dict(method=["GET"]))
 
         # Tenant Operations
         tenant_controller = TenantController(options)
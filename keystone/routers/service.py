@@ -2,6 +2,7 @@ import routes
 
 from keystone.common import wsgi
 import keystone.backends as db
+import keystone.config as config
 from keystone.controllers.auth import AuthController
 from keystone.controllers.tenant import TenantController
 from keystone.controllers.version import VersionController
@@ -15,6 +16,7 @@ class ServiceApi(wsgi.Router):
         mapper = routes.Mapper()
         
         db.configure_backends(options)
+        config.SERVICE.configure(options)
         
         # Token Operations
         auth_controller = AuthController(options)
@@ -3,14 +3,24 @@ import sys
 import subprocess
 import time
 
+DATABASES = ['keystone.db', 'keystone.token.db', 'ldap.db', 'ldap.db.db']
+
+
+def remove_databases(test_dir):
+    # The -wal and -shm files of SQLite databases in WAL mode must go too, or
+    # they could be replayed into the next database of the same name
+    for database in DATABASES:
+        for suffix in ['', '-wal', '-shm']:
+            path = os.path.join(test_dir, database + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
 if __name__ == '__main__':
     test_dir = os.path.dirname(__file__)
 
     #remove pre-existing test databases
-    subprocess.call(['rm', os.path.join(test_dir, 'keystone.db')])
-    subprocess.call(['rm', os.path.join(test_dir, 'keystone.token.db')])
-    subprocess.call(['rm', os.path.join(test_dir, 'ldap.db')])
-    subprocess.call(['rm', os.path.join(test_dir, 'ldap.db.db')])
+    remove_databases(test_dir)
 
     # populate the test database
     subprocess.check_call([os.path.join(test_dir, '../../bin/sampledata.sh')])
@@ -39,7 +49,4 @@ if __name__ == '__main__':
             server.kill()
     finally:
         # remove test databases
-        subprocess.call(['rm', os.path.join(test_dir, 'keystone.db')])
-        subprocess.call(['rm', os.path.join(test_dir, 'keystone.token.db')])
-        subprocess.call(['rm', os.path.join(test_dir, 'ldap.db')])
-        subprocess.call(['rm', os.path.join(test_dir, 'ldap.db.db')])
+        remove_databases(test_dir)
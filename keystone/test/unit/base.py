@@ -24,14 +24,36 @@ import pprint
 import unittest
 
 from lxml import etree, objectify
+from sqlalchemy import event
 import webob
 
 from keystone import server
+import keystone.backends as backends
 import keystone.backends.sqlalchemy as db
 import keystone.backends.api as db_api
+import keystone.backends.models as db_models
 
 logger = logging.getLogger('test.unit.base')
 
+# Options of the in-memory SQL database SQLBackendTest runs against
+SQL_OPTIONS = {'backends': 'keystone.backends.sqlalchemy',
+               'keystone-admin-role': 'Admin',
+               'keystone.backends.sqlalchemy': {
+                   'sql_connection': 'sqlite://',
+                   'sql_idle_timeout': '30',
+                   'backend_entities': "['UserGroupAssociation', "
+                       "'UserRoleAssociation', 'Endpoints', 'Role', "
+                       "'Tenant', 'User', 'Group', 'Credentials', "
+                       "'EndpointTemplates', 'Token']"}}
+
+# (statement, parameters) pairs executed by the SQL backend's engine, see
+# SQLBackendTest
+STATEMENTS = []
+
+
+def _record_statement(conn, cursor, statement, parameters, *args):
+    STATEMENTS.append((statement, parameters))
+
 
 class ServiceAPITest(unittest.TestCase):
     
@@ -281,3 +303,56 @@ class AdminAPITest(ServiceAPITest):
                        'email': 'admin_user@example.com',
                        'enabled': True,
                        'tenant_id': 'tenant2'}
+
+
+class SQLBackendTest(unittest.TestCase):
+
+    """
+    Base test case class for unit tests run directly against the SQL
+    backend, on an empty in-memory database. The statements the backend
+    executes are recorded, see `statements`.
+    """
+
+    """
+    Dict of options the backends are configured with
+    """
+    options = SQL_OPTIONS
+
+    def setUp(self):
+        backends.configure_backends(self.options)
+        db.unregister_models()
+        db.register_models(self.options['keystone.backends.sqlalchemy'])
+
+        # Listeners cannot be removed from an engine, so only add it once
+        if not getattr(db._ENGINE, '_recording_statements', False):
+            event.listen(db._ENGINE, 'before_cursor_execute',
+                         _record_statement)
+            db._ENGINE._recording_statements = True
+        self.reset_statements()
+
+    def fixture_create(self, model, **values):
+        """
+        Creates and returns a row of one of the backend's models.
+
+        :param model: Name of the model, e.g. 'Tenant'
+        :params **values: Attributes of the row to create
+        """
+        obj = getattr(db_models, model)()
+        for key, value in values.items():
+            setattr(obj, key, value)
+        obj.save()
+        return obj
+
+    def reset_statements(self):
+        """
+        Forgets the statements recorded so far
+        """
+        del STATEMENTS[:]
+
+    def statements(self, prefix=''):
+        """
+        Returns the statements executed since the last reset_statements
+        that start with prefix, e.g. 'SELECT'
+        """
+        return [statement for statement, _parameters in STATEMENTS
+                if statement.startswith(prefix)]
@@ -0,0 +1,205 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import unittest
+
+import eventlet
+import eventlet.event
+
+from keystone.common import metrics
+from keystone.common import wsgi
+
+
+class BlockingApp(object):
+    """Answers each request once its path is released"""
+
+    def __init__(self):
+        self.started = []
+        self.releases = {}
+
+    def __call__(self, env, start_response):
+        path = env['PATH_INFO']
+        self.started.append(path)
+        self.releases[path] = eventlet.event.Event()
+        self.releases[path].wait()
+        start_response('200 OK', [])
+        return [path]
+
+    def release(self, path):
+        self.releases[path].send()
+
+
+class AdmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.app = BlockingApp()
+
+    def _admission(self, **kwargs):
+        return wsgi.Admission(self.app, 'test', **kwargs)
+
+    def _call(self, admission, path, **env):
+        """Make a request, returning (status, headers, body)"""
+        responses = []
+
+        def start_response(status, headers, exc_info=None):
+            responses.append((status, headers))
+
+        env.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': path})
+        result = admission(env, start_response)
+        try:
+            body = ''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return responses[0][0], dict(responses[0][1]), body
+
+    def _spawn(self, admission, path, **env):
+        call = eventlet.spawn(self._call, admission, path, **env)
+        eventlet.sleep(0)
+        return call
+
+    def test_within_limit(self):
+        admission = self._admission(max_concurrency=2)
+        first = self._spawn(admission, '/a')
+        second = self._spawn(admission, '/b')
+        self.assertEqual(['/a', '/b'], self.app.started)
+        self.app.release('/a')
+        self.app.release('/b')
+        self.assertEqual('200 OK', first.wait()[0])
+        self.assertEqual('200 OK', second.wait()[0])
+        self.assertEqual(0, admission.in_flight)
+
+    def test_shed_over_limit_without_queue(self):
+        admission = self._admission(max_concurrency=1, retry_after=3)
+        first = self._spawn(admission, '/a')
+        status, headers, _body = self._call(admission, '/b')
+        self.assertEqual('503 Service Unavailable', status)
+        self.assertEqual('3', headers['Retry-After'])
+        self.assertEqual(['/a'], self.app.started)
+        self.assertEqual(1, metrics.snapshot()['counters'][
+            'test.admission.shed'])
+        self.app.release('/a')
+        first.wait()
+
+    def test_queued_until_slot_frees(self):
+        admission = self._admission(max_concurrency=1, max_queue=1)
+        first = self._spawn(admission, '/a')
+        second = self._spawn(admission, '/b')
+        self.assertEqual(['/a'], self.app.started)
+        self.assertEqual(1, admission._queued())
+        self.app.release('/a')
+        first.wait()
+        eventlet.sleep(0)
+        self.assertEqual(['/a', '/b'], self.app.started)
+        self.app.release('/b')
+        self.assertEqual('200 OK', second.wait()[0])
+        self.assertEqual(0, admission.in_flight)
+
+    def test_shed_after_queue_time(self):
+        admission = self._admission(max_concurrency=1, max_queue=1,
+                                    max_queue_time=0.05)
+        first = self._spawn(admission, '/a')
+        status, _headers, _body = self._call(admission, '/b')
+        self.assertEqual('503 Service Unavailable', status)
+        self.assertEqual(0, admission._queued())
+        self.app.release('/a')
+        first.wait()
+        self.assertEqual(0, admission.in_flight)
+
+    def test_shed_when_queue_full(self):
+        admission = self._admission(max_concurrency=1, max_queue=1)
+        first = self._spawn(admission, '/a')
+        second = self._spawn(admission, '/b')
+        status, _headers, _body = self._call(admission, '/c')
+        self.assertEqual('503 Service Unavailable', status)
+        self.app.release('/a')
+        first.wait()
+        eventlet.sleep(0)
+        self.app.release('/b')
+        second.wait()
+
+    def test_priority_admitted_first(self):
+        admission = self._admission(max_concurrency=1, max_queue=2)
+        first = self._spawn(admission, '/v2.0/tenants')
+        listing = self._spawn(admission, '/v2.0/users')
+        token = self._spawn(admission, '/v2.0/tokens/abc')
+        self.app.release('/v2.0/tenants')
+        first.wait()
+        eventlet.sleep(0)
+        self.assertEqual('/v2.0/tokens/abc', self.app.started[-1])
+        self.app.release('/v2.0/tokens/abc')
+        token.wait()
+        eventlet.sleep(0)
+        self.app.release('/v2.0/users')
+        self.assertEqual('200 OK', listing.wait()[0])
+
+    def test_priority_takes_queue_place_of_ordinary(self):
+        admission = self._admission(max_concurrency=1, max_queue=1)
+        first = self._spawn(admission, '/v2.0/tenants')
+        listing = self._spawn(admission, '/v2.0/users')
+        token = self._spawn(admission, '/v2.0/tokens')
+        self.assertEqual('503 Service Unavailable', listing.wait()[0])
+        self.app.release('/v2.0/tenants')
+        first.wait()
+        eventlet.sleep(0)
+        self.app.release('/v2.0/tokens')
+        self.assertEqual('200 OK', token.wait()[0])
+
+    def test_priority_reserve(self):
+        admission = self._admission(max_concurrency=2, priority_reserve=1)
+        first = self._spawn(admission, '/v2.0/tenants')
+        status, _headers, _body = self._call(admission, '/v2.0/users')
+        self.assertEqual('503 Service Unavailable', status)
+        token = self._spawn(admission, '/v2.0/tokens')
+        self.assertEqual(['/v2.0/tenants', '/v2.0/tokens'], self.app.started)
+        self.app.release('/v2.0/tenants')
+        self.app.release('/v2.0/tokens')
+        first.wait()
+        token.wait()
+
+    def test_slot_released_on_error(self):
+
+        def failing(env, start_response):
+            raise ValueError()
+        admission = wsgi.Admission(failing, 'test', max_concurrency=1)
+        self.assertRaises(ValueError, admission, {'PATH_INFO': '/'}, None)
+        self.assertEqual(0, admission.in_flight)
+
+    def test_is_priority(self):
+        for path in ('/v2.0/tokens', '/v2.0/tokens/abc', '/tokens.json',
+                     '/v2.0/tokens/abc/endpoints'):
+            self.assertTrue(wsgi.is_priority({'PATH_INFO': path}), path)
+        for path in ('/v2.0/tenants', '/v2.0/tokensmith', '/v2.0/users'):
+            self.assertFalse(wsgi.is_priority({'PATH_INFO': path}), path)
+        self.assertTrue(wsgi.is_priority({'PATH_INFO': '/v1.0',
+                                          'HTTP_X_AUTH_USER': 'joeuser'}))
+
+    def test_listener_options(self):
+        options = wsgi.listener_options({'admin_max_concurrency': '10',
+                                         'admin_max_queue_time': '0.5',
+                                         'service_max_queue': '7'}, 'admin')
+        self.assertEqual({'name': 'admin', 'backlog': 128,
+                          'max_concurrency': 10, 'max_queue': 0,
+                          'max_queue_time': 0.5, 'retry_after': 1,
+                          'priority_reserve': 0, 'threads': 0,
+                          'workers': 0}, options)
+
+
+if __name__ == '__main__':
+    unittest.main()
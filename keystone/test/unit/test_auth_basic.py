@@ -0,0 +1,177 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import base64
+import json
+import unittest
+
+import eventlet
+from eventlet import wsgi
+from webob import Request, Response
+
+from keystone.common import metrics
+from keystone.middleware import auth_basic
+
+PASSWORDS = {'joeuser': 'secrete', 'admin': 'secrete'}
+
+
+class NullLog(object):
+
+    def write(self, data):
+        pass
+
+
+class FakeKeystone(object):
+    """Authenticates PASSWORDS, counting the requests it gets"""
+
+    def __init__(self):
+        self.calls = 0
+        self.status = None
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.server = eventlet.spawn(wsgi.server, self.sock, self,
+                                     log=NullLog())
+
+    def stop(self):
+        self.server.kill()
+        self.sock.close()
+
+    def __call__(self, env, start_response):
+        self.calls += 1
+        body = json.loads(env['wsgi.input'].read(
+            int(env['CONTENT_LENGTH'])))['passwordCredentials']
+        if self.status:
+            status = self.status
+        elif PASSWORDS.get(body['username']) == body['password']:
+            status = '200 OK'
+        else:
+            status = '401 Unauthorized'
+        start_response(status, [('Content-Type', 'application/json')])
+        return ['{}']
+
+
+class AuthBasicTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.keystone = FakeKeystone()
+        self.middleware = self._middleware()
+
+    def tearDown(self):
+        self.keystone.stop()
+
+    def _middleware(self, **conf):
+        settings = {'service_port': '8100',
+                    'service_pass': 'dTpw',
+                    'auth_protocol': 'http',
+                    'auth_host': '127.0.0.1',
+                    'auth_port': str(self.keystone.port),
+                    'lockout_threshold': '3'}
+        settings.update(conf)
+        return auth_basic.filter_factory({}, **settings)(self.app)
+
+    def app(self, env, start_response):
+        return Response(env['HTTP_X_IDENTITY_STATUS'])(env, start_response)
+
+    def _call(self, user='joeuser', password='secrete'):
+        credentials = base64.b64encode('%s:%s' % (user, password))
+        request = Request.blank('/', headers={
+            'Authorization': 'Basic %s' % credentials})
+        return request.get_response(self.middleware)
+
+    def _calls(self, *args):
+        before = self.keystone.calls
+        response = self._call(*args)
+        return response.status_int, self.keystone.calls - before
+
+    def test_accepted_credentials_cached(self):
+        self.assertEqual((200, 1), self._calls())
+        self.assertEqual((200, 0), self._calls())
+        self.assertEqual('Confirmed', self._call().body)
+
+    def test_rejected_credentials_cached(self):
+        self.assertEqual((401, 1), self._calls('joeuser', 'wrong'))
+        self.assertEqual((401, 0), self._calls('joeuser', 'wrong'))
+
+    def test_negative_cache_expires(self):
+        self.middleware = self._middleware(negative_cache_ttl='0')
+        self.assertEqual((401, 1), self._calls('joeuser', 'wrong'))
+        self.assertEqual((401, 1), self._calls('joeuser', 'wrong'))
+
+    def test_lockout(self):
+        for password in ('wrong1', 'wrong2', 'wrong3'):
+            self.assertEqual((401, 1), self._calls('joeuser', password))
+        # Even the right password is now refused, without asking Keystone
+        self.assertEqual((401, 0), self._calls('joeuser', 'secrete'))
+        self.assertEqual(1, metrics.snapshot()['counters'][
+            'auth_basic.locked_out'])
+        # Other users are not affected
+        self.assertEqual((200, 1), self._calls('admin', 'secrete'))
+
+    def test_lockout_ends(self):
+        self.middleware = self._middleware(lockout_period='0')
+        for password in ('wrong1', 'wrong2', 'wrong3'):
+            self._call('joeuser', password)
+        self.assertEqual((200, 1), self._calls('joeuser', 'secrete'))
+
+    def test_success_resets_failures(self):
+        self._call('joeuser', 'wrong1')
+        self._call('joeuser', 'wrong2')
+        self._call('joeuser', 'secrete')
+        self._call('joeuser', 'wrong3')
+        self.assertEqual(200, self._call('joeuser', 'secrete').status_int)
+
+    def test_keystone_errors_are_not_cached(self):
+        self.keystone.status = '500 Internal Server Error'
+        self.assertEqual((401, 1), self._calls())
+        self.keystone.status = None
+        self.assertEqual((200, 1), self._calls())
+
+    def test_keystone_down(self):
+        self.keystone.stop()
+        self.middleware = self._middleware(auth_port='1')
+        self.assertEqual(401, self._call().status_int)
+        self.assertEqual(1, metrics.snapshot()['counters'][
+            'auth_basic.keystone_errors'])
+
+    def test_credentials_hashed_with_salt(self):
+        self._call()
+        keys = self.middleware.accepted.entries.keys()
+        self.assertEqual(1, len(keys))
+        self.assertFalse('secrete' in keys[0])
+        other = self._middleware()
+        self.assertNotEqual(self.middleware.salt, other.salt)
+
+    def test_connections_pooled(self):
+        for user in ('joeuser', 'admin', 'nobody'):
+            self._call(user, 'secrete')
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(1,
+                         counters['auth_basic.keystone.connections.created'])
+        self.assertEqual(2,
+                         counters['auth_basic.keystone.connections.reused'])
+
+    def test_delayed_decision(self):
+        self.middleware = self._middleware(delay_auth_decision='1')
+        self.assertEqual('Invalid', self._call('joeuser', 'wrong').body)
+        response = Request.blank('/').get_response(self.middleware)
+        self.assertEqual('Invalid', response.body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+from datetime import datetime, timedelta
+import json
+import time
+import unittest
+
+import eventlet
+
+from keystone.middleware import auth_token
+
+
+class FakeResponse(object):
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class FakeKeystone(object):
+    """Issues admin tokens living `lifetime` seconds and validates
+    'token-N' for callers presenting a current one"""
+
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.admin_tokens = set()
+        self.logins = []
+        self.issued = 0
+        self.validations = []
+        self.refuse_logins = False
+
+    def issue(self):
+        token_id = 'admin-%s' % self.issued
+        self.issued += 1
+        self.admin_tokens.add(token_id)
+        expires = datetime.now() + timedelta(seconds=self.lifetime)
+        return json.dumps({'auth': {'token': {
+            'id': token_id, 'expires': expires.isoformat()}}})
+
+    def http_connect(self, host, port, method, path, headers=None,
+                     **kwargs):
+        return FakeConnection(self, method, path, headers)
+
+
+class FakeConnection(object):
+
+    def __init__(self, keystone, method, path, headers):
+        self.keystone = keystone
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.sent = ''
+
+    def send(self, data):
+        self.sent += data
+
+    def getresponse(self):
+        eventlet.sleep(0)
+        keystone = self.keystone
+        if self.method == 'POST':
+            keystone.logins.append(json.loads(self.sent))
+            if keystone.refuse_logins:
+                return FakeResponse(401, '')
+            return FakeResponse(200, keystone.issue())
+        keystone.validations.append(self.headers['X-Auth-Token'])
+        token_id = self.path.rsplit('/', 1)[-1]
+        if self.headers['X-Auth-Token'] not in keystone.admin_tokens or \
+                not token_id.startswith('token-'):
+            return FakeResponse(401, '')
+        return FakeResponse(200, json.dumps(
+            {'auth': {'token': {'id': token_id},
+                      'user': {'username': 'user', 'tenantId': 'tenant',
+                               'roleRefs': []}}}))
+
+    def close(self):
+        pass
+
+
+class AdminTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keystone = FakeKeystone()
+        self.http_connect = auth_token.http_connect
+        auth_token.http_connect = self.keystone.http_connect
+        self.middlewares = []
+
+    def tearDown(self):
+        auth_token.http_connect = self.http_connect
+        for middleware in self.middlewares:
+            if middleware.admin.renewer:
+                middleware.admin.renewer.kill()
+
+    def _middleware(self, **conf):
+        conf.setdefault('admin_user', 'admin')
+        conf.setdefault('admin_password', 'secrete')
+        conf.update({'service_port': '8100', 'auth_host': '127.0.0.1',
+                     'auth_port': '5001', 'auth_protocol': 'http',
+                     'service_pass': 'dTpw'})
+        middleware = auth_token.AuthProtocol(self.app, conf)
+        self.middlewares.append(middleware)
+        return middleware
+
+    def app(self, env, start_response):
+        start_response('200 OK', [])
+        return [env['HTTP_X_IDENTITY_STATUS']]
+
+    def _call(self, middleware, token):
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status)
+
+        list(middleware({'REQUEST_METHOD': 'GET',
+                          'HTTP_X_AUTH_TOKEN': token}, start_response))
+        return statuses[0]
+
+    def test_admin_token_acquired_with_credentials(self):
+        middleware = self._middleware(admin_tenant='1')
+        self.assertEqual('200 OK', self._call(middleware, 'token-1'))
+        self.assertEqual([{'passwordCredentials': {'username': 'admin',
+                                                   'password': 'secrete',
+                                                   'tenantId': '1'}}],
+                         self.keystone.logins)
+        self.assertEqual(['admin-0'], self.keystone.validations)
+
+        self.assertEqual('200 OK', self._call(middleware, 'token-2'))
+        self.assertEqual(1, len(self.keystone.logins))
+
+    def test_acquired_in_background(self):
+        middleware = self._middleware()
+        self.assertEqual(None, middleware.admin.get())
+        self.assertEqual([], self.keystone.logins)
+        eventlet.sleep(0.01)
+        self.assertEqual('admin-0', middleware.admin.get())
+        self.assertEqual(1, len(self.keystone.logins))
+
+    def test_first_acquisition_shared(self):
+        middleware = self._middleware()
+        pool = eventlet.GreenPool()
+        statuses = list(pool.imap(lambda i: self._call(middleware,
+                                                       'token-%s' % i),
+                                  range(100)))
+        self.assertEqual(['200 OK'] * 100, statuses)
+        self.assertEqual(1, len(self.keystone.logins))
+
+    def test_refused_admin_token_renewed_once(self):
+        middleware = self._middleware(admin_token_retry_interval='0')
+        self.assertEqual('200 OK', self._call(middleware, 'token-1'))
+        # Keystone forgets the token, e.g. it was revoked
+        self.keystone.admin_tokens.clear()
+        self.assertEqual('200 OK', self._call(middleware, 'token-2'))
+        self.assertEqual(2, len(self.keystone.logins))
+        self.assertEqual(['admin-0', 'admin-0', 'admin-1'],
+                         self.keystone.validations)
+
+    def test_bad_user_tokens_dont_renew_fresh_admin_token(self):
+        middleware = self._middleware()
+        for i in range(10):
+            self.assertEqual('401 Unauthorized',
+                             self._call(middleware, 'bogus-%s' % i))
+        self.assertEqual(1, len(self.keystone.logins))
+
+    def test_renewed_ahead_of_expiry(self):
+        self.keystone.lifetime = 2
+        middleware = self._middleware(admin_token_renew_before='1')
+        self.assertEqual('200 OK', self._call(middleware, 'token-1'))
+        eventlet.sleep(1.5)
+        self.assertEqual(2, len(self.keystone.logins))
+        self.assertEqual('200 OK', self._call(middleware, 'token-2'))
+        self.assertEqual(['admin-0', 'admin-1'], self.keystone.validations)
+
+    def test_validation_doesnt_wait_for_renewal(self):
+        middleware = self._middleware()
+        self.assertEqual('200 OK', self._call(middleware, 'token-1'))
+
+        # Keystone takes its time issuing the next token
+        issue = self.keystone.issue
+
+        def slow_issue():
+            eventlet.sleep(1)
+            return issue()
+        self.keystone.issue = slow_issue
+        renewal = eventlet.spawn(middleware.admin.fetches.do, 'admin',
+                                 middleware.admin._fetch)
+        eventlet.sleep(0)
+
+        start = time.time()
+        self.assertEqual('200 OK', self._call(middleware, 'token-2'))
+        self.assertTrue(time.time() - start < 0.5)
+        renewal.wait()
+        self.assertEqual('admin-1', middleware.admin.get())
+
+    def test_admin_credentials_refused(self):
+        self.keystone.refuse_logins = True
+        middleware = self._middleware()
+        self.assertEqual('401 Unauthorized', self._call(middleware, 'token-1'))
+        self.assertEqual('401 Unauthorized', self._call(middleware, 'token-2'))
+        self.assertEqual(None, middleware.admin.token_id)
+        # Not asked again until the retry interval has passed
+        self.assertEqual(1, len(self.keystone.logins))
+        # Nor asked to validate without an admin token
+        self.assertEqual([], self.keystone.validations)
+
+    def test_static_admin_token(self):
+        self.keystone.admin_tokens.add('999888777666')
+        middleware = self._middleware(admin_user=None,
+                                      admin_token='999888777666')
+        self.assertEqual('200 OK', self._call(middleware, 'token-1'))
+        self.assertEqual([], self.keystone.logins)
+        self.assertEqual(None, middleware.admin.renewer)
+
+
+if __name__ == '__main__':
+    unittest.main()
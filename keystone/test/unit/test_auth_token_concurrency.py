@@ -0,0 +1,157 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+from datetime import datetime, timedelta
+import json
+import unittest
+
+import eventlet
+
+from keystone.common import metrics
+from keystone.common import signing
+from keystone.middleware import auth_token
+
+KEY = 'sekrit'
+REQUESTS = 2000
+
+
+class FakeResponse(object):
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class FakeConnection(object):
+    """Validates 'token-N' as belonging to user-N, yielding to other green
+    threads while the 'call' is in flight"""
+
+    def __init__(self, path):
+        self.token_id = path.rsplit('/', 1)[-1]
+
+    def getresponse(self):
+        eventlet.sleep(0)
+        if not self.token_id.startswith('token-'):
+            return FakeResponse(404, '')
+        user = 'user-%s' % self.token_id[6:]
+        return FakeResponse(200, json.dumps(
+            {'auth': {'token': {'id': self.token_id},
+                      'user': {'username': user, 'tenantId': 't-' + user,
+                               'roleRefs': [{'roleId': 'Member'}]}}}))
+
+    def close(self):
+        pass
+
+
+# Paths of the validation calls made
+CALLS = []
+
+
+def fake_http_connect(host, port, method, path, headers=None, **kwargs):
+    CALLS.append(path)
+    return FakeConnection(path)
+
+
+class ConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.http_connect = auth_token.http_connect
+        auth_token.http_connect = fake_http_connect
+        conf = {'service_port': '8100', 'auth_host': '127.0.0.1',
+                'auth_port': '5001', 'service_pass': 'dTpw',
+                'admin_token': '999888777666', 'signing_key': KEY}
+        self.middleware = auth_token.AuthProtocol(self.app, conf)
+
+    def tearDown(self):
+        auth_token.http_connect = self.http_connect
+
+    def app(self, env, start_response):
+        # Let the other requests run before looking at this one's identity
+        eventlet.sleep(0)
+        start_response('200 OK', [])
+        return [env['HTTP_X_USER'], env['HTTP_X_TENANT']]
+
+    def _call(self, token):
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status)
+
+        body = self.middleware({'REQUEST_METHOD': 'GET',
+                                'HTTP_X_AUTH_TOKEN': token}, start_response)
+        return statuses[0], list(body)
+
+    def _token(self, i):
+        if i % 2:
+            return signing.sign(KEY, 'user-%s' % i, 't-user-%s' % i,
+                                ['Member'],
+                                datetime.now() + timedelta(hours=1))
+        return 'token-%s' % i
+
+    def test_parallel_requests_see_their_own_claims(self):
+        pool = eventlet.GreenPool(REQUESTS)
+        results = pool.imap(self._call,
+                            [self._token(i) for i in range(REQUESTS)])
+        for i, (status, body) in enumerate(results):
+            self.assertEqual('200 OK', status)
+            self.assertEqual(['user-%s' % i, 't-user-%s' % i], body)
+
+    def test_parallel_rejections(self):
+        pool = eventlet.GreenPool(REQUESTS)
+        tokens = ['bogus-%s' % i if i % 3 == 0 else self._token(i)
+                  for i in range(REQUESTS)]
+        for i, (status, body) in enumerate(pool.imap(self._call, tokens)):
+            if i % 3 == 0:
+                self.assertTrue(status.startswith('401'))
+            else:
+                self.assertEqual(['user-%s' % i, 't-user-%s' % i], body)
+
+    def test_validations_of_a_token_coalesced(self):
+        metrics.reset()
+        del CALLS[:]
+        pool = eventlet.GreenPool(200)
+        for status, body in pool.imap(self._call, ['token-7'] * 200):
+            self.assertEqual(['user-7', 't-user-7'], body)
+        self.assertEqual(['/v2.0/tokens/token-7'], CALLS)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(1, counters['auth_token.validations.calls'])
+        self.assertEqual(199, counters['auth_token.validations.coalesced'])
+
+    def test_no_request_state_on_middleware(self):
+        self._call(self._token(1))
+        for attribute in ('env', 'start_response', 'claims', 'proxy_headers',
+                          'verified_claims'):
+            self.assertFalse(hasattr(self.middleware, attribute))
+
+
+class ProxyHeadersTest(unittest.TestCase):
+
+    def test_proxy_headers(self):
+        request = auth_token._Request({'REQUEST_METHOD': 'GET',
+                                       'HTTP_X_AUTH_TOKEN': 'abc'}, None)
+        request.decorate('X_USER', 'joeuser')
+        self.assertEqual({'X-Auth-Token': 'abc',
+                          'X-User': 'joeuser'}, request.proxy_headers())
+        self.assertEqual('joeuser', request.env['HTTP_X_USER'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+import unittest
+
+from keystone.backends import api, cache, models
+from keystone.common import lru
+from keystone.common import metrics
+from keystone.common import sessions
+from keystone.test.unit import base
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.cache = lru.LRUCache('test', size=2, ttl=60)
+
+    def test_least_recently_used_are_evicted(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', None)
+        self.assertEqual(1, self.cache.get('a'))
+        self.cache.put('c', 3)
+        self.assertTrue(self.cache.get('b') is lru.MISSING)
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual(3, self.cache.get('c'))
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(3, counters['test.hits'])
+        self.assertEqual(1, counters['test.misses'])
+        self.assertEqual(1, counters['test.evictions'])
+
+    def test_entries_expire(self):
+        self.cache.ttl = 0.01
+        self.cache.put('a', 1)
+        time.sleep(0.02)
+        self.assertTrue(self.cache.get('a') is lru.MISSING)
+
+
+class EntityCacheTest(base.SQLBackendTest):
+
+    options = dict(base.SQL_OPTIONS,
+                   entity_cache="['role', 'tenant', 'user']",
+                   entity_cache_ttl='60')
+
+    def setUp(self):
+        super(EntityCacheTest, self).setUp()
+        cache.configure(self.options)
+        self.fixture_create('Tenant', id='1234', enabled=True)
+
+    def tearDown(self):
+        for name in cache.ENTITIES:
+            wrapped = getattr(api, name)
+            if isinstance(wrapped, cache.CachingAPI):
+                api.set_value(name, wrapped.api)
+
+    def _get(self, tenant_id='1234'):
+        self.reset_statements()
+        tenant = api.tenant.get(tenant_id)
+        return tenant, len(self.statements('SELECT'))
+
+    def test_lookups_are_cached(self):
+        self._get()
+        tenant, queries = self._get()
+        self.assertEqual('1234', tenant.id)
+        self.assertEqual(0, queries)
+        self.assertEqual((None, 1), self._get('5678'))
+        self.assertEqual((None, 0), self._get('5678'))
+
+    def test_writes_invalidate(self):
+        self.assertTrue(self._get()[0].enabled)
+        api.tenant.update('1234', {'enabled': False})
+        self.assertFalse(self._get()[0].enabled)
+        self._get('5678')
+        tenant = models.Tenant()
+        tenant.id, tenant.enabled = '5678', True
+        api.tenant.create(tenant)
+        self.assertEqual('5678', self._get('5678')[0].id)
+
+    def test_writes_to_other_entities_invalidate(self):
+        self._get()
+        role = models.Role()
+        role.id = 'Member'
+        api.role.create(role)
+        self.assertEqual(1, self._get()[1])
+
+    def test_cached_values_outlive_their_session(self):
+        sessions.begin()
+        self._get()
+        sessions.end(commit=False)
+        tenant, queries = self._get()
+        self.assertEqual(0, queries)
+        self.assertTrue(tenant.enabled)
+
+    def test_reads_after_writes_in_a_request_bypass_the_cache(self):
+        self._get()
+        sessions.begin()
+        api.tenant.update('1234', {'enabled': False})
+        self.assertFalse(self._get()[0].enabled)
+        sessions.end(commit=False)
+        self.assertTrue(self._get()[0].enabled)
+
+    def test_tokens_are_not_wrapped(self):
+        self.assertFalse(isinstance(api.token, cache.CachingAPI))
+        self.assertTrue(isinstance(api.tenant_group, cache.CachingAPI))
+        self.assertEqual(None, api.tenant_group.cache)
+        self.assertRaises(ValueError, cache.configure,
+                          {'entity_cache': "['token']"})
+
+
+class SessionCallbackTest(unittest.TestCase):
+
+    def test_on_end(self):
+        called = []
+        sessions.on_end(lambda: called.append('now'))
+        self.assertEqual(['now'], called)
+
+        callback = lambda: called.append('end')
+        sessions.begin()
+        sessions.on_end(callback)
+        sessions.on_end(callback)
+        self.assertEqual(['now'], called)
+        sessions.end()
+        self.assertEqual(['now', 'end'], called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import logging
+import os
+import unittest
+
+import eventlet
+import greenlet
+
+from keystone.common import metrics
+from keystone.common import wsgi
+
+_time = eventlet.patcher.original('time')
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.levelname, record.getMessage()))
+
+
+def hash_password_slowly(seconds):
+    # Blocks the hub, as a C extension would
+    _time.sleep(seconds)
+
+
+class HubWatchdogTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.handler = RecordingHandler()
+        wsgi.logger.addHandler(self.handler)
+        self.trace = greenlet.gettrace()
+        self.watchdog = wsgi.HubWatchdog(0.1, interval=0.02)
+        self.watchdog.start()
+
+    def tearDown(self):
+        self.watchdog.stop()
+        wsgi.logger.removeHandler(self.handler)
+        self.assertEqual(self.trace, greenlet.gettrace())
+
+    def _errors(self):
+        return [message for level, message in self.handler.messages
+                if level == 'ERROR']
+
+    def test_block_reported_with_stack_and_route(self):
+        app = wsgi._watched(lambda env, start_response:
+                            hash_password_slowly(0.3))
+        env = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/v2.0/tokens'}
+        wsgi._watchdog, saved = self.watchdog, wsgi._watchdog
+        try:
+            eventlet.sleep(0.05)
+            eventlet.spawn(app, env, None).wait()
+            eventlet.sleep(0.05)
+        finally:
+            wsgi._watchdog = saved
+
+        errors = self._errors()
+        self.assertEqual(1, len(errors))
+        self.assertTrue('serving POST /v2.0/tokens' in errors[0])
+        self.assertTrue('hash_password_slowly' in errors[0])
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(1, snapshot['counters']['hub.blocks'])
+        self.assertEqual(1, snapshot['counters']['hub.blocks.over_100ms'])
+        self.assertFalse('hub.blocks.over_500ms' in snapshot['counters'])
+        self.assertTrue(snapshot['timings']['hub.blocked']['max'] >= 0.2)
+
+    def test_route_of_matched_request(self):
+
+        class TokenController(object):
+            pass
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/v2.0/tokens/abc',
+               'wsgiorg.routing_args': ((), {'controller': TokenController(),
+                                             'action': 'validate_token'})}
+        self.watchdog.serving(env)
+        self.assertEqual(
+            'GET /v2.0/tokens/abc (TokenController.validate_token)',
+            self.watchdog._route(greenlet.getcurrent()))
+        self.assertEqual('no request', self.watchdog._route(None))
+
+    def test_cycling_hub_not_reported(self):
+        for _i in range(20):
+            eventlet.sleep(0.01)
+            hash_password_slowly(0.005)
+        self.assertEqual([], self._errors())
+        self.assertFalse('hub.blocks' in metrics.snapshot()['counters'])
+
+    def test_watch_hub_once_per_process(self):
+        saved = wsgi._watchdog
+        wsgi._watchdog = None
+        try:
+            watchdog = wsgi.watch_hub(1)
+            try:
+                self.assertTrue(wsgi.watch_hub(1) is watchdog)
+                self.assertEqual(os.getpid(), watchdog.pid)
+            finally:
+                watchdog.stop()
+        finally:
+            wsgi._watchdog = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
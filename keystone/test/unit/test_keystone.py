@@ -4,20 +4,45 @@ import unittest
 
 MODULE_EXTENSIONS = set('.py'.split())
 TEST_FILES = [
+    'test_admission.py',
     'test_auth.py',
+    'test_auth_basic.py',
     'test_authentication.py',
+    'test_auth_token_admin.py',
+    'test_auth_token_concurrency.py',
     #'test_authn_v2.py', # this is largely failing
     'test_common.py', # this doesn't actually contain tests
     'test_endpoints.py',
+    'test_entity_cache.py',
     'test_urlrewritefilter.py',
     'test_groups.py',
+    'test_profiler.py',
+    'test_signing.py',
+    'test_singleflight.py',
+    'test_sqlengine.py',
+    'test_replicas.py',
+    'test_nova_auth_token.py',
+    'test_proxy.py',
+    'test_revocation.py',
+    'test_hub_watchdog.py',
+    'test_kvs_backend.py',
     'test_keystone.py', # not sure why this is referencing itself
+    'test_legacy_auth.py',
+    'test_listeners.py',
+    'test_memory_backend.py',
+    'test_metrics.py',
+    'test_migration.py',
     'test_roles.py',
+    'test_sharding.py',
     #'test_server.py', # this is largely failing
     'test_tenant_groups.py',
+    'test_tenant_teardown.py',
     'test_tenants.py',
     'test_token.py',
+    'test_unit_of_work.py',
     'test_users.py',
+    'test_validate_tokens.py',
+    'test_validation_cache.py',
     'test_version.py']
 
 
@@ -0,0 +1,211 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime, timedelta
+import json
+import unittest
+
+import keystone.backends as backends
+from keystone.backends import api, models
+from keystone.backends import kvs
+from keystone.backends.kvs import client, fakememcache
+from keystone.backends.kvs.api import token as token_api
+
+OPTIONS = {'backends': 'keystone.backends.kvs',
+           'keystone-admin-role': 'Admin',
+           'keystone.backends.kvs': {
+               'memcache_servers': 'fake://tokens',
+               'backend_entities': "['Token']"}}
+
+
+def _token(id, user_id='joeuser', tenant_id=None, **delta):
+    return {'id': id, 'user_id': user_id, 'tenant_id': tenant_id,
+            'expires': datetime.now() + timedelta(**(delta or {'days': 1}))}
+
+
+class MemcacheClientTest(unittest.TestCase):
+
+    def setUp(self):
+        fakememcache.reset()
+        self.client = client.Client(['fake://a', 'fake://b'], pool_size=2)
+
+    def test_set_get_delete(self):
+        self.assertTrue(self.client.set('key', 'value\r\nwith lines'))
+        self.assertEqual('value\r\nwith lines', self.client.get('key'))
+        self.assertTrue(self.client.delete('key'))
+        self.assertFalse(self.client.delete('key'))
+        self.assertEqual(None, self.client.get('key'))
+
+    def test_get_multi_across_servers(self):
+        keys = ['key%s' % i for i in range(20)]
+        for key in keys:
+            self.client.set(key, key.upper())
+        self.assertEqual(2, len([server for server in fakememcache._servers
+                                 .values() if server.data]))
+        values = self.client.get_multi(keys + ['missing'])
+        self.assertEqual(dict((key, key.upper()) for key in keys), values)
+
+    def test_add_and_cas(self):
+        self.assertTrue(self.client.add('key', 'one'))
+        self.assertFalse(self.client.add('key', 'two'))
+        value, cas = self.client.gets('key')
+        self.assertEqual('one', value)
+        self.assertTrue(self.client.cas('key', 'three', cas))
+        self.assertFalse(self.client.cas('key', 'four', cas))
+        self.assertEqual('three', self.client.get('key'))
+        self.assertEqual((None, None), self.client.gets('missing'))
+
+    def test_expiry(self):
+        self.client.set('key', 'value', -1)
+        self.assertEqual(None, self.client.get('key'))
+        self.client.set('key', 'value', 60 * 60 * 24 * 365)
+        self.assertEqual('value', self.client.get('key'))
+
+    def test_connections_are_pooled(self):
+        opened = []
+        connect = fakememcache.connect
+
+        def counting_connect(address):
+            opened.append(address)
+            return connect(address)
+        fakememcache.connect = counting_connect
+        try:
+            for i in range(10):
+                self.client.set('key', 'value')
+                self.client.get('key')
+        finally:
+            fakememcache.connect = connect
+        self.assertEqual(1, len(opened))
+
+    def test_errors(self):
+        server = self.client.servers.for_key('key')
+        with server.connection() as conn:
+            conn.send('bogus\r\n')
+            self.assertRaises(client.MemcacheError, self.client._check,
+                              conn.readline())
+
+        unreachable = client.Client(['127.0.0.1:1'], timeout=1)
+        self.assertRaises(client.MemcacheError, unreachable.get, 'key')
+        # The failed connection was given back to the pool
+        self.assertRaises(client.MemcacheError, unreachable.get, 'key')
+
+
+class KvsTokenAPITest(unittest.TestCase):
+
+    def setUp(self):
+        fakememcache.reset()
+        self.api = token_api.TokenAPI(client.Client(['fake://tokens']),
+                                      retention=0)
+
+    def test_create_and_get(self):
+        self.api.create(_token('abc', tenant_id='1234'))
+        token_ref = self.api.get('abc')
+        self.assertEqual('joeuser', token_ref.user_id)
+        self.assertEqual('1234', token_ref.tenant_id)
+        self.assertTrue(isinstance(token_ref.expires, datetime))
+        self.assertEqual(None, self.api.get('xyz'))
+        self.assertEqual(None, self.api.get(None))
+
+    def test_unusual_ids(self):
+        long_id = 'x' * 300
+        self.api.create(_token(long_id))
+        self.api.create(_token('with space'))
+        self.assertEqual(long_id, self.api.get(long_id).id)
+        self.assertEqual('with space', self.api.get('with space').id)
+
+    def test_get_many(self):
+        self.api.create(_token('abc'))
+        self.api.create(_token('def'))
+        self.assertEqual(['abc', 'def'], sorted(
+            token_ref.id for token_ref in self.api.get_many(['abc', 'def',
+                                                             'xyz'])))
+        self.assertEqual([], self.api.get_many([]))
+
+    def test_latest_token_per_user_and_tenant(self):
+        self.api.create(_token('old', hours=1))
+        self.api.create(_token('new', hours=2))
+        self.api.create(_token('scoped', tenant_id='1234', hours=3))
+        self.assertEqual('new', self.api.get_for_user('joeuser').id)
+        self.assertEqual('scoped', self.api.get_for_user_by_tenant(
+            'joeuser', '1234').id)
+        self.assertEqual(None, self.api.get_for_user_by_tenant('joeuser',
+                                                               '5678'))
+        self.assertEqual(None, self.api.get_for_user('admin'))
+
+    def test_delete(self):
+        self.api.create(_token('old', hours=1))
+        self.api.create(_token('new', hours=2))
+        self.api.delete('new')
+        self.api.delete('new')
+        self.assertEqual(None, self.api.get('new'))
+        self.assertEqual('old', self.api.get_for_user('joeuser').id)
+
+    def test_expired_tokens_are_dropped(self):
+        self.api.create(_token('expired', seconds=-5))
+        self.api.create(_token('valid'))
+        self.assertEqual(None, self.api.get('expired'))
+        self.assertEqual('valid', self.api.get_for_user('joeuser').id)
+        index = self.api.client.get(token_api._index_key('joeuser', None))
+        self.assertEqual(['valid'], json.loads(index).keys())
+
+    def test_concurrent_index_update(self):
+        self.api.create(_token('first'))
+        gets = self.api.client.gets
+
+        def racing_gets(key):
+            # Another login updates the index between our gets and cas
+            result = gets(key)
+            self.api.client.gets = gets
+            self.api.create(_token('second'))
+            return result
+        self.api.client.gets = racing_gets
+        self.api.create(_token('third', hours=48))
+        index = self.api.client.get(token_api._index_key('joeuser', None))
+        self.assertEqual(['first', 'second', 'third'],
+                         sorted(json.loads(index).keys()))
+
+    def test_get_all_is_not_supported(self):
+        self.assertRaises(NotImplementedError, self.api.get_all)
+
+
+class KvsBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.token_api = api.token
+        self.token_model = models.Token
+
+    def tearDown(self):
+        api.set_value('token', self.token_api)
+        models.set_value('Token', self.token_model)
+        fakememcache.reset()
+
+    def test_configure_backend(self):
+        backends.configure_backends(OPTIONS)
+        self.assertTrue(isinstance(api.token, token_api.TokenAPI))
+        token_ref = models.Token()
+        token_ref.id = 'abc'
+        token_ref.user_id = 'joeuser'
+        token_ref.expires = datetime.now() + timedelta(days=1)
+        api.token.create(token_ref)
+
+        backends.configure_backends(OPTIONS)
+        self.assertTrue(api.token.client is kvs.get_client())
+        self.assertEqual('joeuser', api.token.get('abc').user_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from webob import Request, Response
+
+from keystone.frontends import legacy_token_auth
+from keystone.test.unit import base
+from keystone import utils
+
+MAPPINGS = "{'nova': 'X-Server-Management-Url', 'swift': 'X-Storage-Url'}"
+
+
+class LegacyAuthTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(LegacyAuthTest, self).setUp()
+        self.fixture_create('Tenant', id='1234', enabled=True)
+        self.fixture_create('User', id='joeuser', tenant_id='1234',
+                            enabled=True,
+                            password=utils.get_hashed_password('secrete'))
+        for template_id, service, url in (
+                (1, 'nova', 'http://nova/v1.1/%tenant_id%'),
+                (2, 'swift', 'http://swift/v1/AUTH_%tenant_id%'),
+                (3, 'glance', 'http://glance/v1')):
+            self.fixture_create('EndpointTemplates', id=template_id,
+                                service=service, public_url=url, enabled=True,
+                                is_global=False)
+            self.fixture_create('Endpoints', tenant_id='1234',
+                                endpoint_template_id=template_id)
+        self.passed_on = []
+        self.middleware = legacy_token_auth.filter_factory(
+            {}, **{'service-header-mappings': MAPPINGS})(self.app)
+
+    def app(self, env, start_response):
+        self.passed_on.append(env['PATH_INFO'])
+        return Response('downstream')(env, start_response)
+
+    def _login(self, user='joeuser', key='secrete', path='/v1.0'):
+        request = Request.blank(path, headers={'X-Auth-User': user,
+                                               'X-Auth-Key': key})
+        return request.get_response(self.middleware)
+
+    def test_login(self):
+        response = self._login()
+        self.assertEqual(204, response.status_int)
+        self.assertTrue(response.headers['X-Auth-Token'])
+        self.assertEqual('http://nova/v1.1/1234',
+                         response.headers['X-Server-Management-Url'])
+        self.assertEqual('http://swift/v1/AUTH_1234',
+                         response.headers['X-Storage-Url'])
+        # Services without a mapping get X-<SERVICE>
+        self.assertEqual('http://glance/v1', response.headers['X-GLANCE'])
+        self.assertEqual([], self.passed_on)
+
+    def test_login_reuses_token(self):
+        self.assertEqual(self._login().headers['X-Auth-Token'],
+                         self._login(path='/v1.1').headers['X-Auth-Token'])
+
+    def test_bad_password(self):
+        self.assertEqual(401, self._login(key='wrong').status_int)
+
+    def test_unknown_user(self):
+        self.assertEqual(401, self._login(user='nobody').status_int)
+
+    def test_other_calls_pass_through(self):
+        response = Request.blank('/v2.0/tenants').get_response(
+            self.middleware)
+        self.assertEqual('downstream', response.body)
+        self.assertEqual(['/v2.0/tenants'], self.passed_on)
+
+    def test_mappings_read_once(self):
+        self.middleware.conf['service-header-mappings'] = 'not a dict'
+        self.assertEqual(204, self._login().status_int)
+
+
+if __name__ == '__main__':
+    unittest.main()
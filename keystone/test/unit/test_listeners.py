@@ -0,0 +1,159 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import os
+import signal
+import unittest
+
+import eventlet
+from eventlet.green import httplib
+
+from keystone.backends import sqlalchemy as sql_backend
+from keystone.common import sessions
+from keystone.common import wsgi
+
+
+def whoami(env, start_response):
+    start_response('200 OK', [])
+    return ['%s %s' % (os.getpid(), sessions.listener())]
+
+
+class ListenerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = wsgi.Server()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _start(self, **options):
+        self.server.start(whoami, 0, '127.0.0.1', **options)
+        return self.server.sockets[-1].getsockname()[1]
+
+    def _get(self, port):
+        """Return the pid of the process that served a request, and the
+        listener it was marked with"""
+        conn = httplib.HTTPConnection('127.0.0.1', port)
+        conn.request('GET', '/')
+        pid, listener = conn.getresponse().read().split()
+        conn.close()
+        return int(pid), listener
+
+    def test_requests_marked_with_listener(self):
+        service_port = self._start(name='service')
+        admin_port = self._start(name='admin', threads=5)
+        self.assertEqual((os.getpid(), 'service'), self._get(service_port))
+        self.assertEqual((os.getpid(), 'admin'), self._get(admin_port))
+
+    def test_listener_options(self):
+        options = wsgi.listener_options({'admin_threads': '50',
+                                         'admin_workers': '2',
+                                         'revocation_feed': 'False'},
+                                        'admin')
+        self.assertEqual(50, options['threads'])
+        self.assertEqual(2, options['workers'])
+        self.assertEqual(0, wsgi.listener_options({}, 'admin')['workers'])
+
+    def test_workers_refused_with_memory_backend(self):
+        conf = {'backends': 'keystone.backends.sqlalchemy, '
+                            'keystone.backends.memory'}
+        self.assertEqual(0, wsgi.listener_options(conf, 'admin')['workers'])
+        conf['service_workers'] = '2'
+        self.assertRaises(RuntimeError, wsgi.listener_options, conf,
+                          'service')
+
+    def test_admin_workers_refused_with_revocation_feed(self):
+        conf = {'admin_workers': '2', 'service_workers': '2'}
+        self.assertRaises(RuntimeError, wsgi.listener_options, conf,
+                          'admin')
+        self.assertEqual(2, wsgi.listener_options(conf, 'service')['workers'])
+        conf['revocation_feed'] = 'False'
+        self.assertEqual(2, wsgi.listener_options(conf, 'admin')['workers'])
+
+    def test_workers(self):
+        port = self._start(name='admin', workers=2)
+        self.assertEqual(2, len(self.server.workers))
+        pids = set()
+        for _i in range(20):
+            pid, listener = self._get(port)
+            self.assertEqual('admin', listener)
+            pids.add(pid)
+        self.assertFalse(os.getpid() in pids)
+        self.assertTrue(pids <= set(self.server.workers))
+
+    def test_dead_worker_restarted(self):
+        port = self._start(name='service', workers=1)
+        pid = self.server.workers.keys()[0]
+        os.kill(pid, signal.SIGKILL)
+        for _i in range(50):
+            eventlet.sleep(0.1)
+            if self.server.workers and pid not in self.server.workers:
+                break
+        self.assertEqual(1, len(self.server.workers))
+        self.assertNotEqual(pid, self._get(port)[0])
+
+    def test_other_children_left_alone(self):
+        # e.g. the workers of another server of the process
+        self._start(name='service', workers=1)
+        pid = os.fork()
+        if not pid:
+            os._exit(3)
+        eventlet.sleep(1.5)
+        self.assertEqual((pid, 3 << 8), os.waitpid(pid, 0))
+
+    def test_stop_terminates_workers(self):
+        self._start(name='service', workers=2)
+        pids = self.server.workers.keys()
+        self.server.stop()
+        self.assertEqual({}, self.server.workers)
+        for pid in pids:
+            self.assertRaises(OSError, os.kill, pid, 0)
+
+
+class ListenerSessionTest(unittest.TestCase):
+    """Sessions of a listener with a pool of its own come from its engine"""
+
+    def setUp(self):
+        self.engines = dict(sql_backend._LISTENER_ENGINES)
+        self.makers = dict(sql_backend._LISTENER_MAKERS)
+        self.engine = object()
+        sql_backend._LISTENER_ENGINES['admin'] = self.engine
+        sql_backend._LISTENER_MAKERS.pop('admin', None)
+
+    def tearDown(self):
+        sessions.set_listener(None)
+        for saved, current in ((self.engines, sql_backend._LISTENER_ENGINES),
+                               (self.makers, sql_backend._LISTENER_MAKERS)):
+            current.clear()
+            current.update(saved)
+
+    def test_listener_engine(self):
+        sessions.set_listener('admin')
+        session = sql_backend.get_session()
+        self.assertTrue(session.bind is self.engine)
+
+    def test_other_listeners_use_shared_engine(self):
+        if sql_backend._ENGINE is None:
+            self.skipTest('SQL backend not configured')
+        sessions.set_listener('service')
+        session = sql_backend.get_session()
+        self.assertTrue(session.bind is sql_backend._ENGINE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime, timedelta
+import unittest
+
+import keystone.backends as backends
+from keystone.backends import api, models
+from keystone.backends.memory.api import token as token_api
+from keystone.backends.memory import models as memory_models
+
+OPTIONS = {'backends': 'keystone.backends.memory',
+           'keystone-admin-role': 'Admin',
+           'keystone.backends.memory': {
+               'backend_entities': "['Token']",
+               'expired_token_retention': '0'}}
+
+
+def _token(id, user_id='joeuser', tenant_id=None, **delta):
+    return {'id': id, 'user_id': user_id, 'tenant_id': tenant_id,
+            'expires': datetime.now() + timedelta(**(delta or {'days': 1}))}
+
+
+class MemoryTokenAPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = token_api.TokenAPI(retention=0)
+
+    def test_create_and_get(self):
+        created = self.api.create(_token('abc', tenant_id='1234'))
+        token_ref = self.api.get('abc')
+        self.assertTrue(token_ref is created)
+        self.assertEqual('joeuser', token_ref.user_id)
+        self.assertEqual('1234', token_ref['tenant_id'])
+        self.assertEqual(None, self.api.get('xyz'))
+        self.assertEqual(None, self.api.get(None))
+
+    def test_create_from_model(self):
+        source = memory_models.Token()
+        source.id = 'abc'
+        source.user_id = 'joeuser'
+        self.api.create(source)
+        source.user_id = 'someone else'
+        self.assertEqual('joeuser', self.api.get('abc').user_id)
+
+    def test_get_many(self):
+        self.api.create(_token('abc'))
+        self.api.create(_token('def'))
+        self.assertEqual(['abc', 'def'], sorted(
+            token_ref.id for token_ref in self.api.get_many(['abc', 'def',
+                                                             'xyz'])))
+        self.assertEqual([], self.api.get_many([]))
+
+    def test_delete(self):
+        self.api.create(_token('abc'))
+        self.api.delete('abc')
+        self.api.delete('abc')
+        self.assertEqual(None, self.api.get('abc'))
+        self.assertEqual(None, self.api.get_for_user('joeuser'))
+        self.assertEqual([], self.api.get_all())
+
+    def test_latest_token_per_user_and_tenant(self):
+        self.api.create(_token('old', hours=1))
+        self.api.create(_token('new', hours=2))
+        self.api.create(_token('scoped', tenant_id='1234', hours=3))
+        self.assertEqual('new', self.api.get_for_user('joeuser').id)
+        self.assertEqual('scoped', self.api.get_for_user_by_tenant(
+            'joeuser', '1234').id)
+        self.assertEqual(None, self.api.get_for_user_by_tenant('joeuser',
+                                                               '5678'))
+        self.assertEqual(None, self.api.get_for_user('admin'))
+        self.assertEqual(3, len(self.api.get_all()))
+
+    def test_expired_tokens_are_dropped(self):
+        self.api.create(_token('expired', seconds=-1))
+        self.api.create(_token('valid'))
+        self.assertEqual(None, self.api.get('expired'))
+        self.assertEqual(['valid'],
+                         [token_ref.id for token_ref in self.api.get_all()])
+        self.assertEqual(1, len(self.api._expiry))
+
+    def test_expired_tokens_are_retained(self):
+        self.api = token_api.TokenAPI(retention=60)
+        self.api.create(_token('expired', seconds=-1))
+        self.assertEqual('expired', self.api.get('expired').id)
+
+    def test_replaced_token_keeps_new_expiry(self):
+        self.api.create(_token('abc', seconds=-1))
+        self.api.create(_token('abc', user_id='admin'))
+        self.assertEqual('admin', self.api.get('abc').user_id)
+        self.assertEqual(None, self.api.get_for_user('joeuser'))
+
+
+class MemoryBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.token_api = api.token
+        self.token_model = models.Token
+
+    def tearDown(self):
+        api.set_value('token', self.token_api)
+        models.set_value('Token', self.token_model)
+        token_api.get().clear()
+
+    def test_configure_backend(self):
+        backends.configure_backends(OPTIONS)
+        self.assertTrue(models.Token is memory_models.Token)
+        self.assertTrue(api.token is token_api.get())
+
+        token_ref = models.Token()
+        token_ref.id = 'abc'
+        token_ref.user_id = 'joeuser'
+        token_ref.expires = datetime.now() + timedelta(days=1)
+        api.token.create(token_ref)
+
+        # A second router configuring the backends sees the same tokens
+        backends.configure_backends(OPTIONS)
+        self.assertEqual('joeuser', api.token.get('abc').user_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
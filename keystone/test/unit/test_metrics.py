@@ -0,0 +1,85 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import httplib2
+import json
+import unittest
+
+import test_common as utils
+from keystone.common import metrics
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_counters_and_gauges(self):
+        metrics.increment('requests')
+        metrics.increment('requests', 2)
+        metrics.gauge('pool.in_use', 4)
+        snapshot = metrics.snapshot()
+        self.assertEqual({'requests': 3}, snapshot['counters'])
+        self.assertEqual({'pool.in_use': 4}, snapshot['gauges'])
+
+    def test_timings(self):
+        for ms in range(1, 101):
+            metrics.timing('wait', ms / 1000.0)
+        summary = metrics.snapshot()['timings']['wait']
+        self.assertEqual(100, summary['count'])
+        self.assertEqual(0.1, summary['max'])
+        self.assertEqual(0.051, summary['p50'])
+        self.assertEqual(0.1, summary['p99'])
+
+
+class MetricsFeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.auth_token = utils.get_auth_token()
+        self.url = '%smetrics' % utils.URL_V2
+
+    def test_get_metrics(self):
+        header = httplib2.Http(".cache")
+        resp, content = header.request(self.url, "GET", body='',
+                                       headers={"Accept": "application/json",
+                                                "X-Auth-Token":
+                                                self.auth_token})
+        self.assertEqual(200, int(resp['status']))
+        snapshot = json.loads(content)['metrics']
+        self.assertTrue('keystone.backends.sqlalchemy.pool.checkout_wait' in
+                        snapshot['timings'])
+
+    def test_get_metrics_xml(self):
+        header = httplib2.Http(".cache")
+        resp, content = header.request(self.url, "GET", body='',
+                                       headers={"Accept": "application/xml",
+                                                "X-Auth-Token":
+                                                self.auth_token})
+        self.assertEqual(200, int(resp['status']))
+        self.assertTrue('<timing' in content)
+
+    def test_metrics_require_admin(self):
+        token = utils.get_token('joeuser', 'secrete', utils.get_tenant(),
+                                'token')
+        header = httplib2.Http(".cache")
+        resp, _content = header.request(self.url, "GET", body='',
+                                        headers={"X-Auth-Token": token})
+        self.assertEqual(401, int(resp['status']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import reflection
+
+from keystone.backends import api
+import keystone.backends.sqlalchemy as sql_backend
+from keystone.backends.sqlalchemy import models, versions
+from keystone.common import migration
+from keystone.test.unit import base
+
+REPOSITORY = 'test'
+
+
+def _index_names(engine, table):
+    inspector = reflection.Inspector.from_engine(engine)
+    return [index['name'] for index in inspector.get_indexes(table)]
+
+
+class QueryPlanTest(base.SQLBackendTest):
+    """Check that the hot identity queries are served by an index"""
+
+    def setUp(self):
+        super(QueryPlanTest, self).setUp()
+        self.engine = sql_backend._ENGINE
+
+    def _plan(self, func, *args):
+        """Run func and return the query plans of the statements it ran"""
+        self.reset_statements()
+        result = func(*args)
+        if hasattr(result, 'all'):
+            result.all()
+        # Explaining them runs statements too
+        captured = list(base.STATEMENTS)
+        self.assertTrue(captured)
+        plans = []
+        for statement, parameters in captured:
+            rows = self.engine.execute('EXPLAIN QUERY PLAN ' + statement,
+                                       parameters).fetchall()
+            plans.append(' '.join(str(list(row)[-1]) for row in rows))
+        return plans
+
+    def assertUsesIndex(self, index, func, *args):
+        plans = self._plan(func, *args)
+        self.assertTrue([plan for plan in plans if index in plan],
+                        "%s not used by %s" % (index, plans))
+
+    def test_user_by_email(self):
+        self.assertUsesIndex('ix_users_email', api.user.get_by_email,
+                             'joe@example.com')
+
+    def test_users_by_tenant(self):
+        self.assertUsesIndex('ix_users_tenant_id', api.tenant.is_empty,
+                             '1234')
+
+    def test_role_refs_by_user_and_tenant(self):
+        self.assertUsesIndex('ix_user_roles_user_id_tenant_id',
+                             api.role.ref_get_all_tenant_roles,
+                             'joeuser', '1234')
+
+    def test_users_by_group(self):
+        self.assertUsesIndex('ix_user_group_association_group_id',
+                             api.user.users_tenant_group_get_page,
+                             'g1', None, 10)
+
+    def test_groups_by_tenant(self):
+        self.assertUsesIndex('ix_groups_tenant_id',
+                             api.user.get_group_by_tenant, '1234')
+
+    def test_endpoints_by_tenant(self):
+        self.assertUsesIndex('ix_endpoints_tenant_id',
+                             api.endpoint_template.endpoint_get_by_tenant,
+                             '1234')
+
+    def test_token_for_user(self):
+        self.assertUsesIndex('ix_token_user_id_tenant_id',
+                             api.token.get_for_user_by_tenant,
+                             'joeuser', '1234')
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        models.Base.metadata.create_all(self.engine)
+
+    def test_new_database_is_stamped(self):
+        version = migration.check_version(self.engine, REPOSITORY,
+                                          versions.VERSIONS, fresh=True)
+        self.assertEqual(migration.latest_version(versions.VERSIONS), version)
+        self.assertEqual(version,
+                         migration.db_version(self.engine, REPOSITORY))
+
+    def test_sync_adds_missing_indexes(self):
+        # Simulate a database created before the indexes existed
+        self.engine.execute('DROP INDEX ix_users_email')
+        self.engine.execute('DROP INDEX ix_user_roles_user_id_tenant_id')
+        self.assertEqual(0, migration.check_version(self.engine, REPOSITORY,
+                                                    versions.VERSIONS))
+
+        version = migration.db_sync(self.engine, REPOSITORY,
+                                    versions.VERSIONS)
+        self.assertEqual(migration.latest_version(versions.VERSIONS), version)
+        self.assertEqual(version,
+                         migration.db_version(self.engine, REPOSITORY))
+        self.assertTrue('ix_users_email' in _index_names(self.engine,
+                                                         'users'))
+        self.assertTrue('ix_user_roles_user_id_tenant_id' in
+                        _index_names(self.engine, 'user_roles'))
+
+        # Running it again is harmless
+        self.assertEqual(version, migration.db_sync(self.engine, REPOSITORY,
+                                                    versions.VERSIONS))
+
+    def test_failed_step_is_not_recorded(self):
+        def broken(connection):
+            raise RuntimeError("boom")
+
+        self.assertRaises(RuntimeError, migration.db_sync, self.engine,
+                          REPOSITORY, [(1, broken)])
+        self.assertEqual(0, migration.db_version(self.engine, REPOSITORY))
+
+    def test_unknown_and_older_versions(self):
+        self.assertRaises(migration.MigrationError, migration.db_sync,
+                          self.engine, REPOSITORY, versions.VERSIONS, 99)
+        migration.db_sync(self.engine, REPOSITORY, versions.VERSIONS)
+        self.assertRaises(migration.MigrationError, migration.db_sync,
+                          self.engine, REPOSITORY, versions.VERSIONS, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
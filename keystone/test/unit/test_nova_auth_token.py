@@ -0,0 +1,202 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import sys
+import types
+import unittest
+
+import webob
+from webob import Request, Response
+
+
+class FakeRequestContext(object):
+
+    def __init__(self, user, project):
+        self.user = user
+        self.project = project
+
+
+class FakeMiddleware(object):
+
+    def __init__(self, application):
+        self.application = application
+
+
+def _stub_nova():
+    """Install just enough of nova in sys.modules to import the shim,
+    returning the names of the modules installed"""
+    stubs = {'nova': {},
+             'nova.auth': {'manager': None},
+             'nova.context': {'RequestContext': FakeRequestContext},
+             'nova.flags': {'FLAGS': None},
+             'nova.utils': {'import_object': lambda name: name},
+             'nova.wsgi': {'Middleware': FakeMiddleware,
+                           'Request': webob.Request}}
+    for name, attrs in stubs.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+    for name in stubs:
+        if name != 'nova':
+            setattr(sys.modules['nova'], name.split('.')[1],
+                    sys.modules[name])
+    return stubs.keys()
+
+
+try:
+    import nova
+    from keystone.middleware import nova_auth_token
+except ImportError:
+    # nova is not installed, the shim only needs a few names from it
+    stubbed = _stub_nova()
+    try:
+        from keystone.middleware import nova_auth_token
+    finally:
+        for name in stubbed:
+            del sys.modules[name]
+
+
+class FakeUser(object):
+
+    def __init__(self, user_id, admin=False):
+        self.id = user_id
+        self.admin = admin
+
+    def is_admin(self):
+        return self.admin
+
+
+class FakeAuthManager(object):
+    """Just enough of nova's AuthManager, counting the calls made"""
+
+    def __init__(self):
+        self.users = {}
+        self.projects = {}
+        self.calls = []
+
+    def get_user(self, user_id):
+        self.calls.append('get_user')
+        user = self.users[user_id]
+        return FakeUser(user.id, user.admin)
+
+    def create_user(self, user_id):
+        self.calls.append('create_user')
+        self.users[user_id] = FakeUser(user_id)
+        return self.get_user(user_id)
+
+    def modify_user(self, user_ref, admin=None):
+        self.calls.append('modify_user')
+        self.users[user_ref.id].admin = admin
+
+    def get_project(self, project_id):
+        self.calls.append('get_project')
+        return (project_id, self.projects[project_id])
+
+    def create_project(self, project_id, user_id):
+        self.calls.append('create_project')
+        self.projects[project_id] = set()
+        return (project_id, self.projects[project_id])
+
+    def is_project_member(self, user_id, project_id):
+        self.calls.append('is_project_member')
+        return user_id in self.projects[project_id]
+
+    def add_to_project(self, user_id, project_id):
+        self.calls.append('add_to_project')
+        self.projects[project_id].add(user_id)
+
+
+def app(env, start_response):
+    return Response()(env, start_response)
+
+
+class ProvisioningCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.auth = FakeAuthManager()
+        self.shim = self._shim()
+
+    def _shim(self, **kwargs):
+        return nova_auth_token.KeystoneAuthShim(app, db_driver='nova.db',
+                                                auth_manager=self.auth,
+                                                **kwargs)
+
+    def _call(self, user='joeuser', tenant='1234', role='Member'):
+        del self.auth.calls[:]
+        request = Request.blank('/', headers={'X_USER': user,
+                                              'X_TENANT': tenant,
+                                              'X_ROLE': role})
+        self.assertEqual(200, request.get_response(self.shim).status_int)
+        return request.environ['nova.context']
+
+    def test_context(self):
+        context = self._call()
+        self.assertEqual('joeuser', context.user.id)
+        self.assertEqual('1234', context.project[0])
+
+    def test_first_request_provisions(self):
+        self._call()
+        self.assertEqual(set(['joeuser']), self.auth.projects['1234'])
+        self.assertTrue('create_user' in self.auth.calls)
+        self.assertTrue('create_project' in self.auth.calls)
+
+    def test_repeated_requests_skip_auth_manager(self):
+        self._call()
+        self._call()
+        self.assertEqual([], self.auth.calls)
+
+    def test_new_project_provisions_membership_only(self):
+        self._call()
+        self._call(tenant='5678')
+        self.assertEqual(['get_project', 'create_project',
+                          'is_project_member', 'add_to_project'],
+                         self.auth.calls)
+
+    def test_role_change_reprovisions(self):
+        self._call()
+        self._call(role='Admin')
+        self.assertTrue('modify_user' in self.auth.calls)
+        self.assertTrue(self.auth.users['joeuser'].admin)
+        self._call(role='Admin')
+        self.assertEqual([], self.auth.calls)
+
+        # Demoted through another project, the cached admin-ness follows
+        self._call(tenant='5678')
+        self.assertFalse(self.auth.users['joeuser'].admin)
+        self._call()
+        self.assertEqual([], self.auth.calls)
+        self.assertFalse(self.auth.users['joeuser'].admin)
+
+    def test_cache_disabled(self):
+        self.shim = self._shim(cache_ttl='0')
+        self._call()
+        self._call()
+        self.assertEqual(['get_user', 'get_project', 'is_project_member'],
+                         self.auth.calls)
+
+    def test_cache_bounded(self):
+        self.shim = self._shim(cache_size='2')
+        self._call(user='a')
+        self._call(user='b')
+        self.assertTrue(len(self.shim.provisioned) <= 2)
+        self._call(user='a')
+        self.assertTrue('get_user' in self.auth.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
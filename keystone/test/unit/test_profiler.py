@@ -0,0 +1,126 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from keystone.middleware import profiler
+
+
+class MockWsgiApp(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, env, start_response):
+        self.calls += 1
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['hello']
+
+
+class AuthorizedProfiler(profiler.ProfilerMiddleware):
+
+    def _is_authorized(self, env):
+        return env.get('HTTP_X_AUTH_TOKEN') == 'admin'
+
+
+class StartResponse(object):
+
+    def __call__(self, status, headers, exc_info=None):
+        self.status = status
+        self.headers = dict(headers)
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = MockWsgiApp()
+        self.start_response = StartResponse()
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def _env(self, **headers):
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/v2.0/tenants'}
+        env.update(headers)
+        return env
+
+    def test_disabled_filter_returns_app(self):
+        app_filter = profiler.filter_factory({}, enabled='False')
+        self.assertTrue(app_filter(self.app) is self.app)
+
+    def test_enabled_filter_wraps_app(self):
+        app_filter = profiler.filter_factory({}, enabled='True')
+        self.assertTrue(isinstance(app_filter(self.app),
+                                   profiler.ProfilerMiddleware))
+
+    def test_request_without_header_passes_through(self):
+        middleware = AuthorizedProfiler(self.app, {})
+        body = middleware(self._env(), self.start_response)
+        self.assertEqual(['hello'], body)
+        self.assertEqual('200 OK', self.start_response.status)
+
+    def test_unauthorized_profile_request_passes_through(self):
+        middleware = AuthorizedProfiler(self.app, {})
+        body = middleware(self._env(HTTP_X_PROFILE='1',
+                                    HTTP_X_AUTH_TOKEN='someone'),
+                          self.start_response)
+        self.assertEqual(['hello'], body)
+        self.assertFalse('X-Profile-Status' in self.start_response.headers)
+
+    def test_profile_returned_in_body(self):
+        middleware = AuthorizedProfiler(self.app, {})
+        body = ''.join(middleware(self._env(HTTP_X_PROFILE='1',
+                                            HTTP_X_AUTH_TOKEN='admin'),
+                                  self.start_response))
+        self.assertEqual(1, self.app.calls)
+        self.assertEqual('200 OK',
+                         self.start_response.headers['X-Profile-Status'])
+        self.assertTrue('function calls' in body)
+
+    def test_profile_written_to_output_dir(self):
+        middleware = AuthorizedProfiler(self.app,
+                                        {'output_dir': self.output_dir})
+        body = middleware(self._env(HTTP_X_PROFILE='1',
+                                    HTTP_X_AUTH_TOKEN='admin'),
+                          self.start_response)
+        self.assertEqual(['hello'], body)
+        name = self.start_response.headers['X-Profile-File']
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, name)))
+
+    def test_sampling_keeps_slowest(self):
+        middleware = AuthorizedProfiler(self.app,
+                                        {'output_dir': self.output_dir,
+                                         'sample_rate': '1.0',
+                                         'keep_slowest': '2'})
+        for _i in range(5):
+            body = middleware(self._env(), self.start_response)
+            self.assertEqual(['hello'], body)
+        self.assertEqual(5, self.app.calls)
+        self.assertEqual(2, len(middleware.slowest))
+        self.assertEqual(2, len(os.listdir(self.output_dir)))
+
+    def test_sampling_requires_output_dir(self):
+        middleware = AuthorizedProfiler(self.app, {'sample_rate': '1.0'})
+        self.assertEqual(0, middleware.sample_rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
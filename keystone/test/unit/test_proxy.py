@@ -0,0 +1,263 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+from datetime import datetime, timedelta
+import base64
+import hashlib
+import StringIO
+import unittest
+
+import eventlet
+from eventlet import wsgi
+
+from keystone.common import metrics
+from keystone.common import proxy
+from keystone.common import signing
+from keystone.middleware import auth_basic
+from keystone.middleware import auth_token
+
+KEY = 'sekrit'
+CHUNK_SIZE = 4096
+# Size of the object the service sends for GET /object
+OBJECT_SIZE = 5 * 1024 * 1024
+
+
+class NullLog(object):
+
+    def write(self, data):
+        pass
+
+
+class Service(object):
+    """Service the requests are proxied to, remembering what it received"""
+
+    def __init__(self):
+        self.env = None
+        self.body_digest = None
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.server = eventlet.spawn(wsgi.server, self.sock, self,
+                                     log=NullLog())
+
+    def stop(self):
+        self.server.kill()
+        self.sock.close()
+
+    def __call__(self, env, start_response):
+        self.env = env
+        if env['PATH_INFO'] == '/object':
+            start_response('200 OK',
+                           [('Content-Length', str(OBJECT_SIZE)),
+                            ('Content-Type', 'application/octet-stream'),
+                            ('X-Object-Meta-Color', 'blue'),
+                            ('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2')])
+            return ('x' * 65536 for _i in range(OBJECT_SIZE / 65536))
+        digest = hashlib.md5()
+        while True:
+            chunk = env['wsgi.input'].read(65536)
+            if not chunk:
+                break
+            digest.update(chunk)
+        self.body_digest = digest.hexdigest()
+        start_response('201 Created', [('X-Seen-Path', env['PATH_INFO'])])
+        return ['created']
+
+
+class LargeInput(object):
+    """wsgi.input of size bytes, recording the largest read"""
+
+    def __init__(self, size):
+        self.left = size
+        self.largest_read = 0
+        self.digest = hashlib.md5()
+
+    def read(self, size):
+        self.largest_read = max(self.largest_read, size)
+        chunk = 'y' * min(size, self.left)
+        self.left -= len(chunk)
+        self.digest.update(chunk)
+        return chunk
+
+
+class StartResponse(object):
+
+    def __call__(self, status, headers, exc_info=None):
+        self.status = status
+        self.headers = headers
+
+
+class ProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.service = Service()
+        self.proxy = proxy.Proxy('test.proxy', '127.0.0.1', self.service.port,
+                                 pool_size=2, chunk_size=CHUNK_SIZE)
+        self.start_response = StartResponse()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def _env(self, method='GET', path='/object', **extra):
+        env = {'REQUEST_METHOD': method, 'PATH_INFO': path,
+               'SCRIPT_NAME': '', 'QUERY_STRING': '',
+               'wsgi.input': StringIO.StringIO('')}
+        env.update(extra)
+        return env
+
+    def test_response_streamed_in_chunks(self):
+        body = self.proxy(self._env(), self.start_response)
+        size = 0
+        for chunk in body:
+            self.assertTrue(len(chunk) <= CHUNK_SIZE)
+            size += len(chunk)
+        self.assertEqual(OBJECT_SIZE, size)
+        self.assertEqual('200 OK', self.start_response.status)
+
+    def test_response_headers_preserved(self):
+        body = self.proxy(self._env(), self.start_response)
+        body.close()
+        headers = self.start_response.headers
+        self.assertTrue(('X-Object-Meta-Color', 'blue') in headers)
+        self.assertTrue(('Content-Length', str(OBJECT_SIZE)) in headers)
+        self.assertEqual(['a=1', 'b=2'], [value for name, value in headers
+                                          if name == 'Set-Cookie'])
+
+    def test_request_streamed_in_chunks(self):
+        body = LargeInput(3 * 1024 * 1024 + 17)
+        env = self._env('PUT', '/container/object', CONTENT_LENGTH=str(
+            body.left), CONTENT_TYPE='text/plain', HTTP_X_USER='joeuser',
+            QUERY_STRING='multipart=1')
+        env['wsgi.input'] = body
+        self.assertEqual(['created'],
+                         list(self.proxy(env, self.start_response)))
+        self.assertEqual('201 Created', self.start_response.status)
+        self.assertEqual(body.digest.hexdigest(), self.service.body_digest)
+        self.assertEqual(CHUNK_SIZE, body.largest_read)
+        self.assertEqual('joeuser', self.service.env['HTTP_X_USER'])
+        self.assertEqual('text/plain', self.service.env['CONTENT_TYPE'])
+        self.assertEqual('multipart=1', self.service.env['QUERY_STRING'])
+
+    def test_connections_reused(self):
+        for _i in range(5):
+            list(self.proxy(self._env('POST', '/x'), self.start_response))
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(1, counters['test.proxy.connections.created'])
+        self.assertEqual(4, counters['test.proxy.connections.reused'])
+
+    def test_abandoned_response_closes_connection(self):
+        body = iter(self.proxy(self._env(), self.start_response))
+        body.next()
+        body.close()
+        list(self.proxy(self._env('POST', '/x'), self.start_response))
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(2, counters['test.proxy.connections.created'])
+
+    def test_stale_connection_retried(self):
+        list(self.proxy(self._env('POST', '/x'), self.start_response))
+        # Make the pooled connection one the other end has closed
+        conn = self.proxy.pool.get()
+        listener = eventlet.listen(('127.0.0.1', 0))
+        conn.sock = eventlet.connect(listener.getsockname())
+        listener.accept()[0].close()
+        listener.close()
+        self.proxy.pool.put(conn)
+
+        list(self.proxy(self._env('POST', '/x'), self.start_response))
+        self.assertEqual('201 Created', self.start_response.status)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(2, counters['test.proxy.connections.created'])
+
+    def test_chunked_request(self):
+        body = LargeInput(100000)
+        env = self._env('PUT', '/object2', HTTP_TRANSFER_ENCODING='chunked')
+        env['wsgi.input'] = body
+        list(self.proxy(env, self.start_response))
+        self.assertEqual('201 Created', self.start_response.status)
+        self.assertEqual(body.digest.hexdigest(), self.service.body_digest)
+
+    def test_slot_returned_when_request_body_fails(self):
+
+        class BrokenInput(object):
+
+            def read(self, size):
+                raise ValueError('invalid chunk length')
+        env = self._env('PUT', '/object2', HTTP_TRANSFER_ENCODING='chunked')
+        env['wsgi.input'] = BrokenInput()
+        self.assertRaises(ValueError, self.proxy, env, self.start_response)
+        self.assertEqual(2, self.proxy.pool.slots.free())
+        list(self.proxy(self._env('POST', '/x'), self.start_response))
+        self.assertEqual('201 Created', self.start_response.status)
+
+    def test_service_down(self):
+        self.proxy = proxy.Proxy('test.proxy', '127.0.0.1', 1)
+        self.proxy(self._env(), self.start_response)
+        self.assertTrue(self.start_response.status.startswith('502'))
+
+    def test_hop_by_hop_headers_dropped(self):
+        headers = proxy.request_headers({'HTTP_CONNECTION': 'close',
+                                         'HTTP_X_AUTH_TOKEN': 'abc',
+                                         'CONTENT_LENGTH': '',
+                                         'wsgi.input': None})
+        self.assertEqual({'X-Auth-Token': 'abc'}, headers)
+
+
+class MiddlewareProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = Service()
+        self.conf = {'service_protocol': 'http',
+                     'service_host': '127.0.0.1',
+                     'service_port': str(self.service.port),
+                     'service_pass': 'dTpw',
+                     'auth_protocol': 'http',
+                     'auth_host': '127.0.0.1',
+                     # The service accepts any credentials
+                     'auth_port': str(self.service.port),
+                     'signing_key': KEY}
+        self.start_response = StartResponse()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def test_auth_token(self):
+        middleware = auth_token.app_factory({}, **self.conf)
+        token = signing.sign(KEY, 'joeuser', '1234', ['Admin'],
+                             datetime.now() + timedelta(hours=1))
+        body = middleware({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/object',
+                           'HTTP_X_AUTH_TOKEN': token}, self.start_response)
+        self.assertEqual(OBJECT_SIZE, sum(len(chunk) for chunk in body))
+        env = self.service.env
+        self.assertEqual('joeuser', env['HTTP_X_USER'])
+        self.assertEqual('Admin', env['HTTP_X_ROLE'])
+        self.assertEqual('Basic dTpw', env['HTTP_AUTHORIZATION'])
+
+    def test_auth_basic(self):
+        middleware = auth_basic.app_factory({}, **self.conf)
+        credentials = base64.b64encode('guest:guest')
+        body = middleware({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/object',
+                           'HTTP_AUTHORIZATION': 'Basic %s' % credentials},
+                          self.start_response)
+        self.assertEqual(OBJECT_SIZE, sum(len(chunk) for chunk in body))
+        env = self.service.env
+        self.assertEqual('Confirmed', env['HTTP_X_IDENTITY_STATUS'])
+        self.assertEqual('Basic dTpw', env['HTTP_AUTHORIZATION'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from keystone.backends import api, models
+import keystone.backends.sqlalchemy as sql_backend
+from keystone.common import replicas
+from keystone.common import sessions
+from keystone.test.unit import base
+
+
+def _tenant(tenant_id):
+    tenant = models.Tenant()
+    tenant.id = tenant_id
+    tenant.enabled = True
+    return tenant
+
+
+class ReplicaSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.replicas = replicas.ReplicaSet('test', ['a', 'b', 'c'])
+
+    def test_round_robin(self):
+        self.assertEqual(['a', 'b', 'c', 'a'],
+                         [self.replicas.pick() for _i in range(4)])
+
+    def test_failed_replicas_are_skipped(self):
+        self.replicas.mark_down('b')
+        self.assertEqual(['a', 'c', 'a'],
+                         [self.replicas.pick() for _i in range(3)])
+        self.assertEqual(['a', 'c'], self.replicas.healthy())
+
+    def test_failed_replicas_are_retried(self):
+        self.replicas.retry_interval = 0
+        self.replicas.mark_down('a')
+        self.assertEqual('a', self.replicas.pick())
+
+    def test_all_down(self):
+        for replica in ['a', 'b', 'c']:
+            self.replicas.mark_down(replica)
+        self.assertEqual(None, self.replicas.pick())
+
+
+class ReplicaRoutingTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(ReplicaRoutingTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+        connections = ['sqlite:///%s' % os.path.join(self.tmpdir, name)
+                       for name in ('replica0.db', 'replica1.db')]
+        sql_backend.configure_replicas(
+            {'sql_connection': 'sqlite://',
+             'sql_replica_connections': repr(connections),
+             'sql_replica_pin_seconds': '0'})
+        sql_backend._LAST_WRITE[0] = 0
+        for index, engine in enumerate(sql_backend._REPLICAS.replicas):
+            sql_backend.BASE.metadata.create_all(engine)
+            session = sql_backend._REPLICA_MAKERS[engine]()
+            session.add(_tenant('replica%d' % index))
+            session.flush()
+
+    def tearDown(self):
+        sql_backend.configure_replicas({})
+        sql_backend._PIN_SECONDS = 2
+        shutil.rmtree(self.tmpdir)
+
+    def test_reads_go_round_robin(self):
+        self.assertTrue(api.tenant.get('replica0') is not None)
+        self.assertEqual(None, api.tenant.get('replica0'))
+        self.assertTrue(api.tenant.get('replica0') is not None)
+
+    def test_writes_go_to_the_primary(self):
+        api.tenant.create(_tenant('primary'))
+        self.assertEqual(None, api.tenant.get('primary'))
+        self.assertEqual(['primary'],
+                         [t.id for t in sql_backend.get_session().
+                          query(models.Tenant)])
+
+    def test_reads_are_pinned_after_a_write(self):
+        sql_backend._PIN_SECONDS = 60
+        api.tenant.create(_tenant('primary'))
+        self.assertTrue(api.tenant.get('primary') is not None)
+        sql_backend._LAST_WRITE[0] = time.time() - 61
+        self.assertEqual(None, api.tenant.get('primary'))
+
+    def test_scope_reads_its_own_writes(self):
+        sessions.begin()
+        try:
+            self.assertEqual(None, api.tenant.get('primary'))
+            api.tenant.create(_tenant('primary'))
+            self.assertTrue(api.tenant.get('primary') is not None)
+        finally:
+            sessions.end()
+
+    def test_failed_replica_falls_back_to_primary(self):
+        api.tenant.create(_tenant('primary'))
+        broken = sql_backend._REPLICAS.replicas[0]
+        os.remove(broken.url.database)
+        os.mkdir(broken.url.database)
+
+        self.assertTrue(api.tenant.get('primary') is not None)
+        self.assertEqual([sql_backend._REPLICAS.replicas[1]],
+                         sql_backend._REPLICAS.healthy())
+        self.assertTrue(api.tenant.get('replica1') is not None)
+
+
+if __name__ == '__main__':
+    unittest.main()
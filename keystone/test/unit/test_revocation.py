@@ -0,0 +1,195 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime, timedelta
+import httplib2
+import json
+import time
+import unittest
+
+import test_common as utils
+from keystone.backends import api, models
+from keystone.common import signing
+from keystone.logic import revocation
+from keystone.logic.service import IdentityService
+from keystone.logic.types import fault
+from keystone.middleware import auth_token
+from keystone.test.unit import base
+
+KEY = 'sekrit'
+
+
+class RevocationLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = revocation.RevocationLog()
+
+    def test_events_since(self):
+        self.log.record(revocation.TOKEN, 'abc')
+        events, now, truncated = self.log.since(0)
+        self.assertEqual([('token', 'abc')], [e[1:] for e in events])
+        self.assertTrue(truncated)
+
+        self.log.record(revocation.USER, 'joeuser')
+        events, _now, truncated = self.log.since(now)
+        self.assertEqual([('user', 'joeuser')], [e[1:] for e in events])
+        self.assertFalse(truncated)
+
+    def test_unknown_event_type(self):
+        self.assertRaises(ValueError, self.log.record, 'group', 'admin')
+
+    def test_retention(self):
+        self.log.retention = 0
+        self.log.record(revocation.TENANT, '1234')
+        events, _now, truncated = self.log.since(time.time() - 60)
+        self.assertEqual([], events)
+        self.assertTrue(truncated)
+
+
+class AuthTokenRevocationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.middleware = auth_token.AuthProtocol(None,
+                                                  {'service_port': '8100',
+                                                   'auth_host': '127.0.0.1',
+                                                   'auth_port': '5001',
+                                                   'signing_key': KEY,
+                                                   'cache_ttl': '300'})
+        self.token_info = {'auth': {'token': {'id': 'abc',
+                                              'tenantId': '1234'}}}
+        self.middleware._cache_claims('abc', self.token_info,
+                                      {'user': 'joeuser', 'tenant': '1234',
+                                       'roles': []})
+
+    def _revoke(self, event_type, entity_id, truncated=False):
+        now = time.time()
+        self.middleware._apply_revocations({'values': [{'timestamp': now,
+                                                        'type': event_type,
+                                                        'id': entity_id}],
+                                            'now': now,
+                                            'truncated': truncated})
+
+    def test_cached_token_is_valid(self):
+        claims = self.middleware._validate_claims('abc')
+        self.assertEqual('joeuser', claims['user'])
+
+    def test_token_event_purges_cache(self):
+        self._revoke('token', 'abc')
+        self.assertFalse('abc' in self.middleware.token_cache)
+
+    def test_user_and_tenant_events_purge_cache(self):
+        self._revoke('user', 'someone-else')
+        self.assertTrue('abc' in self.middleware.token_cache)
+        self._revoke('tenant', '1234')
+        self.assertFalse('abc' in self.middleware.token_cache)
+
+    def test_truncated_feed_flushes_cache(self):
+        self._revoke('user', 'someone-else', truncated=True)
+        self.assertEqual(0, len(self.middleware.token_cache))
+
+    def test_cache_bounded(self):
+        middleware = auth_token.AuthProtocol(None,
+                                             {'service_port': '8100',
+                                              'auth_host': '127.0.0.1',
+                                              'auth_port': '5001',
+                                              'cache_ttl': '300',
+                                              'cache_size': '2'})
+        for token_id in ('abc', 'def', 'ghi'):
+            middleware._cache_claims(token_id, self.token_info,
+                                     {'user': 'joeuser', 'tenant': '1234',
+                                      'roles': []})
+        self.assertEqual(2, len(middleware.token_cache))
+        self.assertFalse('abc' in middleware.token_cache)
+        self.assertTrue('ghi' in middleware.token_cache)
+
+    def test_signed_token_refused_after_user_event(self):
+        token = signing.sign(KEY, 'joeuser', '1234', [],
+                             datetime.now() + timedelta(hours=1))
+        self.assertTrue(self.middleware._validate_claims(token))
+        self._revoke('user', 'joeuser')
+        self.assertFalse(self.middleware._validate_claims(token))
+
+        # Tokens issued after the event are fine again
+        token = signing.sign(KEY, 'joeuser', '1234', [],
+                             datetime.now() + timedelta(hours=1))
+        self.assertTrue(self.middleware._validate_claims(token))
+
+
+class DisabledRevocationFeedTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(DisabledRevocationFeedTest, self).setUp()
+        self.fixture_create('Role', id='Admin')
+        self.fixture_create('User', id='admin', enabled=True)
+        ref = models.UserRoleAssociation()
+        ref.user_id, ref.role_id = 'admin', 'Admin'
+        api.user.user_role_add(ref)
+        self.fixture_create('Token', id='admin-token', user_id='admin',
+                            expires=datetime.now() + timedelta(days=1))
+        self.service = IdentityService()
+
+    def test_feed_served_by_default(self):
+        self.service.configure({})
+        self.service.revocations.record(revocation.USER, 'joeuser')
+        feed = self.service.get_revocations('admin-token', '0')
+        self.assertEqual(['joeuser'],
+                         [entity_id for _t, _type, entity_id in feed.events])
+
+    def test_disabled_feed_not_found(self):
+        self.service.configure({'revocation_feed': 'False'})
+        self.assertRaises(fault.ItemNotFoundFault,
+                          self.service.get_revocations, 'admin-token', '0')
+
+
+class RevocationFeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tenant = utils.get_tenant()
+        self.auth_token = utils.get_auth_token()
+        self.token = utils.get_token('joeuser', 'secrete', self.tenant,
+                                     'token')
+
+    def test_revoked_token_in_feed(self):
+        header = httplib2.Http(".cache")
+        url = '%stokens/%s' % (utils.URL_V2, self.token)
+        resp, _content = header.request(url, "DELETE", body='',
+                                        headers={"X-Auth-Token":
+                                                 self.auth_token})
+        self.assertEqual(204, int(resp['status']))
+
+        url = '%srevocations?since=0' % utils.URL_V2
+        resp, content = header.request(url, "GET", body='',
+                                       headers={"Accept": "application/json",
+                                                "X-Auth-Token":
+                                                self.auth_token})
+        self.assertEqual(200, int(resp['status']))
+        feed = json.loads(content)['revocations']
+        self.assertTrue({'type': 'token', 'id': self.token} in
+                        [{'type': e['type'], 'id': e['id']}
+                         for e in feed['values']])
+
+    def test_feed_requires_admin(self):
+        header = httplib2.Http(".cache")
+        url = '%srevocations?since=0' % utils.URL_V2
+        resp, _content = header.request(url, "GET", body='',
+                                        headers={"X-Auth-Token":
+                                                 self.token})
+        self.assertEqual(401, int(resp['status']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime, timedelta
+import unittest
+
+import keystone.backends as backends
+from keystone.backends import alterdb
+from keystone.backends.alterdb import models
+from keystone.backends.alterdb.api import token as token_api
+from keystone.common import shards
+
+OPTIONS = {'backends': 'keystone.backends.alterdb',
+           'keystone-admin-role': 'Admin',
+           'keystone.backends.alterdb': {
+               'sql_connection': 'sqlite://',
+               'sql_idle_timeout': '30',
+               'backend_entities': "['Token']"}}
+SHARDED = dict(OPTIONS['keystone.backends.alterdb'],
+               sql_shard_connections="['sqlite://', 'sqlite://']")
+
+
+def _configure(options):
+    alterdb.unregister_models()
+    alterdb.configure_shards(options)
+    alterdb.register_models(options)
+
+
+def _create_token(api, id, user_id='joeuser', tenant_id=None, hours=24):
+    token_ref = models.Token()
+    token_ref.id = id
+    token_ref.user_id = user_id
+    token_ref.tenant_id = tenant_id
+    token_ref.expires = datetime.now() + timedelta(hours=hours)
+    return api.create(token_ref)
+
+
+def _ids_on_shard(index):
+    session = alterdb.get_shard_session(index)
+    return sorted(token_ref.id for token_ref in
+                  session.query(models.Token).all())
+
+
+class ShardMapTest(unittest.TestCase):
+
+    def test_index_is_stable(self):
+        shard_map = shards.ShardMap(['a', 'b', 'c'])
+        index = shard_map.index('abc')
+        self.assertEqual(index, shards.ShardMap(['x', 'y', 'z']).index('abc'))
+        self.assertEqual(index, shard_map.index(u'abc'))
+        self.assertEqual(shard_map.shards[index], shard_map.for_key('abc'))
+
+    def test_keys_are_spread(self):
+        shard_map = shards.ShardMap(['a', 'b', 'c'])
+        used = set(shard_map.index('token%s' % i) for i in range(100))
+        self.assertEqual(set([0, 1, 2]), used)
+
+    def test_needs_a_shard(self):
+        self.assertRaises(ValueError, shards.ShardMap, [])
+
+
+class ShardedTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        backends.configure_backends(OPTIONS)
+        _configure(SHARDED)
+        self.api = token_api.get()
+        self.ids = ['token%s' % i for i in range(20)]
+
+    def tearDown(self):
+        _configure(OPTIONS['keystone.backends.alterdb'])
+
+    def test_tokens_live_on_their_shard(self):
+        for id in self.ids:
+            _create_token(self.api, id)
+        self.assertEqual(3, alterdb.shard_count())
+        for index in range(3):
+            self.assertEqual(sorted(id for id in self.ids
+                                    if alterdb.shard_of(id) == index),
+                             _ids_on_shard(index))
+        self.assertEqual('token7', self.api.get('token7').id)
+        self.assertEqual(None, self.api.get('missing'))
+        self.assertEqual(sorted(self.ids),
+                         sorted(t.id for t in self.api.get_many(self.ids)))
+        self.assertEqual(20, len(self.api.get_all()))
+
+        self.api.delete('token7')
+        self.assertEqual(None, self.api.get('token7'))
+        self.assertEqual(19, len(self.api.get_all()))
+
+    def test_latest_token_across_shards(self):
+        for hours, id in enumerate(self.ids):
+            _create_token(self.api, id, hours=hours + 1)
+        _create_token(self.api, 'scoped', tenant_id='1234', hours=48)
+        self.assertEqual('token19', self.api.get_for_user('joeuser').id)
+        self.assertEqual('scoped', self.api.get_for_user_by_tenant(
+            'joeuser', '1234').id)
+        self.assertEqual(None, self.api.get_for_user('admin'))
+
+    def test_rebalance_after_adding_shards(self):
+        _configure(OPTIONS['keystone.backends.alterdb'])
+        for id in self.ids:
+            _create_token(self.api, id)
+        alterdb.configure_shards(SHARDED)
+        alterdb.register_models(SHARDED)
+
+        # Tokens not yet moved are still found
+        self.assertEqual(sorted(self.ids),
+                         sorted(t.id for t in self.api.get_many(self.ids)))
+        moved = [id for id in self.ids if alterdb.shard_of(id) != 0]
+        self.assertEqual(moved[0], self.api.get(moved[0]).id)
+
+        self.assertEqual(len(moved), self.api.rebalance())
+        for index in range(3):
+            self.assertEqual(sorted(id for id in self.ids
+                                    if alterdb.shard_of(id) == index),
+                             _ids_on_shard(index))
+        self.assertEqual(0, self.api.rebalance())
+
+
+if __name__ == '__main__':
+    unittest.main()
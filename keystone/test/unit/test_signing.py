@@ -0,0 +1,229 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime, timedelta
+import json
+import time
+import unittest
+
+from keystone.backends import api, models
+from keystone.common import signing
+from keystone.logic import service
+from keystone.logic.types import auth
+from keystone.middleware import auth_token
+from keystone.test.unit import base
+from keystone import utils
+
+KEY = 'sekrit'
+
+
+class MockWsgiApp(object):
+
+    def __init__(self):
+        self.env = None
+
+    def __call__(self, env, start_response):
+        self.env = env
+        start_response('200 OK', [])
+        return ['ok']
+
+
+class StartResponse(object):
+
+    def __call__(self, status, headers, exc_info=None):
+        self.status = status
+
+
+def _sign(expires=None, key=KEY):
+    expires = expires or datetime.now() + timedelta(hours=1)
+    return signing.sign(key, 'joeuser', '1234', ['Admin', 'Member'], expires)
+
+
+class SigningTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        payload = signing.verify(KEY, _sign())
+        self.assertEqual('joeuser', payload['u'])
+        self.assertEqual('1234', payload['t'])
+        self.assertEqual(['Admin', 'Member'], payload['r'])
+
+    def test_tokens_are_unique(self):
+        self.assertNotEqual(_sign(), _sign())
+
+    def test_is_signed(self):
+        self.assertTrue(signing.is_signed(_sign()))
+        self.assertFalse(signing.is_signed('887665443383838'))
+        self.assertFalse(signing.is_signed(None))
+
+    def test_wrong_key(self):
+        self.assertRaises(signing.InvalidToken, signing.verify, 'other',
+                          _sign())
+
+    def test_tampered_payload(self):
+        payload, signature = _sign().split(signing.SEPARATOR)
+        forged = signing.sign('other', 'joeuser', '1234', ['Admin'],
+                              datetime.now() + timedelta(hours=1))
+        token = signing.SEPARATOR.join((forged.split(signing.SEPARATOR)[0],
+                                        signature))
+        self.assertRaises(signing.InvalidToken, signing.verify, KEY, token)
+
+    def test_expired(self):
+        token = _sign(datetime.now() - timedelta(seconds=5))
+        self.assertRaises(signing.InvalidToken, signing.verify, KEY, token)
+        self.assertTrue(signing.verify(KEY, token, now=time.time() - 3600))
+
+    def test_malformed(self):
+        self.assertRaises(signing.InvalidToken, signing.verify, KEY, 'a.b.c')
+        self.assertRaises(signing.InvalidToken, signing.verify, KEY,
+                          'nodots')
+
+
+class RevocationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.revocations = signing.Revocations()
+        self.issued = time.time()
+        self.payload = {'u': 'joeuser', 't': '1234', 'i': self.issued}
+
+    def _apply(self, event_type, entity_id, timestamp):
+        return self.revocations.apply({'values': [{'type': event_type,
+                                                   'id': entity_id,
+                                                   'timestamp': timestamp}],
+                                       'now': timestamp,
+                                       'truncated': False})
+
+    def test_token_event(self):
+        self.assertEqual(set([('token', 'abc')]),
+                         self._apply('token', 'abc', self.issued))
+        self.assertTrue(self.revocations.is_revoked('abc', self.payload))
+        self.assertFalse(self.revocations.is_revoked('def', self.payload))
+        self.assertEqual(self.issued, self.revocations.since)
+
+    def test_user_and_tenant_events_before_issue(self):
+        self._apply('user', 'joeuser', self.issued - 1)
+        self._apply('tenant', '1234', self.issued - 1)
+        self.assertFalse(self.revocations.is_revoked('abc', self.payload))
+        self._apply('tenant', '1234', self.issued + 1)
+        self.assertTrue(self.revocations.is_revoked('abc', self.payload))
+
+    def test_old_events_forgotten(self):
+        self._apply('user', 'joeuser', self.issued)
+        self._apply('user', 'other',
+                    self.issued + signing.REVOCATION_RETENTION + 1)
+        self.assertEqual([('user', 'other')],
+                         self.revocations.latest.keys())
+
+
+class AuthTokenSignedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = MockWsgiApp()
+        self.start_response = StartResponse()
+        self.middleware = auth_token.AuthProtocol(self.app,
+                                                  {'service_port': '8100',
+                                                   'auth_host': '127.0.0.1',
+                                                   'auth_port': '5001',
+                                                   'service_pass': 'dTpw',
+                                                   'signing_key': KEY})
+
+    def test_signed_token_verified_locally(self):
+        self.middleware({'REQUEST_METHOD': 'GET',
+                         'HTTP_X_AUTH_TOKEN': _sign()}, self.start_response)
+        self.assertEqual('200 OK', self.start_response.status)
+        self.assertEqual('Confirmed', self.app.env['HTTP_X_IDENTITY_STATUS'])
+        self.assertEqual('joeuser', self.app.env['HTTP_X_USER'])
+        self.assertEqual('1234', self.app.env['HTTP_X_TENANT'])
+        self.assertEqual('Admin,Member', self.app.env['HTTP_X_ROLE'])
+
+    def test_forged_token_rejected(self):
+        self.middleware({'REQUEST_METHOD': 'GET',
+                         'HTTP_X_AUTH_TOKEN': _sign(key='other')},
+                        self.start_response)
+        self.assertTrue(self.start_response.status.startswith('401'))
+        self.assertTrue(self.app.env is None)
+
+
+class SignedAuthenticationTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(SignedAuthenticationTest, self).setUp()
+        self.service = service.IdentityService()
+        self.service.configure({'token_format': 'signed',
+                                'token_signing_key': KEY})
+        self.fixture_create('Tenant', id='1234', enabled=True)
+        self.fixture_create('Tenant', id='5678', enabled=True)
+        self.fixture_create('Role', id='Admin')
+        self.fixture_create('Role', id='Member')
+        for user_id in ('admin', 'joeuser'):
+            self.fixture_create('User', id=user_id, enabled=True,
+                                password=utils.get_hashed_password('secrete'),
+                                tenant_id='1234')
+        self.fixture_create('Token', id='admin-token', user_id='admin',
+                            expires=datetime.now() + timedelta(days=1))
+        for user_id, role_id, tenant_id in (('admin', 'Admin', None),
+                                            ('joeuser', 'Member', '1234')):
+            ref = models.UserRoleAssociation()
+            ref.user_id, ref.role_id = user_id, role_id
+            ref.tenant_id = tenant_id
+            api.user.user_role_add(ref)
+
+    def _authenticate(self, tenant_id=None):
+        return self.service.authenticate(auth.PasswordCredentials(
+            'joeuser', 'secrete', tenant_id))
+
+    def _claims(self, token_id):
+        """Claims auth_token gets from the signed token itself and from
+        validating it with Keystone"""
+        middleware = auth_token.AuthProtocol(MockWsgiApp(),
+                                             {'service_port': '8100',
+                                              'auth_host': '127.0.0.1',
+                                              'auth_port': '5001',
+                                              'service_pass': 'dTpw',
+                                              'signing_key': KEY})
+        signed = middleware._validate_claims(token_id)
+        data = self.service.validate_token('admin-token', token_id)
+        remote = middleware._expound_claims(token_id,
+                                            json.loads(data.to_json()))
+        return signed, remote
+
+    def test_unscoped_token_claims_match_validation(self):
+        token_id = self._authenticate().token.id
+        self.assertTrue(signing.is_signed(token_id))
+        signed, remote = self._claims(token_id)
+        self.assertEqual(remote, signed)
+        self.assertEqual('1234', signed['tenant'])
+        self.assertEqual([], signed['roles'])
+
+    def test_scoped_token_claims_match_validation(self):
+        token_id = self._authenticate('1234').token.id
+        signed, remote = self._claims(token_id)
+        self.assertEqual(remote, signed)
+        self.assertEqual('1234', signed['tenant'])
+        self.assertEqual(['Member'], signed['roles'])
+
+    def test_reused_token_signed_fresh(self):
+        first = self._authenticate('1234').token.id
+        ref = models.UserRoleAssociation()
+        ref.user_id, ref.role_id, ref.tenant_id = 'joeuser', 'Admin', '1234'
+        api.user.user_role_add(ref)
+        second = self._authenticate('1234').token.id
+        self.assertNotEqual(first, second)
+        self.assertEqual(['Admin', 'Member'],
+                         sorted(signing.verify(KEY, second)['r']))
+
+if __name__ == '__main__':
+    unittest.main()
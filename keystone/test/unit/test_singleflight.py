@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import unittest
+
+import eventlet
+
+from keystone.common import metrics
+from keystone.common import singleflight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.flight = singleflight.SingleFlight('test.flight', timeout=5)
+        self.calls = []
+
+    def _slow(self, key, delay=0.01):
+        self.calls.append(key)
+        eventlet.sleep(delay)
+        return 'result %s' % key
+
+    def _fail(self, key):
+        self.calls.append(key)
+        eventlet.sleep(0.01)
+        raise LookupError(key)
+
+    def _counter(self, name):
+        return metrics.snapshot()['counters'].get('test.flight.%s' % name, 0)
+
+    def test_concurrent_calls_coalesced(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(lambda _i: self.flight.do('a', self._slow,
+                                                           'a'), range(200)))
+        self.assertEqual(['result a'] * 200, results)
+        self.assertEqual(['a'], self.calls)
+        self.assertEqual(1, self._counter('calls'))
+        self.assertEqual(199, self._counter('coalesced'))
+        self.assertEqual({}, self.flight.in_flight)
+
+    def test_different_keys_not_coalesced(self):
+        pool = eventlet.GreenPool()
+        keys = ['a', 'b', 'a', 'b']
+        results = list(pool.imap(lambda key: self.flight.do(key, self._slow,
+                                                            key), keys))
+        self.assertEqual(['result a', 'result b'] * 2, results)
+        self.assertEqual(['a', 'b'], sorted(self.calls))
+
+    def test_sequential_calls_not_coalesced(self):
+        self.flight.do('a', self._slow, 'a')
+        self.flight.do('a', self._slow, 'a')
+        self.assertEqual(['a', 'a'], self.calls)
+
+    def test_exceptions_passed_to_waiters(self):
+        def call(_i):
+            try:
+                self.flight.do('a', self._fail, 'a')
+            except LookupError:
+                return 'raised'
+
+        pool = eventlet.GreenPool()
+        self.assertEqual(['raised'] * 10, list(pool.imap(call, range(10))))
+        self.assertEqual(['a'], self.calls)
+
+    def test_waiters_of_killed_call_make_their_own(self):
+        first = eventlet.spawn(self.flight.do, 'a', self._slow, 'a', 0.5)
+        eventlet.sleep(0)
+        pool = eventlet.GreenPool()
+        waiters = [pool.spawn(self.flight.do, 'a', self._slow, 'a')
+                   for _i in range(3)]
+        eventlet.sleep(0)
+        first.kill()
+        self.assertEqual(['result a'] * 3,
+                         [waiter.wait() for waiter in waiters])
+        self.assertEqual(['a'] * 4, self.calls)
+        self.assertEqual(3, self._counter('abandoned'))
+        self.assertEqual(0, self._counter('coalesced'))
+
+    def test_waiters_give_up(self):
+        self.flight.timeout = 0.01
+        first = eventlet.spawn(self.flight.do, 'a', self._slow, 'a', 0.5)
+        eventlet.sleep(0)
+        self.assertEqual('result a', self.flight.do('a', self._slow, 'a'))
+        self.assertEqual(['a', 'a'], self.calls)
+        self.assertEqual(1, self._counter('timeouts'))
+        first.kill()
+
+
+if __name__ == '__main__':
+    unittest.main()
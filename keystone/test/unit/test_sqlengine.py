@@ -0,0 +1,133 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import pool
+
+from keystone.common import metrics
+from keystone.common import sqlengine
+
+
+class SqlEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.connection = 'sqlite:///%s' % os.path.join(self.tmpdir, 'x.db')
+        metrics.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _pragma(self, engine, name):
+        return engine.execute("PRAGMA %s" % name).scalar()
+
+    def test_sqlite_profile(self):
+        engine = sqlengine.create_engine('test', {
+            'sql_connection': self.connection,
+            'sqlite_journal_mode': 'WAL',
+            'sqlite_synchronous': 'NORMAL',
+            'sqlite_busy_timeout': '2500'})
+        self.assertEqual('wal', self._pragma(engine, 'journal_mode'))
+        # NORMAL
+        self.assertEqual(1, self._pragma(engine, 'synchronous'))
+        self.assertEqual(2500, self._pragma(engine, 'busy_timeout'))
+
+    def test_sqlite_files_are_not_pooled_by_default(self):
+        engine = sqlengine.create_engine('test',
+                                         {'sql_connection': self.connection})
+        self.assertTrue(isinstance(engine.pool, pool.NullPool))
+        self.assertEqual('delete', self._pragma(engine, 'journal_mode'))
+
+    def test_pool_options(self):
+        engine = sqlengine.create_engine('test', {
+            'sql_connection': self.connection,
+            'sql_pool_size': '3',
+            'sql_max_overflow': '1',
+            'sql_pool_timeout': '7'})
+        self.assertTrue(isinstance(engine.pool, pool.QueuePool))
+        self.assertEqual(3, engine.pool.size())
+        self.assertEqual(7, engine.pool._timeout)
+
+    def test_checkout_metrics(self):
+        engine = sqlengine.create_engine('test', {
+            'sql_connection': self.connection,
+            'sql_pool_size': '2',
+            'sql_max_overflow': '2'})
+        connection = engine.connect()
+        gauges = metrics.snapshot()['gauges']
+        self.assertEqual(1, gauges['test.pool.checked_out'])
+        self.assertEqual(0.25, gauges['test.pool.utilization'])
+        connection.close()
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(0, snapshot['gauges']['test.pool.checked_out'])
+        self.assertEqual(1,
+                         snapshot['timings']['test.pool.checkout_wait']['count'])
+
+    def test_pre_ping_replaces_dead_connections(self):
+        engine = sqlengine.create_engine('test', {
+            'sql_connection': self.connection,
+            'sql_pool_size': '1',
+            'sql_pool_pre_ping': 'True'})
+        connection = engine.connect()
+        dbapi_connection = connection.connection.connection
+        connection.close()
+        # Simulate the database dropping the idle connection
+        dbapi_connection.close()
+
+        connection = engine.connect()
+        self.assertEqual(1, connection.execute("SELECT 1").scalar())
+        self.assertFalse(connection.connection.connection is
+                         dbapi_connection)
+        connection.close()
+
+    def test_listener_engines(self):
+        options = {'sql_connection': self.connection,
+                   'sql_pool_size': '5',
+                   'admin_sql_pool_size': '2',
+                   'admin_sql_pool_timeout': '3'}
+        engines = sqlengine.create_listener_engines('test', options)
+        self.assertEqual(['admin'], engines.keys())
+        engine = engines['admin']
+        self.assertEqual(2, engine.pool.size())
+        self.assertEqual(3, engine.pool._timeout)
+        connection = engine.connect()
+        gauges = metrics.snapshot()['gauges']
+        self.assertEqual(1, gauges['test.admin.pool.checked_out'])
+        connection.close()
+
+    def test_no_listener_engines_for_in_memory_databases(self):
+        self.assertEqual({}, sqlengine.create_listener_engines('test', {
+            'sql_connection': 'sqlite://',
+            'admin_sql_pool_size': '2'}))
+
+    def test_dispose_all(self):
+        engine = sqlengine.create_engine('test', {
+            'sql_connection': self.connection,
+            'sql_pool_size': '1'})
+        engine.connect().close()
+        self.assertEqual(1, engine.pool.checkedin())
+        sqlengine.dispose_all()
+        self.assertEqual(0, engine.pool.checkedin())
+
+
+if __name__ == '__main__':
+    unittest.main()
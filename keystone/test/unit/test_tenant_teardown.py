@@ -0,0 +1,99 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from keystone.backends import api, models
+import keystone.backends.sqlalchemy as sql_backend
+from keystone.test.unit import base
+
+
+class TenantTeardownTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(TenantTeardownTest, self).setUp()
+        self.fixture_create('Tenant', id='1234', enabled=True)
+        self.fixture_create('Tenant', id='5678', enabled=True)
+        self.fixture_create('Role', id='Member')
+        for group_id, tenant_id in (('g1', '1234'), ('g2', '1234'),
+                                    ('other', '5678')):
+            self.fixture_create('Group', id=group_id, tenant_id=tenant_id)
+        for user_id, tenant_id in (('joeuser', '1234'), ('admin', '1234'),
+                                   ('visitor', '5678')):
+            self.fixture_create('User', id=user_id, tenant_id=tenant_id,
+                                enabled=True)
+            for group_id in ('g1', 'g2', 'other'):
+                self.fixture_create('UserGroupAssociation', user_id=user_id,
+                                    group_id=group_id)
+            self.fixture_create('UserRoleAssociation', user_id=user_id,
+                                role_id='Member', tenant_id=tenant_id)
+
+    def _count(self, model, **criteria):
+        return sql_backend.get_session().query(getattr(models, model)).\
+            filter_by(**criteria).count()
+
+    def test_delete_tenant_user(self):
+        self.reset_statements()
+        api.user.delete_tenant_user('joeuser', '1234')
+        self.assertEqual(3, len(self.statements('DELETE')))
+
+        self.assertEqual(None, api.user.get('joeuser'))
+        self.assertEqual(0, self._count('UserGroupAssociation',
+                                        user_id='joeuser'))
+        self.assertEqual(0, self._count('UserRoleAssociation',
+                                        user_id='joeuser'))
+        self.assertEqual(3, self._count('UserGroupAssociation',
+                                        user_id='admin'))
+
+    def test_delete_user_of_another_tenant(self):
+        api.user.delete_tenant_user('visitor', '1234')
+        # Only the memberships of the tenant's groups go
+        self.assertEqual('visitor', api.user.get('visitor').id)
+        self.assertEqual(0, self._count('UserGroupAssociation',
+                                        user_id='visitor', group_id='g1'))
+        self.assertEqual(1, self._count('UserGroupAssociation',
+                                        user_id='visitor', group_id='other'))
+        self.assertEqual(1, self._count('UserRoleAssociation',
+                                        user_id='visitor'))
+
+    def test_is_empty(self):
+        self.reset_statements()
+        self.assertFalse(api.tenant.is_empty('1234'))
+        self.assertEqual(1, len(self.statements()))
+
+        self.fixture_create('Tenant', id='empty', enabled=True)
+        self.assertTrue(api.tenant.is_empty('empty'))
+        self.fixture_create('Group', id='g3', tenant_id='empty')
+        self.assertFalse(api.tenant.is_empty('empty'))
+
+        self.fixture_create('Tenant', id='granted', enabled=True)
+        self.fixture_create('UserRoleAssociation', user_id='admin',
+                            role_id='Member', tenant_id='granted')
+        self.assertFalse(api.tenant.is_empty('granted'))
+
+    def test_delete_tenant(self):
+        self.fixture_create('Tenant', id='empty', enabled=True)
+        self.fixture_create('EndpointTemplates', id=1, region='north')
+        self.fixture_create('Endpoints', tenant_id='empty',
+                            endpoint_template_id=1)
+        api.tenant.delete('empty')
+        self.assertEqual(None, api.tenant.get('empty'))
+        self.assertEqual(0, self._count('Endpoints', tenant_id='empty'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -170,5 +170,129 @@ class ValidateToken(unittest.TestCase):
         self.assertEqual(401, int(resp['status']))
         self.assertEqual('application/json', utils.content_type(resp))
 
+
+class CheckToken(unittest.TestCase):
+
+    def setUp(self):
+        self.tenant = utils.get_tenant()
+        self.token = utils.get_token('joeuser', 'secrete', self.tenant,
+                                    'token')
+        self.auth_token = utils.get_auth_token()
+        self.exp_auth_token = utils.get_exp_auth_token()
+
+    def tearDown(self):
+        utils.delete_token(self.token, self.auth_token)
+
+    def _check(self, token, belongs_to=None):
+        header = httplib2.Http(".cache")
+        url = '%stokens/%s' % (utils.URL_V2, token)
+        if belongs_to:
+            url += '?belongsTo=%s' % belongs_to
+        return header.request(url, "HEAD",
+                              headers={"X-Auth-Token": self.auth_token})
+
+    def test_check_token(self):
+        resp, content = self._check(self.token, self.tenant)
+        self.assertEqual(200, int(resp['status']))
+        self.assertEqual('', content)
+        self.assertEqual(self.token, resp['x-subject-token'])
+        self.assertEqual('joeuser', resp['x-subject-user'])
+        self.assertEqual(self.tenant, resp['x-subject-tenant'])
+        self.assertTrue(resp['x-subject-expires'])
+
+    def test_check_unscoped_token(self):
+        token = utils.get_token('joeuser', 'secrete', None, 'token')
+        resp, _content = self._check(token)
+        self.assertEqual(200, int(resp['status']))
+        self.assertFalse('x-subject-tenant' in resp)
+
+        # Like a GET, which doesn't report the user's default tenant either
+        header = httplib2.Http(".cache")
+        url = '%stokens/%s' % (utils.URL_V2, token)
+        resp, content = header.request(url, "GET",
+            headers={"Content-Type": "application/json",
+                     "X-Auth-Token": self.auth_token})
+        self.assertEqual(200, int(resp['status']))
+        self.assertFalse('tenantId' in json.loads(content)['auth']['token'])
+
+    def test_check_token_wrong_tenant(self):
+        resp, _content = self._check(self.token, 'OtherTenant')
+        self.assertEqual(401, int(resp['status']))
+
+    def test_check_token_expired(self):
+        resp, _content = self._check(self.exp_auth_token)
+        self.assertEqual(403, int(resp['status']))
+
+    def test_check_token_invalid(self):
+        resp, _content = self._check('NonExistingToken')
+        self.assertEqual(401, int(resp['status']))
+
+
+class ValidateTokens(unittest.TestCase):
+
+    def setUp(self):
+        self.tenant = utils.get_tenant()
+        self.token = utils.get_token('joeuser', 'secrete', self.tenant,
+                                    'token')
+        self.auth_token = utils.get_auth_token()
+        self.exp_auth_token = utils.get_exp_auth_token()
+
+    def tearDown(self):
+        utils.delete_token(self.token, self.auth_token)
+
+    def _validate(self, body, auth_token, content_type="application/json"):
+        header = httplib2.Http(".cache")
+        url = '%stokens/validate' % utils.URL_V2
+        return header.request(url, "POST", body=body,
+                              headers={"Content-Type": content_type,
+                                       "ACCEPT": content_type,
+                                       "X-Auth-Token": auth_token})
+
+    def test_validate_tokens(self):
+        body = {"tokens": [{"id": self.token, "belongsTo": self.tenant},
+                           {"id": self.exp_auth_token},
+                           {"id": 'NonExistingToken'},
+                           {"id": self.token, "belongsTo": 'OtherTenant'}]}
+        resp, content = self._validate(json.dumps(body), self.auth_token)
+        self.assertEqual(200, int(resp['status']))
+        self.assertEqual('application/json', utils.content_type(resp))
+        validations = json.loads(content)["validations"]
+        self.assertEqual([self.token, self.exp_auth_token,
+                          'NonExistingToken', self.token],
+                         [v["id"] for v in validations])
+        self.assertEqual(self.tenant,
+                         validations[0]["auth"]["token"]["tenantId"])
+        self.assertEqual('403', validations[1]["forbidden"]["code"])
+        self.assertEqual('401', validations[2]["unauthorized"]["code"])
+        self.assertEqual('401', validations[3]["unauthorized"]["code"])
+
+    def test_validate_tokens_xml(self):
+        body = '<tokens xmlns="http://docs.openstack.org/identity/api/v2.0">' \
+               '<token id="%s" belongsTo="%s"/>' \
+               '<token id="NonExistingToken"/></tokens>' % (self.token,
+                                                            self.tenant)
+        resp, content = self._validate(body, self.auth_token,
+                                       "application/xml")
+        self.assertEqual(200, int(resp['status']))
+        self.assertEqual('application/xml', utils.content_type(resp))
+        dom = etree.fromstring(content)
+        validations = dom.findall(
+            "{http://docs.openstack.org/identity/api/v2.0}validation")
+        self.assertEqual(2, len(validations))
+        self.assertEqual("auth", etree.QName(validations[0][0]).localname)
+        self.assertEqual("unauthorized",
+                         etree.QName(validations[1][0]).localname)
+
+    def test_validate_tokens_requires_admin(self):
+        body = {"tokens": [{"id": self.token}]}
+        resp, _content = self._validate(json.dumps(body), self.token)
+        self.assertEqual(401, int(resp['status']))
+
+    def test_validate_tokens_bad_request(self):
+        resp, _content = self._validate(json.dumps({"token": []}),
+                                        self.auth_token)
+        self.assertEqual(400, int(resp['status']))
+
+
 if __name__ == '__main__':
     unittest.main()
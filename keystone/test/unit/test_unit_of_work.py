@@ -0,0 +1,85 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from webob import Request, Response
+
+from keystone.backends import api
+import keystone.backends.sqlalchemy as sql_backend
+from keystone.common import sessions
+from keystone.middleware import unit_of_work
+from keystone.test.unit import base
+
+
+class UnitOfWorkTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(UnitOfWorkTest, self).setUp()
+        self.fixture_create('Tenant', id='1234', enabled=True)
+        self.seen = []
+
+    def _call(self, app):
+        middleware = unit_of_work.filter_factory({})(app)
+        return Request.blank('/').get_response(middleware)
+
+    def _app(self, status=200, tenant_id='5678'):
+        def app(env, start_response):
+            self.seen.append(sql_backend.get_session())
+            self.fixture_create('Tenant', id=tenant_id, enabled=True)
+            self.seen.append(sql_backend.get_session())
+            return Response(status=status)(env, start_response)
+        return app
+
+    def test_one_session_per_request(self):
+        self._call(self._app())
+        self.assertTrue(self.seen[0] is self.seen[1])
+        self.assertFalse(sessions.in_scope())
+        self.assertFalse(sql_backend.get_session() is self.seen[0])
+
+    def test_commit_on_success(self):
+        self.assertEqual(200, self._call(self._app()).status_int)
+        self.assertTrue(api.tenant.get('5678') is not None)
+
+    def test_rollback_on_error_status(self):
+        self.assertEqual(409, self._call(self._app(409)).status_int)
+        self.assertEqual(None, api.tenant.get('5678'))
+
+    def test_rollback_on_exception(self):
+        def app(env, start_response):
+            self.fixture_create('Tenant', id='5678', enabled=True)
+            raise RuntimeError("boom")
+
+        self.assertRaises(RuntimeError, self._call, app)
+        self.assertFalse(sessions.in_scope())
+        self.assertEqual(None, api.tenant.get('5678'))
+
+    def test_repeated_get_uses_identity_map(self):
+        def app(env, start_response):
+            self.reset_statements()
+            self.seen.extend([api.tenant.get('1234'),
+                              api.tenant.get('1234')])
+            self.seen.append(len(self.statements('SELECT')))
+            return Response()(env, start_response)
+
+        self._call(app)
+        self.assertTrue(self.seen[0] is self.seen[1])
+        self.assertEqual(1, self.seen[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
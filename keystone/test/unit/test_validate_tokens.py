@@ -0,0 +1,104 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime, timedelta
+import unittest
+
+from keystone.backends import api, models
+from keystone.logic.service import IdentityService, MAX_BULK_VALIDATIONS
+from keystone.logic.types import auth, fault
+from keystone.test.unit import base
+
+
+class BulkValidationTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(BulkValidationTest, self).setUp()
+        self.service = IdentityService()
+
+        expires = datetime.now() + timedelta(days=1)
+        self.fixture_create('Tenant', id='1234', enabled=True)
+        self.fixture_create('Role', id='Admin')
+        self.fixture_create('User', id='admin', password='secrete',
+                            enabled=True, tenant_id='1234')
+        ref = models.UserRoleAssociation()
+        ref.user_id, ref.role_id = 'admin', 'Admin'
+        api.user.user_role_add(ref)
+        self.fixture_create('Token', id='admin-token', user_id='admin',
+                            expires=expires)
+
+        self.tokens = []
+        for i in range(20):
+            user_id = 'user%d' % i
+            self.fixture_create('User', id=user_id, password='secrete',
+                                enabled=True, tenant_id='1234')
+            self.fixture_create('Token', id='token%d' % i, user_id=user_id,
+                                tenant_id='1234', expires=expires)
+            self.tokens.append(('token%d' % i, '1234'))
+
+    def _validate(self, tokens):
+        self.reset_statements()
+        rval = self.service.validate_tokens(
+            'admin-token', auth.TokenValidationRequests(tokens))
+        return rval, len(self.statements())
+
+    def test_results_in_request_order(self):
+        rval, _queries = self._validate([('token3', '1234'), ('bogus', None),
+                                         ('token1', 'elsewhere')])
+        self.assertEqual(['token3', 'bogus', 'token1'],
+                         [token_id for token_id, _r in rval.results])
+        self.assertTrue(isinstance(rval.results[0][1], auth.ValidateData))
+        self.assertTrue(isinstance(rval.results[1][1],
+                                   fault.UnauthorizedFault))
+        self.assertTrue(isinstance(rval.results[2][1],
+                                   fault.UnauthorizedFault))
+
+    def test_query_count_is_constant(self):
+        _rval, few = self._validate(self.tokens[:2])
+        _rval, many = self._validate(self.tokens)
+        self.assertEqual(few, many)
+
+    def test_largest_batch_with_distinct_tenants(self):
+        # Each user has a home tenant and a token scoped to another, so the
+        # batch touches twice as many tenants as tokens
+        expires = datetime.now() + timedelta(days=1)
+        tokens = []
+        for i in range(MAX_BULK_VALIDATIONS):
+            user_id = 'bulk%d' % i
+            self.fixture_create('Tenant', id='home%d' % i, enabled=True)
+            self.fixture_create('Tenant', id='scope%d' % i, enabled=True)
+            self.fixture_create('User', id=user_id, password='secrete',
+                                enabled=True, tenant_id='home%d' % i)
+            self.fixture_create('Token', id='bulk-token%d' % i,
+                                user_id=user_id, tenant_id='scope%d' % i,
+                                expires=expires)
+            tokens.append(('bulk-token%d' % i, 'scope%d' % i))
+
+        rval, _queries = self._validate(tokens)
+        self.assertEqual([auth.ValidateData] * MAX_BULK_VALIDATIONS,
+                         [type(result) for _token_id, result in rval.results])
+        # Within SQLite's default limit of bound parameters
+        self.assertTrue(max(statement.count('?')
+                            for statement in self.statements()) <= 999)
+
+    def test_batch_size_is_limited(self):
+        self.assertRaises(fault.BadRequestFault, self._validate,
+                          [('token0', None)] * 501)
+
+
+if __name__ == '__main__':
+    unittest.main()
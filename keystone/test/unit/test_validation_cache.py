@@ -0,0 +1,195 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime, timedelta
+import json
+import time
+import unittest
+
+from keystone.backends import api, models
+from keystone.common import metrics
+from keystone.common import sessions
+from keystone.logic import validation_cache
+from keystone.logic.service import IdentityService
+from keystone.logic.types import fault
+from keystone.logic.types.role import RoleRef
+from keystone.logic.types.tenant import Tenant
+from keystone.logic.types.user import User
+from keystone.test.unit import base
+
+JSON = 'application/json'
+XML = 'application/xml'
+
+
+class ValidationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.cache = validation_cache.ValidationCache(ttl=60, size=2)
+        self.expires = time.time() + 3600
+
+    def _put(self, token_id, user_id='joeuser', tenant_ids=('1234',),
+             expires=None):
+        self.cache.put(token_id, None, JSON, 'content of %s' % token_id,
+                       expires or self.expires, user_id, tenant_ids)
+
+    def test_get_and_put(self):
+        self.assertEqual(None, self.cache.get('abc', None, JSON))
+        self._put('abc')
+        self.assertEqual('content of abc', self.cache.get('abc', None, JSON))
+        self.assertEqual(None, self.cache.get('abc', None, XML))
+        self.assertEqual(None, self.cache.get('abc', '1234', JSON))
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(1, counters['validation_cache.hits'])
+        self.assertEqual(3, counters['validation_cache.misses'])
+        self.assertEqual(0.25,
+                         metrics.snapshot()['gauges']
+                         ['validation_cache.hit_ratio'])
+
+    def test_least_recently_used_are_evicted(self):
+        self._put('abc')
+        self._put('def')
+        self.cache.get('abc', None, JSON)
+        self._put('ghi')
+        self.assertEqual(None, self.cache.get('def', None, JSON))
+        self.assertTrue(self.cache.get('abc', None, JSON))
+        self.assertTrue(self.cache.get('ghi', None, JSON))
+        self.assertEqual(1, metrics.snapshot()['counters']
+                         ['validation_cache.evictions'])
+
+    def test_entries_expire(self):
+        self._put('abc', expires=time.time() - 1)
+        self.assertEqual(None, self.cache.get('abc', None, JSON))
+        self.cache.ttl = 0.01
+        self._put('def')
+        time.sleep(0.02)
+        self.assertEqual(None, self.cache.get('def', None, JSON))
+        self.assertEqual(2, metrics.snapshot()['counters']
+                         ['validation_cache.expirations'])
+
+    def test_disabled(self):
+        self.cache.ttl = 0
+        self._put('abc')
+        self.assertEqual(None, self.cache.get('abc', None, JSON))
+
+    def test_invalidation(self):
+        self.cache.size = 10
+        self._put('abc', user_id='joeuser', tenant_ids=['1234'])
+        self._put('def', user_id='admin', tenant_ids=['5678'])
+        self._put('ghi', user_id='admin', tenant_ids=[])
+        self.cache.invalidate_token('abc')
+        self.assertEqual(None, self.cache.get('abc', None, JSON))
+        self.cache.invalidate_tenant('5678')
+        self.assertEqual(None, self.cache.get('def', None, JSON))
+        self.assertTrue(self.cache.get('ghi', None, JSON))
+        self.cache.invalidate_user('admin')
+        self.assertEqual(None, self.cache.get('ghi', None, JSON))
+
+    def test_invalidation_repeated_when_unit_of_work_ends(self):
+        sessions.begin()
+        try:
+            self.cache.invalidate_token('abc')
+            # A validation that read the token before the change commits
+            self._put('abc')
+            self.assertTrue(self.cache.get('abc', None, JSON))
+        finally:
+            sessions.end()
+        self.assertEqual(None, self.cache.get('abc', None, JSON))
+
+
+class ServiceValidationCacheTest(base.SQLBackendTest):
+
+    def setUp(self):
+        super(ServiceValidationCacheTest, self).setUp()
+        self.service = IdentityService()
+        self.service.configure({'validation_cache_ttl': '60'})
+
+        expires = datetime.now() + timedelta(days=1)
+        self.fixture_create('Tenant', id='1234', enabled=True)
+        self.fixture_create('Role', id='Admin')
+        self.fixture_create('Role', id='Member')
+        self.fixture_create('User', id='admin', password='secrete',
+                            enabled=True)
+        ref = models.UserRoleAssociation()
+        ref.user_id, ref.role_id = 'admin', 'Admin'
+        api.user.user_role_add(ref)
+        self.fixture_create('Token', id='admin-token', user_id='admin',
+                            expires=expires)
+        self.fixture_create('User', id='joeuser', password='secrete',
+                            enabled=True, tenant_id='1234')
+        self.fixture_create('Token', id='joe-token', user_id='joeuser',
+                            tenant_id='1234', expires=expires)
+
+    def _validate(self, content_type=JSON, belongs_to=None):
+        return self.service.get_validation('admin-token', 'joe-token',
+                                           belongs_to, content_type)
+
+    def _roles(self):
+        user = json.loads(self._validate())['auth']['user']
+        return [role['roleId'] for role in user['roleRefs']]
+
+    def test_cached_answer_matches_validate_token(self):
+        data = self.service.validate_token('admin-token', 'joe-token')
+        self.assertEqual(data.to_json(), self._validate())
+        self.assertEqual(data.to_xml(), self._validate(XML))
+        self.assertEqual(data.to_json(), self._validate())
+
+    def test_cache_hit_skips_token_lookup(self):
+        self._validate()
+        self.reset_statements()
+        self._validate()
+        cached = len(self.statements())
+        self.service.validations.clear()
+        self.reset_statements()
+        self._validate()
+        self.assertTrue(cached < len(self.statements()))
+
+    def test_faults_are_not_cached(self):
+        self.assertRaises(fault.UnauthorizedFault, self._validate,
+                          belongs_to='5678')
+        self.assertEqual(0, len(self.service.validations.entries))
+
+    def test_revoke_token(self):
+        self._validate()
+        self.service.revoke_token('admin-token', 'joe-token')
+        self.assertRaises(fault.UnauthorizedFault, self._validate)
+
+    def test_role_grants(self):
+        self.assertEqual([], self._roles())
+        role_ref = self.service.create_role_ref(
+            'admin-token', 'joeuser', RoleRef(None, 'Member', '1234'))
+        self.assertEqual(['Member'], self._roles())
+        self.service.delete_role_ref('admin-token', role_ref.role_ref_id)
+        self.assertEqual([], self._roles())
+
+    def test_disabled_user(self):
+        self._validate()
+        self.service.enable_disable_user(
+            'admin-token', 'joeuser', User(None, 'joeuser', None, None,
+                                           False))
+        self.assertRaises(fault.UserDisabledFault, self._validate)
+
+    def test_disabled_tenant(self):
+        self._validate()
+        self.service.update_tenant('admin-token', '1234',
+                                   Tenant('1234', None, False))
+        self.assertRaises(fault.TenantDisabledFault, self._validate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -122,6 +122,18 @@ def send_result(code, req, result):
     return resp
 
 
+def send_content(code, content_type, content):
+    """Return a response carrying already serialized UTF-8 content"""
+    resp = Response()
+    resp.status = code
+    resp.headers['content-type'] = content_type
+    resp.content_type_params = {'charset': 'UTF-8'}
+    if isinstance(content, unicode):
+        content = content.encode('UTF-8')
+    resp.body = content
+    return resp
+
+
 def send_legacy_result(code, headers):
     resp = Response()
     if 'content-type' not in headers:
@@ -61,6 +61,8 @@ setup(
             'remoteauth=keystone.middleware.remoteauth:remoteauth_factory',
             'tokenauth=keystone.middleware.auth_token:filter_factory',
             'swiftauth=keystone.middleware.swift_auth:filter_factory',
+            'profiler=keystone.middleware.profiler:filter_factory',
+            'unitofwork=keystone.middleware.unit_of_work:filter_factory',
             ],
         },
     )
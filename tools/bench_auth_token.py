@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Throughput benchmark of the auth_token middleware
+
+Sends --requests requests through keystone.middleware.auth_token, at most
+--concurrency at a time, to a WSGI app that checks every request arrives
+with the identity of the token it presented. Tokens are either signed
+(verified locally) or opaque ones whose claims are already in the
+middleware's cache, so Keystone is not needed.
+
+Usage:
+    python tools/bench_auth_token.py [--requests 20000] [--concurrency 1000]
+        [--tokens signed|cached] [--users 1000]
+"""
+
+from datetime import datetime, timedelta
+import optparse
+import os
+import sys
+import time
+
+import eventlet
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'keystone', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from keystone.common import signing
+from keystone.middleware import auth_token
+
+KEY = 'bench'
+MISMATCHES = [0]
+
+
+def app(env, start_response):
+    # Give the other requests in flight a chance to run
+    eventlet.sleep(0)
+    if env['HTTP_X_USER'] != env['HTTP_X_AUTH_TOKEN_USER']:
+        MISMATCHES[0] += 1
+    start_response('200 OK', [])
+    return ['']
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def make_tokens(middleware, kind, users):
+    expires = datetime.now() + timedelta(hours=1)
+    tokens = []
+    for i in range(users):
+        user = 'user%s' % i
+        if kind == 'signed':
+            token_id = signing.sign(KEY, user, 'tenant', ['Member'], expires)
+        else:
+            token_id = 'token%s' % i
+            middleware._cache_claims(
+                token_id, {'auth': {'token': {'id': token_id}}},
+                {'user': user, 'tenant': 'tenant', 'roles': ['Member']})
+        tokens.append((token_id, user))
+    return tokens
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--requests', type='int', default=20000)
+    parser.add_option('--concurrency', type='int', default=1000)
+    parser.add_option('--tokens', default='signed',
+                      help="'signed' or 'cached'")
+    parser.add_option('--users', type='int', default=1000,
+                      help="distinct tokens the requests cycle through")
+    options, _args = parser.parse_args()
+
+    middleware = auth_token.AuthProtocol(app, {'service_port': '8100',
+                                               'auth_host': '127.0.0.1',
+                                               'auth_port': '5001',
+                                               'service_pass': 'bench',
+                                               'signing_key': KEY,
+                                               'cache_ttl': '3600'})
+    tokens = make_tokens(middleware, options.tokens, options.users)
+
+    def call(i):
+        token_id, user = tokens[i % len(tokens)]
+        middleware({'REQUEST_METHOD': 'GET',
+                    'PATH_INFO': '/',
+                    'HTTP_X_AUTH_TOKEN': token_id,
+                    'HTTP_X_AUTH_TOKEN_USER': user}, start_response)
+
+    pool = eventlet.GreenPool(options.concurrency)
+    start = time.time()
+    for _result in pool.imap(call, xrange(options.requests)):
+        pass
+    elapsed = time.time() - start
+
+    print "%s requests with %s tokens, %s in flight: %.0f requests/s" % (
+        options.requests, options.tokens, options.concurrency,
+        options.requests / elapsed)
+    print "Requests that saw another request's identity: %s" % MISMATCHES[0]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of legacy (v1.0) logins
+
+Times logins through keystone.frontends.legacy_token_auth in front of the
+service API, against an in-memory database holding one user with
+--services endpoints. The implementation it replaced, which re-issued each
+login as a v2.0 request through the service API and parsed the JSON answer,
+is timed alongside for comparison.
+
+Usage:
+    python tools/bench_legacy_auth.py [--logins 5000] [--services 5]
+"""
+
+import ast
+import json
+import optparse
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'keystone', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from webob import Request
+
+from keystone.backends import models
+import keystone.backends.sqlalchemy as sql_backend
+from keystone.common import sessions
+from keystone.frontends import legacy_token_auth
+from keystone.routers.service import ServiceApi
+from keystone import utils
+
+ENTITIES = ("['UserGroupAssociation', 'UserRoleAssociation', 'Endpoints', "
+            "'Role', 'Tenant', 'User', 'Group', 'Credentials', "
+            "'EndpointTemplates', 'Token']")
+MAPPINGS = ("{'nova': 'X-Server-Management-Url', 'swift': 'X-Storage-Url', "
+            "'cdn': 'X-CDN-Management-Url'}")
+
+
+class LegacyRoundTrip(object):
+    """legacy_token_auth.AuthProtocol as it was: a v2.0 round trip"""
+
+    def __init__(self, app, conf):
+        self.app = app
+        self.conf = conf
+
+    def __call__(self, env, start_response):
+        request = Request(env)
+        params = {"passwordCredentials":
+            {"username": utils.get_auth_user(request),
+             "password": utils.get_auth_key(request)}}
+        new_request = Request.blank('/v2.0/tokens')
+        new_request.method = 'POST'
+        new_request.headers['Content-type'] = 'application/json'
+        new_request.accept = 'text/json'
+        new_request.body = json.dumps(params)
+        response = new_request.get_response(self.app)
+        if not str(response.status).startswith('20'):
+            return response(env, start_response)
+        headers = self._transform_headers(json.loads(response.body))
+        return utils.send_legacy_result(204, headers)(env, start_response)
+
+    def _transform_headers(self, content):
+        headers = {}
+        auth = content["auth"]
+        headers["X-Auth-Token"] = auth["token"]["id"]
+        services = auth.get("serviceCatalog", {})
+        service_mappings = ast.literal_eval(
+            self.conf["service-header-mappings"])
+        for service_name in services:
+            service_urls = ','.join(endpoint["publicURL"]
+                                    for endpoint in services[service_name])
+            if service_urls:
+                header = service_mappings.get(service_name) or \
+                    'X-' + service_name.upper()
+                headers[header] = service_urls
+        return headers
+
+
+def populate(services):
+    sessions.begin()
+    for model, values in [('Tenant', {'id': '1234', 'enabled': True}),
+                          ('User', {'id': 'joeuser', 'tenant_id': '1234',
+                                    'enabled': True,
+                                    'password':
+                                        utils.get_hashed_password('secrete')})]:
+        obj = getattr(models, model)()
+        obj.update(values)
+        obj.save()
+    names = ['nova', 'swift', 'cdn', 'glance', 'quantum', 'dash']
+    for i in range(services):
+        template = models.EndpointTemplates()
+        template.update({'id': i + 1, 'service': names[i % len(names)],
+                         'public_url': 'http://service%s/%%tenant_id%%' % i,
+                         'enabled': True, 'is_global': False})
+        template.save()
+        endpoint = models.Endpoints()
+        endpoint.update({'tenant_id': '1234',
+                         'endpoint_template_id': i + 1})
+        endpoint.save()
+    sessions.end(commit=True)
+
+
+def measure(name, app, logins):
+    request = Request.blank('/v1.0', headers={'X-Auth-User': 'joeuser',
+                                              'X-Auth-Key': 'secrete'})
+    if request.get_response(app).status_int != 204:
+        raise SystemExit("%s: login failed" % name)
+    start = time.time()
+    for _i in xrange(logins):
+        request.get_response(app)
+    elapsed = time.time() - start
+    print "%-28s %8.0f logins/s %8.3f ms/login" % (
+        name, logins / elapsed, elapsed * 1000 / logins)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--logins', type='int', default=5000)
+    parser.add_option('--services', type='int', default=5,
+                      help="endpoints in the user's service catalog")
+    parser.add_option('--connection', default='sqlite://')
+    options, _args = parser.parse_args()
+
+    conf = {'backends': 'keystone.backends.sqlalchemy',
+            'keystone-admin-role': 'Admin',
+            'keystone-service-admin-role': 'KeystoneServiceAdmin',
+            'service-header-mappings': MAPPINGS,
+            'keystone.backends.sqlalchemy': {
+                'sql_connection': options.connection,
+                'backend_entities': ENTITIES}}
+    service_api = ServiceApi(conf)
+    sql_backend.unregister_models()
+    sql_backend.register_models({'backend_entities': ENTITIES})
+    populate(options.services)
+
+    measure('legacy round trip', LegacyRoundTrip(service_api, conf),
+            options.logins)
+    measure('direct dispatch',
+            legacy_token_auth.AuthProtocol(service_api, conf),
+            options.logins)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of tenant teardown in the SQL backend
+
+Fills a database with one tenant of --users users in --groups groups, then
+times removing users from the tenant (UserAPI.delete_tenant_user) and
+checking whether the tenant is empty (TenantAPI.is_empty). The row by row
+implementations these replaced are timed alongside for comparison.
+
+Usage:
+    python tools/bench_tenant_teardown.py [--users 10000] [--groups 500]
+        [--memberships 3] [--sample 50] [--connection sqlite://]
+"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'keystone', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from sqlalchemy import event
+
+import keystone.backends as backends
+from keystone.backends import api
+import keystone.backends.sqlalchemy as sql_backend
+from keystone.backends.sqlalchemy import models
+
+TENANT = 'bench'
+ENTITIES = ("['UserGroupAssociation', 'UserRoleAssociation', 'Endpoints', "
+            "'Role', 'Tenant', 'User', 'Group', 'Credentials', "
+            "'EndpointTemplates', 'Token']")
+
+STATEMENTS = [0]
+
+
+def _count_statement(conn, cursor, statement, *args):
+    STATEMENTS[0] += 1
+
+
+def legacy_delete_tenant_user(user_id, tenant_id):
+    """UserAPI.delete_tenant_user as it was: one query per group.
+
+    The memberships are deleted before the user here; the other way round,
+    as it was, fails for users that belong to groups.
+    """
+    session = sql_backend.get_session()
+    with session.begin(subtransactions=True):
+        for group in session.query(models.Group).filter_by(
+                tenant_id=tenant_id):
+            for membership in session.query(
+                    models.UserGroupAssociation).filter_by(
+                        user_id=user_id, group_id=group.id).all():
+                session.delete(membership)
+        session.flush()
+        for user in session.query(models.User).filter_by(id=user_id,
+                                                        tenant_id=tenant_id):
+            session.delete(user)
+
+
+def legacy_is_empty(tenant_id):
+    """TenantAPI.is_empty as it was: three queries"""
+    session = sql_backend.get_session()
+    for model in (models.UserRoleAssociation, models.Group, models.User):
+        if session.query(model).filter_by(tenant_id=tenant_id).first():
+            return False
+    return True
+
+
+def populate(users, groups, memberships):
+    engine = sql_backend._ENGINE
+    engine.execute(models.Tenant.__table__.insert(),
+                   [{'id': TENANT, 'enabled': 1}])
+    engine.execute(models.Role.__table__.insert(), [{'id': 'Member'}])
+    engine.execute(models.Group.__table__.insert(),
+                   [{'id': 'group%s' % i, 'tenant_id': TENANT}
+                    for i in range(groups)])
+    engine.execute(models.User.__table__.insert(),
+                   [{'id': 'user%s' % i, 'tenant_id': TENANT, 'enabled': 1}
+                    for i in range(users)])
+    engine.execute(models.UserRoleAssociation.__table__.insert(),
+                   [{'user_id': 'user%s' % i, 'role_id': 'Member',
+                     'tenant_id': TENANT} for i in range(users)])
+    rows = []
+    for i in range(users):
+        for group in random.sample(range(groups), memberships):
+            rows.append({'user_id': 'user%s' % i,
+                         'group_id': 'group%s' % group})
+    engine.execute(models.UserGroupAssociation.__table__.insert(), rows)
+
+
+def measure(name, function, arguments):
+    STATEMENTS[0] = 0
+    start = time.time()
+    for args in arguments:
+        function(*args)
+    elapsed = time.time() - start
+    count = len(arguments)
+    print "%-32s %8.2f ms/call %8.1f statements/call" % (
+        name, elapsed * 1000 / count, float(STATEMENTS[0]) / count)
+    return elapsed / count
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--users', type='int', default=10000)
+    parser.add_option('--groups', type='int', default=500)
+    parser.add_option('--memberships', type='int', default=3,
+                      help="groups each user belongs to")
+    parser.add_option('--sample', type='int', default=50,
+                      help="users removed with each implementation")
+    parser.add_option('--connection', default='sqlite://')
+    options, _args = parser.parse_args()
+
+    backends.configure_backends({
+        'backends': 'keystone.backends.sqlalchemy',
+        'keystone-admin-role': 'Admin',
+        'keystone.backends.sqlalchemy': {
+            'sql_connection': options.connection,
+            'backend_entities': ENTITIES}})
+    sql_backend.unregister_models()
+    sql_backend.register_models({'backend_entities': ENTITIES})
+
+    start = time.time()
+    populate(options.users, options.groups, options.memberships)
+    print "Populated %s users in %s groups in %.1f s" % (
+        options.users, options.groups, time.time() - start)
+    event.listen(sql_backend._ENGINE, 'before_cursor_execute',
+                 _count_statement)
+
+    user_ids = ['user%s' % i for i in range(options.users)]
+    random.shuffle(user_ids)
+    sample = options.sample
+    legacy = measure('legacy delete_tenant_user', legacy_delete_tenant_user,
+                     [(user_id, TENANT) for user_id in user_ids[:sample]])
+    current = measure('delete_tenant_user', api.user.delete_tenant_user,
+                      [(user_id, TENANT)
+                       for user_id in user_ids[sample:2 * sample]])
+    print "Removing all %s users: %.1f s before, %.1f s now" % (
+        options.users, legacy * options.users, current * options.users)
+
+    measure('legacy is_empty', legacy_is_empty, [(TENANT,)] * 100)
+    measure('is_empty', api.tenant.is_empty, [(TENANT,)] * 100)
+    measure('legacy is_empty (no rows)', legacy_is_empty, [('none',)] * 100)
+    measure('is_empty (no rows)', api.tenant.is_empty, [('none',)] * 100)
+
+
+if __name__ == '__main__':
+    main()